@@ -1,7 +1,14 @@
 from abc import ABC, abstractmethod
 import queue
 import redis
+import redis.asyncio as aioredis
+import asyncio
 import os
+import time
+import socket
+import threading
+import select
+import sqlite3
 
 class IQueue:
     def __init__(self, maxsize, env):
@@ -24,6 +31,14 @@ class IQueue:
     def pop(self):
         pass
 
+    @abstractmethod
+    def pend(self, timeout=5):
+        pass
+
+    @abstractmethod
+    def ack(self, job_id):
+        pass
+
     @abstractmethod
     def hasFront(self):
         pass
@@ -64,11 +79,104 @@ class GlobalQueue(IQueue):
         return self._queue.qsize()
 
 
+# Lease scripts. Deadlines use the redis server clock so consumers on
+# different hosts agree on expiry.
+
+# a pended job not leased after this long is taken for an orphan (its
+# consumer died between BRPOPLPUSH and the grant); far above the time a live
+# consumer needs for that step
+ORPHAN_GRACE_SEC = 30
+
+# KEYS: processing, leases, deadlines, pending   ARGV: job_id, owner, lease_sec
+GRANT_LUA = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    -- reclaimed by a reaper since the move, it is queued again
+    return 0
+end
+redis.call('HDEL', KEYS[4], ARGV[1])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1e6
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[3], now + tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+# KEYS: leases, deadlines   ARGV: job_id, owner
+ACK_LUA = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return 1
+"""
+
+# KEYS: leases, deadlines   ARGV: job_id, owner, lease_sec
+EXTEND_LUA = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1e6
+redis.call('ZADD', KEYS[2], 'XX', now + tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+# KEYS: queued, processing, leases, deadlines, pending, stats, enqueued
+# ARGV: orphan grace seconds
+REAP_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1e6
+local out = {}
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', now)) do
+    redis.call('ZREM', KEYS[4], id)
+    redis.call('HDEL', KEYS[3], id)
+    table.insert(out, id)
+end
+-- pended but never leased (consumer died between BRPOPLPUSH and grant):
+-- reclaim entries first seen in processing more than the grace period ago
+local first = {}
+local flat = redis.call('HGETALL', KEYS[5])
+for i = 1, #flat, 2 do
+    first[flat[i]] = tonumber(flat[i + 1])
+end
+redis.call('DEL', KEYS[5])
+for _, id in ipairs(redis.call('LRANGE', KEYS[2], 0, -1)) do
+    local since = first[id] or now
+    if now - since > tonumber(ARGV[1]) then
+        redis.call('LREM', KEYS[2], 1, id)
+        table.insert(out, id)
+    else
+        redis.call('HSET', KEYS[5], id, since)
+    end
+end
+for _, id in ipairs(out) do
+    -- right end is the front of the line, retry these first
+    redis.call('RPUSH', KEYS[1], id)
+    redis.call('HSET', KEYS[7], id, now)
+end
+if #out > 0 then
+    redis.call('HINCRBY', KEYS[6], 'reclaimed', #out)
+end
+return out
+"""
+
 class RedisQueue(IQueue):
+    """
+    List-backed queue with per-job leases.
+
+    queued      list, pushed left, pended from the right (FIFO)
+    processing  list, landing spot of BRPOPLPUSH until the lease is granted
+    pending     hash job_id -> when the reaper first saw it in processing
+    leases      hash job_id -> owner
+    deadlines   zset job_id -> lease expiry (redis server time)
+    """
     def __init__(self,
                  name,
                  redis_url,
-                 maxsize = 1024
+                 maxsize = 1024,
+                 lease = 120,
+                 owner = None
                  ):
         self.name = name
         self.redis_url = redis_url
@@ -76,7 +184,15 @@ class RedisQueue(IQueue):
         self.queued_key = f"{name}:queued"
         self.processing_key = f"{name}:processing"
         self.notify_channel = f"{name}:notify"
+        self.enqueued_key = f"{name}:enqueued"   # job_id -> push time
+        self.leases_key = f"{name}:leases"
+        self.deadlines_key = f"{name}:deadlines"
+        self.pending_key = f"{name}:pending"
+        self.stats_key = f"{name}:stats"
         self.maxsize = maxsize
+        self.lease = lease
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.reclaimed = 0   # jobs this client's reap() put back
         self.init()
 
     def init(self):
@@ -97,6 +213,10 @@ class RedisQueue(IQueue):
         except Exception as e:
             print(f"REDIS: ERROR: {e}")
             raise
+        self._grant = self.redis.register_script(GRANT_LUA)
+        self._ack = self.redis.register_script(ACK_LUA)
+        self._extend = self.redis.register_script(EXTEND_LUA)
+        self._reap = self.redis.register_script(REAP_LUA)
 
     def full(self):
         return self.size() >= self.maxsize
@@ -121,27 +241,32 @@ class RedisQueue(IQueue):
             return False
         
         try:
-            # Add to right of queued list (FIFO)
-            self.redis.rpush(self.queued_key, job_id)
+            # Add to left of queued list, pend() takes from the right (FIFO)
+            pipe = self.redis.pipeline()
+            pipe.lpush(self.queued_key, job_id)
+            pipe.hset(self.enqueued_key, job_id, time.time())
             
             # Optional: notify subscribers
-            self.redis.publish(self.notify_channel, job_id)
+            pipe.publish(self.notify_channel, job_id)
+            pipe.execute()
             
             return True
         except redis.ConnectionError as e:
             print(f"[RedisQueue] Connection error in push(): {e}")
             return False
     
-    def pend(self, timeout=5):
+    def pend(self, timeout=5, lease=None):
         """
-        Move job from queued to processing (atomic operation)
-        This marks the job as being worked on.
+        Move job from queued to processing and lease it to self.owner.
+        The job must be ack()ed before the lease runs out, or the reaper
+        puts it back in the queue.
         
         Args:
             timeout: Seconds to wait for a job (blocking)
+            lease: Lease length in seconds (default self.lease)
         
         Returns:
-            job_id (int) or None if timeout
+            job_id (int) or None if timeout (or a reaper took the job back)
         """
         try:
             # Atomically move from queued to processing
@@ -152,27 +277,124 @@ class RedisQueue(IQueue):
                 timeout=timeout
             )
             
-            if result:
-                return int(result)
-            return None
+            if not result:
+                return None
+            job_id = int(result)
+            if not self._grant(
+                keys=[self.processing_key, self.leases_key, self.deadlines_key, self.pending_key],
+                args=[job_id, self.owner, lease or self.lease]
+            ):
+                return None
+            return job_id
             
         except redis.ConnectionError as e:
             print(f"[RedisQueue] Connection error in pend(): {e}")
+            # don't spin on a dead server
+            time.sleep(min(timeout, 1))
             return None
         except ValueError as e:
             print(f"[RedisQueue] Invalid job_id in pend(): {e}")
             return None
+
+    def ack(self, job_id: int):
+        """
+        Mark job_id done and drop its lease. Only the lease owner can ack.
+        
+        Returns:
+            True if the lease was ours, False if it expired and was reclaimed
+        """
+        try:
+            return bool(self._ack(
+                keys=[self.leases_key, self.deadlines_key],
+                args=[job_id, self.owner]
+            ))
+        except redis.ConnectionError as e:
+            print(f"[RedisQueue] Connection error in ack(): {e}")
+            return False
+
+    def extend(self, job_id: int, lease=None):
+        """Push out the deadline of a lease we own (heartbeat)"""
+        try:
+            return bool(self._extend(
+                keys=[self.leases_key, self.deadlines_key],
+                args=[job_id, self.owner, lease or self.lease]
+            ))
+        except redis.ConnectionError:
+            return False
+
+    def reap(self):
+        """
+        Re-queue jobs whose lease expired (at the front of the line)
+        
+        Returns:
+            list of reclaimed job_ids
+        """
+        try:
+            ids = self._reap(keys=[
+                self.queued_key,
+                self.processing_key,
+                self.leases_key,
+                self.deadlines_key,
+                self.pending_key,
+                self.stats_key,
+                self.enqueued_key
+            ], args=[ORPHAN_GRACE_SEC])
+        except redis.ConnectionError as e:
+            print(f"[RedisQueue] Connection error in reap(): {e}")
+            return []
+        ids = [int(i) for i in ids]
+        if ids:
+            self.reclaimed += len(ids)
+            print(f"[RedisQueue] Reclaimed {len(ids)} expired jobs: {ids}")
+        return ids
+
+    def stats(self):
+        """Counters shared by every client of this queue"""
+        try:
+            shared = self.redis.hgetall(self.stats_key)
+        except redis.ConnectionError:
+            shared = {}
+        return {
+            'reclaimed': int(shared.get('reclaimed', 0)),
+            'reclaimed_here': self.reclaimed,
+            'queued': self.queued_size(),
+            'processing': self.processing_size()
+        }
+    
+    def queue_wait(self, job_id: int):
+        """
+        Seconds job_id spent queued, call once after pend()
+        
+        Returns:
+            float or None if the push time is unknown
+        """
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hget(self.enqueued_key, job_id)
+            pipe.hdel(self.enqueued_key, job_id)
+            ts, _ = pipe.execute()
+            if ts is None:
+                return None
+            return max(0.0, time.time() - float(ts))
+        except (redis.ConnectionError, ValueError):
+            return None
     
-    def pop(self, timeout=5):
+    def pop(self, job_id=None, timeout=5):
         """
-        Remove job from processing queue (job is complete)
+        Remove job from processing (job is complete)
+        Prefer ack(job_id); without a job_id this removes whichever job is
+        at the tail of the processing list.
         
         Args:
+            job_id: Job to acknowledge
             timeout: Seconds to wait for a job (blocking)
         
         Returns:
             job_id (int) or None if timeout/empty
         """
+        if job_id is not None:
+            return job_id if self.ack(job_id) else None
+
         if self.redis.llen(self.processing_key) == 0:
             return None
         
@@ -210,15 +432,9 @@ class RedisQueue(IQueue):
         Total size = queued + processing
         
         Returns:
-            Total number of jobs in both lists
+            Total number of jobs queued or leased
         """
-        try:
-            queued = self.redis.llen(self.queued_key)
-            processing = self.redis.llen(self.processing_key)
-            return queued + processing
-        except redis.ConnectionError:
-            print("[RedisQueue] Connection error in size()")
-            return 0
+        return self.queued_size() + self.processing_size()
     
     def queued_size(self):
         """Get size of queued list only"""
@@ -228,17 +444,26 @@ class RedisQueue(IQueue):
             return 0
     
     def processing_size(self):
-        """Get size of processing list only"""
+        """Jobs handed to a consumer: leased plus not yet leased"""
         try:
-            return self.redis.llen(self.processing_key)
+            pipe = self.redis.pipeline()
+            pipe.zcard(self.deadlines_key)
+            pipe.llen(self.processing_key)
+            return sum(pipe.execute())
         except redis.ConnectionError:
             return 0
     
     def clear(self):
-        """Clear both queued and processing lists (use with caution!)"""
+        """Clear queued, processing and lease state (use with caution!)"""
         try:
-            self.redis.delete(self.queued_key)
-            self.redis.delete(self.processing_key)
+            self.redis.delete(
+                self.queued_key,
+                self.processing_key,
+                self.enqueued_key,
+                self.leases_key,
+                self.deadlines_key,
+                self.pending_key
+            )
             print("[RedisQueue] Queue cleared")
         except redis.ConnectionError:
             print("[RedisQueue] Connection error in clear()")
@@ -254,8 +479,11 @@ class RedisQueue(IQueue):
             return None
     
     def peek_processing(self):
-        """Look at first processing job without removing it"""
+        """Look at the leased job closest to expiry without removing it"""
         try:
+            result = self.redis.zrange(self.deadlines_key, 0, 0)
+            if result:
+                return int(result[0])
             result = self.redis.lindex(self.processing_key, -1)
             if result:
                 return int(result)
@@ -266,7 +494,8 @@ class RedisQueue(IQueue):
     def requeue_processing(self):
         """
         Move all processing jobs back to queued (recovery operation)
-        Use this if JobManager crashes and you want to retry jobs
+        Use this if every JobManager is down and you want to retry jobs
+        now instead of waiting for their leases to expire
         
         Returns:
             Number of jobs moved
@@ -278,6 +507,14 @@ class RedisQueue(IQueue):
                 if not result:
                     break
                 count += 1
+
+            leased = self.redis.zrange(self.deadlines_key, 0, -1)
+            if leased:
+                pipe = self.redis.pipeline()
+                pipe.delete(self.leases_key, self.deadlines_key)
+                pipe.rpush(self.queued_key, *leased)
+                pipe.execute()
+                count += len(leased)
             
             if count > 0:
                 print(f"[RedisQueue] Requeued {count} processing jobs")
@@ -286,3 +523,797 @@ class RedisQueue(IQueue):
         except redis.ConnectionError:
             print("[RedisQueue] Connection error in requeue_processing()")
             return 0
+
+
+class StreamQueue(IQueue):
+    """
+    Redis Streams queue with a consumer group, so several JobManagers (one
+    consumer each, on any host) share one queue.
+
+    stream   {name}:stream, one entry per job {job_id}
+    group    every consumer reads new entries with XREADGROUP '>'; an entry
+             stays in its consumer's pending list until ack()
+    claims   entries left pending longer than the lease (dead or hung
+             consumer) are taken over with XAUTOCLAIM in pend()
+    trimming ack() XDELs the entry, so the stream only ever holds live jobs
+    """
+    def __init__(self,
+                 name,
+                 redis_url,
+                 maxsize = 1024,
+                 lease = 120,
+                 owner = None,
+                 group = "workers",
+                 claim_interval = 5
+                 ):
+        self.name = name
+        self.redis_url = redis_url
+        self.redis = None
+        self.stream_key = f"{name}:stream"
+        self.stats_key = f"{name}:stats"
+        self.group = group
+        self.maxsize = maxsize
+        self.lease = lease
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.claim_interval = claim_interval
+        self.reclaimed = 0
+        self._entries = {}   # job_id -> stream entry id, for jobs we hold
+        self._last_claim = 0
+        self.init()
+
+    def init(self):
+        try:
+            self.redis = redis.from_url(
+                self.redis_url,
+                decode_responses=True,
+                socket_connect_timeout=5,
+                socket_keepalive=True
+            )
+            self.redis.ping()
+            print(f"REDIS: connected to redis: {self.redis_url}")
+        except redis.ConnectionError as e:
+            print(f"REDIS: ERROR: cannot connect to redis")
+            raise
+        self._create_group()
+
+    def _create_group(self):
+        try:
+            self.redis.xgroup_create(self.stream_key, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def full(self):
+        return self.size() >= self.maxsize
+
+    def empty(self):
+        return self.queued_size() == 0
+
+    def push(self, job_id: int):
+        """
+        Append job to the stream
+        
+        Returns:
+            True if added, False if queue is full
+        """
+        if self.full():
+            print(f"[StreamQueue] Queue full, cannot push job {job_id}")
+            return False
+        try:
+            self.redis.xadd(self.stream_key, {'job_id': job_id})
+            return True
+        except redis.ConnectionError as e:
+            print(f"[StreamQueue] Connection error in push(): {e}")
+            return False
+
+    def _claim(self, lease):
+        """Take over one entry some consumer has held longer than the lease"""
+        _, entries, *_ = self.redis.xautoclaim(
+            self.stream_key,
+            self.group,
+            self.owner,
+            min_idle_time=int(lease * 1000),
+            start_id="0-0",
+            count=1
+        )
+        if not entries:
+            return None
+        self.redis.hincrby(self.stats_key, 'reclaimed', 1)
+        self.reclaimed += 1
+        print(f"[StreamQueue] Reclaimed idle entry {entries[0][0]}")
+        return entries[0]
+
+    def pend(self, timeout=5, lease=None):
+        """
+        Read the next job for this consumer (blocking).
+        Expired entries of other consumers are claimed first.
+        
+        Returns:
+            job_id (int) or None if timeout
+        """
+        lease = lease or self.lease
+        try:
+            entry = None
+            now = time.monotonic()
+            if now - self._last_claim >= self.claim_interval:
+                self._last_claim = now
+                entry = self._claim(lease)
+
+            if entry is None:
+                res = self.redis.xreadgroup(
+                    self.group,
+                    self.owner,
+                    {self.stream_key: '>'},
+                    count=1,
+                    block=int(timeout * 1000)
+                )
+                if not res:
+                    return None
+                entry = res[0][1][0]
+
+            entry_id, fields = entry
+            try:
+                job_id = int(fields['job_id'])
+            except (TypeError, KeyError, ValueError) as e:
+                # fields are None for an entry deleted while pending; either
+                # way it would be delivered or claimed again forever
+                print(f"[StreamQueue] Dropping entry {entry_id} without a valid job_id: {e!r}")
+                self._drop(entry_id)
+                return None
+            self._entries[job_id] = entry_id
+            return job_id
+
+        except redis.ConnectionError as e:
+            print(f"[StreamQueue] Connection error in pend(): {e}")
+            time.sleep(min(timeout, 1))
+            return None
+        except redis.ResponseError as e:
+            # stream or group deleted under us (clear())
+            print(f"[StreamQueue] Error in pend(): {e}")
+            self._create_group()
+            return None
+
+    def _drop(self, entry_id) -> bool:  # throws
+        """XACK and XDEL an entry; True if it was still pending"""
+        pipe = self.redis.pipeline()
+        pipe.xack(self.stream_key, self.group, entry_id)
+        pipe.xdel(self.stream_key, entry_id)
+        acked, _ = pipe.execute()
+        return acked == 1
+
+    def ack(self, job_id: int):
+        """
+        Mark job_id done and delete its entry
+        
+        Returns:
+            True if the entry was still pending on this consumer group
+        """
+        entry_id = self._entries.pop(job_id, None)
+        if entry_id is None:
+            return False
+        try:
+            return self._drop(entry_id)
+        except redis.ConnectionError as e:
+            print(f"[StreamQueue] Connection error in ack(): {e}")
+            return False
+
+    def extend(self, job_id: int, lease=None):
+        """Reset the idle time of an entry we hold (heartbeat)"""
+        entry_id = self._entries.get(job_id)
+        if entry_id is None:
+            return False
+        try:
+            return bool(self.redis.xclaim(
+                self.stream_key, self.group, self.owner,
+                min_idle_time=0, message_ids=[entry_id], justid=True
+            ))
+        except redis.ConnectionError:
+            return False
+
+    def reap(self):
+        """Nothing to do: idle entries are claimed by the next pend()"""
+        return []
+
+    def stats(self):
+        try:
+            shared = self.redis.hgetall(self.stats_key)
+        except redis.ConnectionError:
+            shared = {}
+        return {
+            'reclaimed': int(shared.get('reclaimed', 0)),
+            'reclaimed_here': self.reclaimed,
+            'queued': self.queued_size(),
+            'processing': self.processing_size()
+        }
+
+    def queue_wait(self, job_id: int):
+        """Seconds job_id spent queued, from the XADD time in its entry id"""
+        entry_id = self._entries.get(job_id)
+        if entry_id is None:
+            return None
+        added_ms = int(entry_id.split('-')[0])
+        return max(0.0, time.time() - added_ms / 1000)
+
+    def pop(self, job_id=None, timeout=5):
+        """Same as ack(job_id)"""
+        if job_id is None:
+            return None
+        return job_id if self.ack(job_id) else None
+
+    def hasFront(self):
+        return self.queued_size() > 0
+
+    def size(self):
+        """Entries in the stream: queued + pending (acked ones are deleted)"""
+        try:
+            return self.redis.xlen(self.stream_key)
+        except redis.ConnectionError:
+            print("[StreamQueue] Connection error in size()")
+            return 0
+
+    def queued_size(self):
+        """Entries not yet delivered to any consumer"""
+        return max(0, self.size() - self.processing_size())
+
+    def processing_size(self):
+        """Entries delivered but not acked"""
+        try:
+            return self.redis.xpending(self.stream_key, self.group)['pending']
+        except (redis.ConnectionError, redis.ResponseError):
+            return 0
+
+    def clear(self):
+        """Drop the stream and its group (use with caution!)"""
+        try:
+            self.redis.delete(self.stream_key)
+            self._create_group()
+            self._entries.clear()
+            print("[StreamQueue] Queue cleared")
+        except redis.ConnectionError:
+            print("[StreamQueue] Connection error in clear()")
+
+
+class SqliteQueue(IQueue):
+    """
+    Durable single-host queue in a WAL-mode SQLite table, same semantics as
+    RedisQueue (FIFO, leases, ack by id, reap) for installs without redis.
+    Any number of processes can share one database file.
+
+    Blocking pend() waits on a FIFO next to the database instead of polling:
+    every consumer keeps it open and push() writes one byte to it, waking one
+    waiting consumer per job.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS queue (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        job_id INTEGER NOT NULL,
+        state TEXT NOT NULL DEFAULT 'queued',   -- queued | processing
+        retries INTEGER NOT NULL DEFAULT 0,
+        owner TEXT,
+        deadline REAL,
+        enqueued_at REAL NOT NULL,
+        UNIQUE (name, job_id)
+    );
+    CREATE INDEX IF NOT EXISTS queue_next ON queue (name, state, retries, seq);
+    CREATE TABLE IF NOT EXISTS queue_stats (
+        name TEXT PRIMARY KEY,
+        reclaimed INTEGER NOT NULL DEFAULT 0
+    );
+    """
+
+    def __init__(self,
+                 name,
+                 path = "data/queue.db",
+                 maxsize = 1024,
+                 lease = 120,
+                 owner = None
+                 ):
+        self.name = name
+        self.path = path
+        self.maxsize = maxsize
+        self.lease = lease
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.reclaimed = 0
+        self.wake_path = f"{path}.{name}.wake"
+        self._db = None
+        self._lock = threading.Lock()   # one connection shared by our threads
+        self._waits = {}   # job_id -> seconds queued, filled by pend()
+        self._wake_r = None
+        self._wake_w = None
+        self.init()
+
+    def init(self):
+        db_dir = os.path.dirname(self.path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # autocommit; writes take BEGIN IMMEDIATE themselves
+        self._db = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=wal")
+        self._db.execute("PRAGMA synchronous=normal")
+        self._db.executescript(self.SCHEMA)
+        try:
+            os.mkfifo(self.wake_path)
+        except FileExistsError:
+            pass
+        print(f"[SqliteQueue] opened {self.path} ({self.name})")
+
+    def _open_wake(self):
+        """Consumer side of the FIFO, opened on first pend()"""
+        if self._wake_r is None:
+            self._wake_r = os.open(self.wake_path, os.O_RDONLY | os.O_NONBLOCK)
+            # hold a writer too, or select() reports EOF whenever no producer
+            # has the FIFO open
+            self._wake_w = os.open(self.wake_path, os.O_WRONLY | os.O_NONBLOCK)
+
+    def _wake(self, n=1):
+        try:
+            fd = os.open(self.wake_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError:
+            return   # ENXIO: nobody is waiting
+        try:
+            os.write(fd, b"\0" * n)
+        except BlockingIOError:
+            pass     # FIFO full, consumers have plenty to wake for
+        finally:
+            os.close(fd)
+
+    def _one(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchone()[0]
+
+    def full(self):
+        return self.size() >= self.maxsize
+
+    def empty(self):
+        return self.queued_size() == 0
+
+    def push(self, job_id: int):
+        """
+        Add job to the queue
+        
+        Returns:
+            True if added, False if queue is full or job_id already queued
+        """
+        if self.full():
+            print(f"[SqliteQueue] Queue full, cannot push job {job_id}")
+            return False
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT INTO queue (name, job_id, enqueued_at) VALUES (?, ?, ?)",
+                    (self.name, job_id, time.time())
+                )
+        except sqlite3.IntegrityError:
+            print(f"[SqliteQueue] Job {job_id} already queued")
+            return False
+        except sqlite3.Error as e:
+            print(f"[SqliteQueue] Error in push(): {e}")
+            return False
+        self._wake()
+        return True
+
+    def _claim(self, lease):
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                row = cur.execute(
+                    "SELECT seq, job_id, enqueued_at FROM queue "
+                    "WHERE name = ? AND state = 'queued' "
+                    "ORDER BY retries DESC, seq LIMIT 1",
+                    (self.name,)
+                ).fetchone()
+                if row:
+                    now = time.time()
+                    cur.execute(
+                        "UPDATE queue SET state = 'processing', owner = ?, deadline = ? WHERE seq = ?",
+                        (self.owner, now + lease, row[0])
+                    )
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        self._waits[row[1]] = max(0.0, now - row[2])
+        return row[1]
+
+    def pend(self, timeout=5, lease=None):
+        """
+        Take the next job and lease it to self.owner (blocking)
+        
+        Returns:
+            job_id (int) or None if timeout
+        """
+        lease = lease or self.lease
+        self._open_wake()
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                job_id = self._claim(lease)
+                if job_id is not None:
+                    return job_id
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                ready, _, _ = select.select([self._wake_r], [], [], remaining)
+                if ready:
+                    try:
+                        os.read(self._wake_r, 1)
+                    except BlockingIOError:
+                        pass   # another consumer took the byte
+        except sqlite3.Error as e:
+            print(f"[SqliteQueue] Error in pend(): {e}")
+            return None
+
+    def ack(self, job_id: int):
+        """
+        Mark job_id done and drop it. Only the lease owner can ack.
+        
+        Returns:
+            True if the lease was ours, False if it expired and was reclaimed
+        """
+        try:
+            with self._lock:
+                cur = self._db.execute(
+                    "DELETE FROM queue WHERE name = ? AND job_id = ? AND state = 'processing' AND owner = ?",
+                    (self.name, job_id, self.owner)
+                )
+            return cur.rowcount == 1
+        except sqlite3.Error as e:
+            print(f"[SqliteQueue] Error in ack(): {e}")
+            return False
+
+    def extend(self, job_id: int, lease=None):
+        """Push out the deadline of a lease we own (heartbeat)"""
+        try:
+            with self._lock:
+                cur = self._db.execute(
+                    "UPDATE queue SET deadline = ? WHERE name = ? AND job_id = ? AND state = 'processing' AND owner = ?",
+                    (time.time() + (lease or self.lease), self.name, job_id, self.owner)
+                )
+            return cur.rowcount == 1
+        except sqlite3.Error:
+            return False
+
+    def reap(self):
+        """
+        Re-queue jobs whose lease expired (retried before fresh jobs)
+        
+        Returns:
+            list of reclaimed job_ids
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                cur = self._db.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                try:
+                    ids = [r[0] for r in cur.execute(
+                        "SELECT job_id FROM queue WHERE name = ? AND state = 'processing' AND deadline < ?",
+                        (self.name, now)
+                    )]
+                    if ids:
+                        cur.execute(
+                            "UPDATE queue SET state = 'queued', owner = NULL, deadline = NULL, "
+                            "retries = retries + 1, enqueued_at = ? "
+                            "WHERE name = ? AND state = 'processing' AND deadline < ?",
+                            (now, self.name, now)
+                        )
+                        cur.execute(
+                            "INSERT INTO queue_stats (name, reclaimed) VALUES (?, ?) "
+                            "ON CONFLICT (name) DO UPDATE SET reclaimed = reclaimed + excluded.reclaimed",
+                            (self.name, len(ids))
+                        )
+                    cur.execute("COMMIT")
+                except BaseException:
+                    cur.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            print(f"[SqliteQueue] Error in reap(): {e}")
+            return []
+        if ids:
+            self.reclaimed += len(ids)
+            print(f"[SqliteQueue] Reclaimed {len(ids)} expired jobs: {ids}")
+            self._wake(len(ids))
+        return ids
+
+    def stats(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT reclaimed FROM queue_stats WHERE name = ?", (self.name,)
+            ).fetchone()
+        return {
+            'reclaimed': row[0] if row else 0,
+            'reclaimed_here': self.reclaimed,
+            'queued': self.queued_size(),
+            'processing': self.processing_size()
+        }
+
+    def queue_wait(self, job_id: int):
+        """Seconds job_id spent queued, call once after pend()"""
+        return self._waits.pop(job_id, None)
+
+    def pop(self, job_id=None, timeout=5):
+        """Same as ack(job_id)"""
+        if job_id is None:
+            return None
+        return job_id if self.ack(job_id) else None
+
+    def hasFront(self):
+        return self.queued_size() > 0
+
+    def size(self):
+        """Total size = queued + processing"""
+        return self._one("SELECT COUNT(*) FROM queue WHERE name = ?", (self.name,))
+
+    def queued_size(self):
+        return self._one(
+            "SELECT COUNT(*) FROM queue WHERE name = ? AND state = 'queued'", (self.name,)
+        )
+
+    def processing_size(self):
+        return self._one(
+            "SELECT COUNT(*) FROM queue WHERE name = ? AND state = 'processing'", (self.name,)
+        )
+
+    def clear(self):
+        """Clear queued and processing jobs (use with caution!)"""
+        with self._lock:
+            self._db.execute("DELETE FROM queue WHERE name = ?", (self.name,))
+        print("[SqliteQueue] Queue cleared")
+
+    def peek_queued(self):
+        """Look at first queued job without removing it"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT job_id FROM queue WHERE name = ? AND state = 'queued' "
+                "ORDER BY retries DESC, seq LIMIT 1",
+                (self.name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def peek_processing(self):
+        """Look at the leased job closest to expiry without removing it"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT job_id FROM queue WHERE name = ? AND state = 'processing' "
+                "ORDER BY deadline LIMIT 1",
+                (self.name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def requeue_processing(self):
+        """
+        Move all processing jobs back to queued (recovery operation)
+        
+        Returns:
+            Number of jobs moved
+        """
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE queue SET state = 'queued', owner = NULL, deadline = NULL, retries = retries + 1 "
+                "WHERE name = ? AND state = 'processing'",
+                (self.name,)
+            )
+        if cur.rowcount > 0:
+            print(f"[SqliteQueue] Requeued {cur.rowcount} processing jobs")
+            self._wake(cur.rowcount)
+        return cur.rowcount
+
+    def close(self):
+        for fd in (self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        self._wake_r = self._wake_w = None
+        self._db.close()
+
+
+def make_queue(backend, name, redis_url, path=None, **kwargs):
+    """
+    Build the queue backend named in Config.QUEUE_BACKEND
+
+    Args:
+        backend: "list" (RedisQueue), "stream" (StreamQueue) or
+                 "sqlite" (SqliteQueue, in the database at path)
+    """
+    if backend == "sqlite":
+        return SqliteQueue(name=name, path=path or "data/queue.db", **kwargs)
+    if backend == "list":
+        return RedisQueue(name=name, redis_url=redis_url, **kwargs)
+    if backend == "stream":
+        return StreamQueue(name=name, redis_url=redis_url, **kwargs)
+    raise ValueError(f"Unknown queue backend: {backend}")
+
+
+class AsyncQueue:
+    """
+    asyncio view of any IQueue, each call runs in a thread.
+    Used by AsyncJobManager for backends without a native async client.
+    """
+    def __init__(self, q):
+        self._q = q
+
+    async def init(self):
+        pass
+
+    async def pend(self, timeout=5, lease=None):
+        return await asyncio.to_thread(self._q.pend, timeout, lease)
+
+    async def ack(self, job_id: int):
+        return await asyncio.to_thread(self._q.ack, job_id)
+
+    async def extend(self, job_id: int, lease=None):
+        return await asyncio.to_thread(self._q.extend, job_id, lease)
+
+    async def reap(self):
+        return await asyncio.to_thread(self._q.reap)
+
+    async def queue_wait(self, job_id: int):
+        return await asyncio.to_thread(self._q.queue_wait, job_id)
+
+    async def close(self):
+        pass
+
+
+class LeaseReaper(threading.Thread):
+    """
+    Background thread that extends the leases of our in-flight jobs and
+    re-queues jobs whose lease expired (their consumer died or hung).
+
+    Args:
+        q: queue with extend()/reap()
+        inflight: callable returning the job_ids this process is running
+        interval: seconds between passes
+    """
+    def __init__(self, q, inflight=None, interval=5):
+        super().__init__(daemon=True, name="lease-reaper")
+        self._q = q
+        self._inflight = inflight or (lambda: [])
+        self._interval = interval
+        self._stop_evt = threading.Event()
+
+    def run(self):
+        while not self._stop_evt.wait(self._interval):
+            try:
+                for job_id in self._inflight():
+                    self._q.extend(job_id)
+                self._q.reap()
+            except Exception as e:
+                print(f"[LeaseReaper] Error: {e}")
+
+    def stop(self):
+        self._stop_evt.set()
+
+
+class AsyncRedisQueue:
+    """
+    asyncio client for a RedisQueue, same keys, leases and semantics.
+    Consumer side only; producers keep using RedisQueue.push().
+    """
+    def __init__(self,
+                 name,
+                 redis_url,
+                 lease = 120,
+                 owner = None
+                 ):
+        self.name = name
+        self.redis_url = redis_url
+        self.redis = None
+        self.queued_key = f"{name}:queued"
+        self.processing_key = f"{name}:processing"
+        self.enqueued_key = f"{name}:enqueued"
+        self.leases_key = f"{name}:leases"
+        self.deadlines_key = f"{name}:deadlines"
+        self.pending_key = f"{name}:pending"
+        self.stats_key = f"{name}:stats"
+        self.lease = lease
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self.reclaimed = 0
+
+    async def init(self):
+        try:
+            self.redis = aioredis.from_url(
+                self.redis_url,
+                decode_responses=True,
+                socket_connect_timeout=5,
+                socket_keepalive=True
+            )
+            await self.redis.ping()
+            print(f"REDIS: connected to redis (async): {self.redis_url}")
+        except redis.ConnectionError as e:
+            print(f"REDIS: ERROR: cannot connect to redis")
+            raise
+        self._grant = self.redis.register_script(GRANT_LUA)
+        self._ack = self.redis.register_script(ACK_LUA)
+        self._extend = self.redis.register_script(EXTEND_LUA)
+        self._reap = self.redis.register_script(REAP_LUA)
+
+    async def pend(self, timeout=5, lease=None):
+        """Move job from queued to processing and lease it, see RedisQueue.pend()"""
+        try:
+            result = await self.redis.brpoplpush(
+                self.queued_key,
+                self.processing_key,
+                timeout=timeout
+            )
+            if not result:
+                return None
+            job_id = int(result)
+            if not await self._grant(
+                keys=[self.processing_key, self.leases_key, self.deadlines_key, self.pending_key],
+                args=[job_id, self.owner, lease or self.lease]
+            ):
+                return None
+            return job_id
+        except redis.ConnectionError as e:
+            print(f"[AsyncRedisQueue] Connection error in pend(): {e}")
+            await asyncio.sleep(min(timeout, 1))
+            return None
+        except ValueError as e:
+            print(f"[AsyncRedisQueue] Invalid job_id in pend(): {e}")
+            return None
+
+    async def ack(self, job_id: int):
+        """Mark job_id done, see RedisQueue.ack()"""
+        try:
+            return bool(await self._ack(
+                keys=[self.leases_key, self.deadlines_key],
+                args=[job_id, self.owner]
+            ))
+        except redis.ConnectionError as e:
+            print(f"[AsyncRedisQueue] Connection error in ack(): {e}")
+            return False
+
+    async def extend(self, job_id: int, lease=None):
+        try:
+            return bool(await self._extend(
+                keys=[self.leases_key, self.deadlines_key],
+                args=[job_id, self.owner, lease or self.lease]
+            ))
+        except redis.ConnectionError:
+            return False
+
+    async def reap(self):
+        """Re-queue jobs whose lease expired, see RedisQueue.reap()"""
+        try:
+            ids = await self._reap(keys=[
+                self.queued_key,
+                self.processing_key,
+                self.leases_key,
+                self.deadlines_key,
+                self.pending_key,
+                self.stats_key,
+                self.enqueued_key
+            ], args=[ORPHAN_GRACE_SEC])
+        except redis.ConnectionError as e:
+            print(f"[AsyncRedisQueue] Connection error in reap(): {e}")
+            return []
+        ids = [int(i) for i in ids]
+        if ids:
+            self.reclaimed += len(ids)
+            print(f"[AsyncRedisQueue] Reclaimed {len(ids)} expired jobs: {ids}")
+        return ids
+
+    async def queue_wait(self, job_id: int):
+        """Seconds job_id spent queued, see RedisQueue.queue_wait()"""
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hget(self.enqueued_key, job_id)
+            pipe.hdel(self.enqueued_key, job_id)
+            ts, _ = await pipe.execute()
+            if ts is None:
+                return None
+            return max(0.0, time.time() - float(ts))
+        except (redis.ConnectionError, ValueError):
+            return None
+
+    async def close(self):
+        if self.redis:
+            await self.redis.aclose()
@@ -3,21 +3,95 @@ import socket
 import struct
 import json
 import subprocess
-import tempfile
 import os
-import shutil
+import time
+import signal
+import queue
+import threading
 import env
+import output
+import measure
+import protocol
+import cgroup
+import workspace
 from util import Container, FirecrackerCfg, send_sock, rec_sock, run_cmd, \
-ISerializer, JsonSerializer
+ISerializer, JsonSerializer, FrameReader, answer_hello
 
 EXECUTE_SCRIPT = "/mnt/deploy/execute.sh"
 CFG = "vm_config.json"
 # XXX change to scale
 VSOCK_PORT = 5000
 SER = JsonSerializer()
+# "measure": in-process harness (measure.py), "shell": execute.sh
+HARNESS = "measure"
+_harness = measure.Harness()
+# job directories on tmpfs, started by main() or the first job
+_workspaces = workspace.WorkspacePool()
+# processes below the agent before any job ran, spared by measure.kill_strays
+_baseline = set()
+# execute.sh's own work around the compile and run (vmstat, jc, jq)
+SHELL_SLACK_SEC = 10
 
-def execute_job(job_data: dict) -> dict:
-    """Execute the job using execute.sh script"""
+def run_shell(tmpdir: str, src_file: str, lang: str, compiler: str, opts: str,
+              output_limit: int = output.OUTPUT_LIMIT,
+              compile_limit: float = measure.COMPILE_TIME_LIMIT,
+              run_limit: float = measure.RUN_TIME_LIMIT) -> dict:  # throws
+    """Execute the job through execute.sh and read back its result.json"""
+    result_json_path = os.path.join(tmpdir, "result.json")
+    
+    cmd = [
+        EXECUTE_SCRIPT,
+        tmpdir,
+        src_file,
+        lang,
+        compiler,
+        opts
+    ]
+    
+    print(f"[Agent] Running: {' '.join(cmd)}")
+    
+    # its own session, so vmstat and the binary die with it on timeout
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+        env=dict(os.environ, OUTPUT_LIMIT=str(output_limit),
+                 COMPILE_TIMEOUT=f"{compile_limit:g}", RUN_TIMEOUT=f"{run_limit:g}")
+    )
+    limit = compile_limit + run_limit + SHELL_SLACK_SEC
+    try:
+        stdout, stderr = proc.communicate(timeout=limit)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+        return measure.timeout_result('job', limit)
+
+    # execute.sh names the phase its `timeout` wrapper killed
+    try:
+        with open(os.path.join(tmpdir, "timed_out"), 'r') as f:
+            phase = f.read().strip()
+    except OSError:
+        phase = None
+    if phase in ('compile', 'run'):
+        return measure.timeout_result(phase, compile_limit if phase == 'compile' else run_limit)
+    if os.path.exists(result_json_path):
+        with open(result_json_path, 'r') as f:
+            return json.load(f)
+    print(f"[Agent] Execution failed: no result file")
+    return {
+        'success': False,
+        'error': 'No result file generated',
+        'stdout': stdout,
+        'stderr': stderr,
+        'exit_code': proc.returncode
+    }
+
+CANCELLED = {'success': False, 'error': 'cancelled', 'cancelled': True}
+
+def execute_job(job_data: dict, report=None) -> dict:
+    """Execute the job with the configured harness, report as for measure.Harness.run"""
     code = job_data.get('code', '')
     lang = job_data.get('lang', 'cpp')
     compiler = job_data.get('compiler', 'g++')
@@ -25,7 +99,10 @@ def execute_job(job_data: dict) -> dict:
     
     print(f"[Agent] Executing job, language: {lang}, compiler: {compiler}, opts: {opts}")
     
-    tmpdir = tempfile.mkdtemp()
+    t0 = time.perf_counter()
+    ws = _workspaces.acquire()
+    tmpdir = ws.path
+    setup_ms = None
     
     try:
         ext_map = {
@@ -39,47 +116,28 @@ def execute_job(job_data: dict) -> dict:
         
         with open(src_file, 'w') as f:
             f.write(code)
+        setup_ms = round((time.perf_counter() - t0) * 1000, 3)
         
-        result_json_path = os.path.join(tmpdir, "result.json")
-        
-        cmd = [
-            EXECUTE_SCRIPT,
-            tmpdir,
-            src_file,
-            lang,
-            compiler,
-            opts
-        ]
-        
-        print(f"[Agent] Running: {' '.join(cmd)}")
+        result = None
+        if HARNESS == "measure":
+            try:
+                result = _harness.run(job_data, tmpdir, src_file, report)
+            except measure.SetupFailed as e:
+                # nothing ran yet; anything later is the job's error, not a reason to run it twice
+                print(f"[Agent] Harness setup failed, falling back to execute.sh: {e}")
+        if result is None and job_data.get('compile_only'):
+            # execute.sh always runs the program
+            result = {'success': False, 'error': 'compile-only jobs need the measure harness'}
+        if result is None:
+            result = run_shell(tmpdir, src_file, lang, compiler, opts,
+                               job_data.get('output_limit') or output.OUTPUT_LIMIT,
+                               job_data.get('compile_time_limit_sec') or measure.COMPILE_TIME_LIMIT,
+                               job_data.get('time_limit_sec') or measure.RUN_TIME_LIMIT)
+        print(f"[Agent] Execution complete, success: {result.get('success', False)}")
         
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if os.path.exists(result_json_path):
-            with open(result_json_path, 'r') as f:
-                result = json.load(f)
-            print(f"[Agent] Execution complete, success: {result.get('success', False)}")
-        else:
-            result = {
-                'success': False,
-                'error': 'No result file generated',
-                'stdout': proc.stdout,
-                'stderr': proc.stderr,
-                'exit_code': proc.returncode
-            }
-            print(f"[Agent] Execution failed: no result file")
-        
-    except subprocess.TimeoutExpired:
-        result = {
-            'success': False,
-            'error': 'Execution timeout (30s)'
-        }
-        print(f"[Agent] Execution timeout")
+    except measure.Cancelled:
+        result = dict(CANCELLED)
+        print(f"[Agent] Job cancelled")
     except Exception as e:
         result = {
             'success': False,
@@ -87,27 +145,129 @@ def execute_job(job_data: dict) -> dict:
         }
         print(f"[Agent] Execution error: {e}")
     finally:
-        try:
-            shutil.rmtree(tmpdir)
-        except:
-            pass
+        # nothing a job started may run into the next measurement
+        strays = measure.kill_strays(_baseline)
+        if strays:
+            print(f"[Agent] Killed {strays} leftover processes")
+        t0 = time.perf_counter()
+        _workspaces.release(ws)
+        teardown_ms = round((time.perf_counter() - t0) * 1000, 3)
     
+    if strays:
+        result['strays_killed'] = strays
+    timing = result.setdefault('timing', {})
+    timing['workspace_setup_ms'] = setup_ms
+    timing['workspace_teardown_ms'] = teardown_ms
     return result
 
+def serve(conn, ser: ISerializer, frames: FrameReader):
+    """
+    Protocol 2 session (see protocol.py) until the host disconnects: this
+    thread reads submit/cancel/ping, a worker runs the submitted jobs in order
+    """
+    send_lock = threading.Lock()
+    jobs = queue.Queue()
+    cancelled = set()
+    current = [None]
+
+    def send(type_: str, id_, body: dict = None):
+        try:
+            data = ser.serialize(protocol.message(type_, id_, body))
+            with send_lock:
+                send_sock(conn, data)
+        except OSError as e:
+            print(f"[Agent] Send failed: {e}")
+
+    def worker():
+        while True:
+            item = jobs.get()
+            if item is None:
+                return
+            job_id, job_data = item
+            _harness.cancelled.clear()
+            current[0] = job_id
+            sent = {}
+            def report(kind, body):
+                if kind == 'partial':
+                    sent.update(body)
+                send(protocol.PARTIAL if kind == 'partial' else protocol.PROGRESS, job_id, body)
+            if job_id in cancelled:
+                result = dict(CANCELLED)
+            else:
+                print(f"[Agent] Received job {job_id}")
+                result = execute_job(job_data, report)
+                # text already sent with the partial result is not sent twice
+                result = {k: v for k, v in result.items()
+                          if not (isinstance(v, str) and sent.get(k) is v)}
+            current[0] = None
+            cancelled.discard(job_id)
+            send(protocol.RESULT, job_id, result)
+            print(f"[Agent] Sent result of job {job_id}")
+
+    t = threading.Thread(target=worker, name="jobs", daemon=True)
+    t.start()
+    try:
+        while True:
+            msg = ser.deserialize(frames.read(conn))
+            type_, id_ = msg.get('type'), msg.get('id')
+            if type_ == protocol.SUBMIT:
+                jobs.put((id_, msg.get('body') or {}))
+            elif type_ == protocol.CANCEL:
+                cancelled.add(id_)
+                if current[0] == id_:
+                    _harness.cancel()
+            elif type_ == protocol.PING:
+                send(protocol.PONG, id_)
+            else:
+                print(f"[Agent] Unknown message type {type_}")
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"[Agent] Connection closed: {e}")
+    finally:
+        # nobody is left to read the results: drop the queue, stop the current job
+        while True:
+            try:
+                jobs.get_nowait()
+            except queue.Empty:
+                break
+        if current[0] is not None:
+            _harness.cancel()
+        jobs.put(None)
+        t.join()
+
 def main():
     """Main agent loop - listen on vsock and process jobs"""
+    # orphans of job processes come to us, so kill_strays can find them
+    if not measure.become_subreaper():
+        print("[Agent] Could not become a subreaper, daemonized job processes may survive")
+    _baseline.update(measure.descendants(os.getpid()))
+    # a job that runs the guest out of memory is killed, not the agent
+    cgroup.protect_agent()
+    _harness.cgroups = cgroup.setup()
+    if os.geteuid() == 0:
+        # jobs never run as root, see measure.JOB_UID
+        _harness.job_user = measure.JOB_UID
+
     # Read VM configuration
     try:
         with open(CFG, 'r') as f:
             config = json.load(f)
-        cid = config.get("vsock", {}).get("cid", socket.VMADDR_CID_ANY)
+        # pool members boot the same deploy drive under different guest CIDs,
+        # so listen on any local CID rather than the one in the config
+        cid = socket.VMADDR_CID_ANY
         port = config.get("vsock", {}).get("port", VSOCK_PORT)
-        print(f"[Agent] Loaded config: CID={cid}, PORT={port}")
+        global HARNESS
+        HARNESS = config.get("harness", HARNESS)
+        _harness.sample_interval_ms = config.get("sample_interval_ms", _harness.sample_interval_ms)
+        _workspaces.count = config.get("workspaces", _workspaces.count)
+        _workspaces.size_mb = config.get("workspace_size_mb", _workspaces.size_mb)
+        print(f"[Agent] Loaded config: CID={cid}, PORT={port}, harness={HARNESS}, "
+              f"sample interval={_harness.sample_interval_ms} ms")
     except Exception as e:
         print(f"[Agent] Error reading config: {e}, using defaults")
         cid = socket.VMADDR_CID_ANY
         port = VSOCK_PORT
 
+    _workspaces.start()
     print(f"[Agent] Starting on vsock port {port}")
     
     # Create vsock socket
@@ -128,18 +288,30 @@ def main():
             
             # Process jobs on this connection
             # NO handshake needed - Firecracker already sent OK to host
+            # JSON until the host negotiates something else (util.negotiate)
+            ser = SER
+            frames = FrameReader()
+            first = True
             while True:
                 try:
                     # Receive job data: {code, lang, compiler, opts}
-                    job_bytes = rec_sock(conn)
-                    job_data = SER.deserialize(job_bytes)                    
+                    job_data = ser.deserialize(frames.read(conn))
+                    if first and 'hello' in job_data:
+                        ser, version = answer_hello(conn, job_data, protocol.PROTOCOLS)
+                        first = False
+                        print(f"[Agent] Using {ser.name} serializer, protocol {version}")
+                        if version >= 2:
+                            serve(conn, ser, frames)
+                            break
+                        continue
+                    first = False
                     print(f"[Agent] Received job")
                     
                     # Execute job
                     result = execute_job(job_data)
                     
                     # Send result back
-                    result_bytes = SER.serialize(result)
+                    result_bytes = ser.serialize(result)
                     send_sock(conn, result_bytes)
                     
                     print(f"[Agent] Sent result")
@@ -151,7 +323,7 @@ def main():
                         'error': str(e)
                     }
                     try:
-                        send_sock(conn, SER.serialize(error_result))
+                        send_sock(conn, ser.serialize(error_result))
                     except:
                         break
                     
@@ -1,12 +1,17 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from models import db, Job, init_db
-from job_cache import JobCache
-from IQueue import GlobalQueue, RedisQueue
+from job_cache import JobCache, DONE_CHANNEL
+import result_cache
+import godbolt
+from output_relay import OUTPUT_CHANNEL
+from IQueue import GlobalQueue, RedisQueue, make_queue
 import json
+import redis
 import uuid
 import os
 import logging
+import time
 from config import Config
 import sys
 
@@ -26,11 +31,21 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app, origins=Config.ALLOWED_ORIGINS.split(','))
-queue = RedisQueue(
+queue = make_queue(
+        Config.QUEUE_BACKEND,
         name="benchr",
         redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        path=Config.QUEUE_DB,
         maxsize=Config.RATE_MAX_QUEUE_SIZE
 )
+# compile-only jobs go to the reserved guests when there are any
+compile_queue = make_queue(
+        Config.QUEUE_BACKEND,
+        name=Config.COMPILE_QUEUE_NAME,
+        redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        path=Config.QUEUE_DB,
+        maxsize=Config.RATE_MAX_QUEUE_SIZE
+) if Config.COMPILE_LANE_SIZE > 0 else queue
 cache = JobCache()
 
 # each gunicorn worker needs its own connection
@@ -39,6 +54,8 @@ init_db()
 cache.start()
 print("[Flask] Starting API server...")
 
+PRECISION_METRICS = ('wall_ms', 'cycles', 'instructions')
+
 @app.route('/api/submit', methods=['POST'])
 def submit_job():
     """
@@ -48,8 +65,21 @@ def submit_job():
         "code": "...",
         "lang": "c",
         "compiler": "gcc",
-        "opts": "-O2"
+        "opts": "-O2",
+        "fresh": false,     # optional, skip the result cache and measure again
+        "runs": 1,          # optional, measured iterations (<= Config.MAX_RUNS)
+        "warmup": 0,        # optional, discarded iterations first (<= Config.MAX_WARMUP)
+        "precision": 0.02,  # optional, rerun until the 95% CI is within 2% of the
+                            # median; "runs" then caps the runs (default MAX_RUNS)
+        "precision_metric": "wall_ms",  # or "cycles", "instructions"
+        "counter_interval_ms": 10,      # optional, also record counters every 10 ms,
+                                        # see /api/jobs/<id>/timeline
+        "time_limit_sec": 10,           # optional, for all the runs together, up to the
+                                        # API key's tier maximum; status "timeout" past it
+        "asm_source": false             # optional, source lines in the assembly (C/C++)
     }
+    The result's "asm" holds the functions of the submitted code only,
+    see /api/jobs/<id>/asm for the whole binary.
     """
     try:
         data = request.json
@@ -61,22 +91,73 @@ def submit_job():
         if not data.get('lang'):
             return jsonify({'error': 'Language is required'}), 400
         
-        # Create job in database
-        # xxx just increment an integer
-        if DEBUG:
-            pass
-            #print(f"job received: {job_id}")
-        #logger.info(f"job received: {job_id}")
+        try:
+            precision = float(data['precision']) if data.get('precision') is not None else None
+            runs = int(data.get('runs', Config.MAX_RUNS if precision else 1))
+            warmup = int(data.get('warmup', 0))
+            interval = data.get('counter_interval_ms')
+            interval = int(interval) if interval is not None else None
+            max_limit = Config.TIME_LIMIT_TIERS.get(_tier(), 0)
+            time_limit = float(data.get('time_limit_sec') or min(Config.DEFAULT_TIME_LIMIT_SEC, max_limit))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'runs, warmup, precision, counter_interval_ms and time_limit_sec must be numbers'}), 400
+        if not 1 <= runs <= Config.MAX_RUNS or not 0 <= warmup <= Config.MAX_WARMUP:
+            return jsonify({'error': f'runs must be 1..{Config.MAX_RUNS}, warmup 0..{Config.MAX_WARMUP}'}), 400
+        precision_metric = data.get('precision_metric', 'wall_ms') if precision else None
+        if precision is not None and not 0 < precision <= 1:
+            return jsonify({'error': 'precision must be in (0, 1]'}), 400
+        if precision and precision_metric not in PRECISION_METRICS:
+            return jsonify({'error': f'precision_metric must be one of {", ".join(PRECISION_METRICS)}'}), 400
+        if interval is not None and not Config.MIN_COUNTER_INTERVAL_MS <= interval <= 1000:
+            return jsonify({'error': f'counter_interval_ms must be {Config.MIN_COUNTER_INTERVAL_MS}..1000'}), 400
+        if not 0 < time_limit <= max_limit:
+            return jsonify({'error': f'time_limit_sec must be in (0, {max_limit:g}] for tier {_tier()}'}), 400
+        
+        compiler = data.get('compiler', 'gcc')
+        opts = data.get('opts', '-O2')
+        fresh = bool(data.get('fresh', False))
+        asm_source = bool(data.get('asm_source', False))
+        variant = f"runs={runs},warmup={warmup}" if runs > 1 or warmup else ""
+        if precision:
+            variant += f",precision={precision},metric={precision_metric}"
+        if interval:
+            variant += f",counter_interval={interval}"
+        if time_limit != Config.DEFAULT_TIME_LIMIT_SEC:
+            # a job that may time out sooner is no stand-in for this one
+            variant += f",time_limit={time_limit:g}"
+        if asm_source:
+            variant += ",asm_source"
+        key = result_cache.result_key(data['code'], data['lang'], compiler, opts, variant=variant)
+        
+        # Same inputs already measured or on their way, hand out that job
+        if not fresh:
+            hit = result_cache.lookup(key)
+            if hit is not None:
+                return _cached_response(hit)
         
         job = Job.create(
             code=data['code'],
             lang=data['lang'],
-            compiler=data.get('compiler', 'gcc'),
-            compiler_opts=data.get('opts', '-O2'),
-            status='queued'
+            compiler=compiler,
+            opts=opts,
+            runs=runs,
+            warmup=warmup,
+            precision=precision,
+            precision_metric=precision_metric,
+            counter_interval_ms=interval,
+            time_limit_sec=time_limit,
+            asm_source=asm_source,
+            status='queued',
+            cache_key=key
         )
-
         
+        # Lost the race to an identical submission, attach to it instead
+        if not fresh:
+            other = result_cache.claim(key, job)
+            if other is not None:
+                job.delete_instance()
+                return _cached_response(other)
+
         #print(f"[Flask] Created job: {job_id}")
         
         # Add to queue (JobManager will pick it up)
@@ -91,13 +172,27 @@ def submit_job():
         # xxx how to handle request submit??
         return jsonify({
             'job_id': job.id,
-            'status': 'queued'
+            'status': 'queued',
+            'cached': False
         }), 201
         
     except Exception as e:
         print(f"[Flask] Error submitting job: {e}")
         return jsonify({'error': str(e)}), 500
 
+def _tier() -> str:
+    """Time limit tier of the caller, from its API key"""
+    key = request.headers.get(Config.API_KEY_HEADER)
+    return Config.API_KEY_TIERS.get(key, Config.DEFAULT_TIER) if key else Config.DEFAULT_TIER
+
+def _cached_response(job: Job):
+    """Submit response for a job reused from the result cache"""
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'cached': True
+    }), 200
+
 @app.route('/api/current', methods=['GET'])
 def get_current_job():
     """
@@ -148,6 +243,227 @@ def get_job(id):
         logger.error(f"Error getting job {id}: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/jobs/<id>/timeline', methods=['GET'])
+def get_job_timeline(id):
+    """
+    Counters of a job submitted with counter_interval_ms, per interval
+    GET /api/jobs/<id>/timeline
+    {
+        "interval_ms": 10,
+        "t_ms": [...],                              # end of each interval
+        "events": {"cycles": [...], ...},           # delta per interval, null if not counting
+        "derived": {"ipc": [...], "cache_miss_rate": [...], "branch_miss_rate": [...]}
+    }
+    """
+    try:
+        timeline = cache.get_timeline(int(id))
+        if timeline is None:
+            return jsonify({'error': 'No counter timeline for this job'}), 404
+        return jsonify(timeline)
+    except Exception as e:
+        logger.error(f"Error getting timeline of job {id}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<id>/cancel', methods=['POST'])
+def cancel_job(id):
+    """
+    Cancel a job
+    POST /api/jobs/<id>/cancel
+    {"job_id": 1, "status": "cancelled"}    # was still queued
+    {"job_id": 1, "status": "cancelling"}   # running, the manager stops it shortly
+    """
+    try:
+        Job.get_by_id(int(id))
+        status = cache.cancel(int(id))
+    except Job.DoesNotExist:
+        return jsonify({'error': 'Job not found'}), 404
+    except Exception as e:
+        logger.error(f"Error cancelling job {id}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+    if status is None:
+        return jsonify({'error': 'Job already finished'}), 409
+    return jsonify({'job_id': int(id), 'status': status}), 202
+
+@app.route('/api/jobs/<id>/asm', methods=['GET'])
+def get_job_asm(id):
+    """
+    Assembly of a finished job. Without full, what the result holds: the
+    submitted code's own functions for C/C++ (scope "tu"). With full=1 the
+    whole binary, compiled and disassembled again on a guest the first time
+    it is asked for (from the compile cache, the program does not run).
+    GET /api/jobs/<id>/asm?full=1
+    200 {"job_id": 1, "scope": "full", "asm": "..."}
+    202 {"job_id": 1, "status": "queued", "asm_job_id": 7}    # ask again shortly
+    """
+    try:
+        job = Job.get_by_id(int(id))
+    except Job.DoesNotExist:
+        return jsonify({'error': 'Job not found'}), 404
+    try:
+        result = job.get_result()
+        if result is None or job.status in ('queued', 'running', 'cancelling'):
+            return jsonify({'error': 'Job has not finished'}), 409
+        scope = (result.get('metadata') or {}).get('asm', {}).get('scope', 'full')
+        full = request.args.get('full', '').lower() in ('1', 'true')
+        if not full or scope == 'full':
+            if result.get('asm') is None:
+                return jsonify({'error': 'No assembly for this job'}), 404
+            return jsonify({'job_id': job.id, 'scope': scope, 'asm': result['asm']})
+
+        asm = cache.get_full_asm(job.id)
+        if asm is not None:
+            return jsonify({'job_id': job.id, 'scope': 'full', 'asm': asm})
+        fetch = cache.asm_job(job.id)
+        if fetch is None or fetch.status not in ('queued', 'running'):
+            if fetch is not None and fetch.status != 'completed':
+                logger.warning(f"Full disassembly of job {job.id} ended {fetch.status}, retrying")
+            fetch = Job.create(
+                code=job.code,
+                lang=job.lang,
+                compiler=job.compiler,
+                opts=job.opts,
+                asm_source=job.asm_source,
+                asm_syntax=job.asm_syntax,
+                compile_only=True,
+                asm_scope='full',
+                asm_of=job,
+                status='queued'
+            )
+            compile_queue.push(fetch.id)
+        return jsonify({'job_id': job.id, 'status': fetch.status, 'asm_job_id': fetch.id}), 202
+    except Exception as e:
+        logger.error(f"Error getting assembly of job {id}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+def _wait_done(job: Job, timeout: float) -> Job:
+    """The job once the manager announces it finished (DONE_CHANNEL), or as it is at timeout"""
+    if Config.QUEUE_BACKEND == 'sqlite':
+        # no redis to hear it from
+        return job
+    pubsub = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")).pubsub(
+            ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(DONE_CHANNEL.format(job.id))
+        # it may have finished before we subscribed
+        job = Job.get_by_id(job.id)
+        deadline = time.monotonic() + timeout
+        while job.status in ('queued', 'running'):
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            if pubsub.get_message(timeout=left) is not None:
+                job = Job.get_by_id(job.id)
+    except redis.RedisError as e:
+        logger.warning(f"Cannot wait for job {job.id}: {e}")
+    finally:
+        pubsub.close()
+    return job
+
+@app.route('/api/compiler/<compiler_id>/compile', methods=['POST'])
+def compile_source(compiler_id):
+    """
+    Compile and disassemble without running, request and response as
+    Compiler Explorer's (see godbolt.py)
+    POST /api/compiler/g++/compile
+    {
+        "source": "...",
+        "lang": "c++",
+        "options": {"userArguments": "-O2", "filters": {"intel": true, "trim": true},
+                    "compilerOptions": {"skipAsm": false}}
+    }
+    {"code": 0, "stdout": [], "stderr": [], "asm": [{"text": "main:"}, ...],
+     "benchr": {"job_id": 7, "cached": true, "compiler": "g++"}}
+    Waits up to COMPILE_WAIT_SEC for the job's completion notice; past that
+    the answer is godbolt.pending() (code -1). Identical requests share one
+    job, so sending it again gets the stored result once it is there.
+    """
+    try:
+        data = request.json or {}
+        lang = godbolt.LANGS.get(data.get('lang') or 'c++')
+        if lang is None:
+            return jsonify({'error': f"Unsupported language {data.get('lang')}, use c or c++"}), 400
+        if not data.get('source'):
+            return jsonify({'error': 'Source is required'}), 400
+        options = data.get('options') or {}
+        filters = options.get('filters') or {}
+        opts = (options.get('userArguments') or '').strip()
+        compiler = godbolt.guest_compiler(compiler_id, lang)
+        syntax = 'intel' if filters.get('intel') else 'att'
+        # formatting filters apply to the stored result, only the syntax is compiled in
+        key = result_cache.result_key(data['source'], lang, compiler, opts,
+                                      variant=f"compile_only,syntax={syntax}")
+
+        job = result_cache.lookup(key)
+        cached = job is not None and job.status == 'completed'
+        if job is None:
+            job = Job.create(
+                code=data['source'],
+                lang=lang,
+                compiler=compiler,
+                opts=opts,
+                compile_only=True,
+                asm_syntax=syntax,
+                status='queued',
+                cache_key=key
+            )
+            other = result_cache.claim(key, job)
+            if other is not None:
+                job.delete_instance()
+                job = other
+            else:
+                compile_queue.push(job.id)
+
+        extra = {'job_id': job.id, 'cached': cached, 'compiler': compiler}
+        if job.status in ('queued', 'running'):
+            job = _wait_done(job, Config.COMPILE_WAIT_SEC)
+        if job.status in ('queued', 'running'):
+            return jsonify(godbolt.pending(dict(extra, status=job.status)))
+
+        skip_asm = bool((options.get('compilerOptions') or {}).get('skipAsm'))
+        return jsonify(godbolt.response(job.get_result() or {'error': f"job {job.status}"},
+                                        filters, skip_asm, extra))
+    except Exception as e:
+        logger.error(f"Error compiling for {compiler_id}: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<id>/output', methods=['GET'])
+def stream_job_output(id):
+    """
+    Live program output of a running job as server-sent events (STREAM_OUTPUT)
+    GET /api/jobs/<id>/output
+    data: "<chunk>"     # JSON string per chunk
+    event: end          # program done, fetch /api/jobs/<id> for the result
+    """
+    try:
+        job = Job.get_by_id(int(id))
+    except Job.DoesNotExist:
+        return jsonify({'error': 'Job not found'}), 404
+    if not Config.STREAM_OUTPUT or job.status not in ('queued', 'running'):
+        return Response("event: end\ndata: \n\n", mimetype='text/event-stream')
+
+    pubsub = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")).pubsub(
+            ignore_subscribe_messages=True)
+    pubsub.subscribe(OUTPUT_CHANNEL.format(job.id))
+
+    def events():
+        try:
+            while True:
+                msg = pubsub.get_message(timeout=1.0)
+                if msg is None:
+                    # the end message may have gone out before we subscribed
+                    if Job.get_by_id(job.id).status not in ('queued', 'running'):
+                        break
+                    continue
+                if not msg['data']:
+                    break
+                yield f"data: {json.dumps(msg['data'].decode('utf-8', errors='replace'))}\n\n"
+            yield "event: end\ndata: \n\n"
+        finally:
+            pubsub.close()
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/jobs', methods=['GET'])
 def list_jobs():
     """
@@ -157,7 +473,7 @@ def list_jobs():
     try:
         limit = int(request.args.get('limit', 10))
         
-        jobs = Job.select().order_by(Job.created_at.desc()).limit(limit)
+        jobs = Job.select().where(Job.asm_of.is_null()).order_by(Job.created_at.desc()).limit(limit)
         
         job_list = [{
             'job_id': job.id,
@@ -182,8 +498,6 @@ def health():
         'database': 'connected' if not db.is_closed() else 'disconnected'
     })
 
-    
- }
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """
@@ -193,13 +507,14 @@ def chat():
         "message": "...",
         "result": {...}
     }
-"""
+    """
     try:
         data = request.json
         
         if not data.get('message'):
-            return jsonify({'error': 'Message is required'>
-# TODO: Implement Claude AI integration
+            return jsonify({'error': 'Message is required'}), 400
+
+        # TODO: Implement Claude AI integration
         # For now, return a placeholder response
 
         message = data['message']
@@ -208,13 +523,12 @@ def chat():
         # Placeholder - integrate with Anthropic Claude API
         response_text = f"Received message: {message}"
         
-        logger.info(f"Chat request received: {message[:50]>
+        logger.info(f"Chat request received: {message[:50]}")
         
         return jsonify({
             'response': response_text
         })
         
     except Exception as e:
-        logger.error(f"Error in chat endpoint: {e}", exc_i>
+        logger.error(f"Error in chat endpoint: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
-})
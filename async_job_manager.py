@@ -0,0 +1,260 @@
+import os
+import asyncio
+import signal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from IQueue import AsyncRedisQueue, AsyncQueue, make_queue
+from util import Container, FirecrackerCfg, \
+ISerializer, JsonSerializer, latency_stats, ProgramCosts, serializers
+from job_cache import JobCache
+from result_cache import program_key
+from vm_pool import VmPool, BENCH, COMPILE
+from output_relay import OutputRelay
+from config import Config
+
+DEBUG = True
+
+# async_job_manager.py
+
+# Single-threaded JobManager: one coroutine per guest, each blocking on the
+# queue through its own async redis connection. VM boot/restart stays in
+# VmPool (run in a thread), as does the agent connection: the guest's
+# protocol.Channel reads on its own thread and its futures are awaited here,
+# up to VmPool.depth of them per guest. SQLite access goes through one worker
+# thread so the event loop never blocks on the DB. Guests in a reserved lane
+# (VmPool lanes) take their jobs from that lane's queue.
+class AsyncJobManager:
+    def __init__(self, ser: Optional[ISerializer] = None, pool_size: Optional[int] = None):
+        self._running = False
+        self._ser = ser or JsonSerializer()
+        self._fc = FirecrackerCfg()
+        self._pool = VmPool(
+                size=(pool_size or Config.POOL_SIZE) + Config.COMPILE_LANE_SIZE,
+                fc=self._fc,
+                snapshot=Config.SNAPSHOT,
+                snapdir=Config.SNAPSHOT_DIR,
+                serializers=[n for n in Config.SERIALIZERS.split(',') if n in serializers()],
+                depth=Config.PIPELINE_DEPTH,
+                max_frame=Config.MAX_FRAME_BYTES,
+                lanes={COMPILE: Config.COMPILE_LANE_SIZE}
+                )
+        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        self._c = JobCache(redis_url=None if Config.QUEUE_BACKEND == 'sqlite' else redis_url)
+        self._db = ThreadPoolExecutor(max_workers=1)   # one sqlite writer
+        # one queue per pool lane
+        self._queues = {}
+        for lane, name in ((BENCH, "benchr"), (COMPILE, Config.COMPILE_QUEUE_NAME)):
+            if lane != BENCH and lane not in self._pool.lanes:
+                continue
+            if Config.QUEUE_BACKEND == "list":
+                self._queues[lane] = AsyncRedisQueue(name=name, redis_url=redis_url, lease=Config.LEASE_SEC)
+            else:
+                self._queues[lane] = AsyncQueue(make_queue(
+                        Config.QUEUE_BACKEND,
+                        name=name,
+                        redis_url=redis_url,
+                        path=Config.QUEUE_DB,
+                        lease=Config.LEASE_SEC
+                        ))
+        self._waits = deque(maxlen=1000)
+        self._costs = ProgramCosts(program_key)
+        # publishes with a blocking client from its own threads, off the loop
+        self._relay = OutputRelay(Config.OUTPUT_STREAM_PORT, redis_url) if Config.STREAM_OUTPUT else None
+        self._tasks = []
+
+    async def _db_call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._db, fn, *args)
+
+    async def _submit(self, ctr: Container, job_id: int) -> Optional[dict]:
+        """Send a job to the guest's agent, which queues it behind the running one"""
+        q = self._queues[ctr.lane]
+        wait = await q.queue_wait(job_id)
+        if wait is not None and ctr.lane == BENCH:
+            self._waits.append(wait)
+        print(f"Received job: {job_id} on container {ctr.cid} (queued {wait * 1000 if wait is not None else -1:.1f} ms)")
+        data = await self._db_call(self._c.get, job_id)
+        if data is None:
+            print(f"Error processing job {job_id}: not found")
+            return None
+        if not await self._db_call(self._c.set_running, job_id):
+            await q.ack(job_id)
+            print(f"Job {job_id} was cancelled before it ran")
+            return None
+        progress = (lambda p: print(f"Job {job_id} on container {ctr.cid}: {p}")) if DEBUG else None
+        # in ctr.jobs before the agent can open its output stream (OutputRelay)
+        ctr.jobs.append(job_id)
+        ctr.busy = True
+        fut = asyncio.wrap_future(ctr.chan.submit(job_id, data, progress))
+        return {'job_id': job_id, 'wait': wait, 'data': data, 'chan': ctr.chan, 'fut': fut,
+                'expected_ms': self._costs.expected_ms(data)}
+
+    async def _finish(self, ctr: Container, entry: dict):
+        """Record the result of a job sent by _submit"""
+        job_id = entry['job_id']
+        try:
+            try:
+                result = await entry['fut']
+            except (OSError, RuntimeError) as e:
+                # a job failed by an earlier connection says nothing about this one
+                if entry['chan'] is ctr.chan:
+                    ctr.ready = False
+                result = {'success': False, 'error': f"container {ctr.cid}: {e}"}
+            if entry['wait'] is not None:
+                result.setdefault('timing', {})['queue_wait_ms'] = entry['wait'] * 1000
+
+            await self._db_call(self._c.update, job_id, result)
+            self._costs.learn(entry['data'], result, verbose=DEBUG)
+            if not await self._queues[ctr.lane].ack(job_id):
+                print(f"Lease on job {job_id} was lost, it may run twice")
+            print(f"Job {job_id} done on container {ctr.cid}")
+        except Exception as e:
+            print(f"Error processing job {job_id}: {e}")
+        finally:
+            ctr.jobs.remove(job_id)
+            ctr.busy = bool(ctr.jobs)
+
+    async def _worker(self, ctr: Container):
+        """
+        Serve jobs on one guest until stopped, keeping up to the pool's depth
+        of them on its agent so the next one is there when the current ends
+        """
+        inflight = deque()
+        pend = None
+        while self._running or inflight or pend is not None:
+            try:
+                depth = self._pool.depth if ctr.protocol >= 2 else 1
+                # a pend is never cancelled: a job it takes off the queue would be lost
+                # nor queued behind a job learned to be long, another guest may free up first
+                long = any((e['expected_ms'] or 0) > Config.PIPELINE_MAX_MS for e in inflight)
+                if pend is None and self._running and ctr.ready and len(inflight) < depth and not long:
+                    pend = asyncio.ensure_future(self._queues[ctr.lane].pend(timeout=1))
+                waits = {f for f in (pend, inflight[0]['fut'] if inflight else None) if f is not None}
+                if waits:
+                    await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+
+                while inflight and inflight[0]['fut'].done():
+                    await self._finish(ctr, inflight.popleft())
+                    if DEBUG:
+                        print(f"pool: {self._pool.occupancy()}")
+                if pend is not None and pend.done():
+                    done, pend = pend, None
+                    job_id = done.result()
+                    if job_id is not None:
+                        if not ctr.ready or ctr.chan is None or ctr.chan.closed:
+                            # the connection went down with everything in flight on it
+                            while inflight:
+                                await self._finish(ctr, inflight.popleft())
+                            if not await self._restart(ctr):
+                                return
+                        entry = await self._submit(ctr, job_id)
+                        if entry is not None:
+                            inflight.append(entry)
+
+                if not ctr.ready and not inflight and self._running:
+                    if not await self._restart(ctr):
+                        return
+            except Exception as e:
+                # redis or the DB failing must not take the guest out of
+                # service; a job taken but not submitted goes back when its
+                # lease expires (_reaper)
+                print(f"[AsyncJobManager] Worker error on container {ctr.cid}: {e}")
+                await asyncio.sleep(1)
+
+    async def _restart(self, ctr: Container) -> bool:
+        try:
+            await asyncio.to_thread(self._pool.restart, ctr)
+            return True
+        except Exception as e:
+            print(f"Failed to restart container {ctr.cid}: {e}")
+            return False
+
+    async def _cancels(self):
+        """Pass the API's cancel requests for jobs running here on to their agents"""
+        while self._running:
+            await asyncio.sleep(Config.CANCEL_POLL_SEC)
+            jobs = {j: ctr for ctr in self._pool.containers() for j in ctr.jobs}
+            try:
+                for job_id in await self._db_call(self._c.cancel_requested, list(jobs)):
+                    ctr = jobs[job_id]
+                    if ctr.chan is not None:
+                        print(f"Cancelling job {job_id} on container {ctr.cid}")
+                        ctr.chan.cancel(job_id)
+            except Exception as e:
+                print(f"[AsyncJobManager] Cancel poll error: {e}")
+
+    async def _reaper(self):
+        """Extend our leases and re-queue expired ones, see IQueue.LeaseReaper"""
+        while self._running:
+            await asyncio.sleep(Config.REAP_INTERVAL_SEC)
+            try:
+                for lane, q in self._queues.items():
+                    for job_id in self._pool.inflight(lane):
+                        await q.extend(job_id)
+                    await q.reap()
+            except Exception as e:
+                print(f"[AsyncJobManager] Reaper error: {e}")
+
+    async def start(self):
+        """Boot the VM pool and connect to redis and the DB"""
+        await self._db_call(self._c.connect)
+        for q in self._queues.values():
+            await q.init()
+        await asyncio.to_thread(self._pool.start)
+        if self._relay:
+            self._relay.start(self._pool.containers(ready_only=False))
+        self._running = True
+        print("AsyncJobManager started successfully")
+
+    async def run(self):
+        """Run one worker per ready guest until stop()"""
+        print("AsyncJobManager running, waiting for jobs...")
+        # guests still down wait in _restart() until the pool brings them up
+        ctrs = self._pool.containers(ready_only=False)
+        self._tasks = [asyncio.create_task(self._worker(c)) for c in ctrs]
+        reaper = asyncio.create_task(self._reaper())
+        cancels = asyncio.create_task(self._cancels())
+        for ctr, res in zip(ctrs, await asyncio.gather(*self._tasks, return_exceptions=True)):
+            if isinstance(res, BaseException):
+                print(f"[AsyncJobManager] Worker for container {ctr.cid} died: {res!r}")
+        reaper.cancel()
+        cancels.cancel()
+
+    def queue_wait_stats(self) -> dict:
+        """Submit-to-dispatch latency over the recent jobs, in ms"""
+        return latency_stats(self._waits)
+
+    def occupancy(self) -> dict:
+        return self._pool.occupancy()
+
+    def stop(self):
+        """Ask the workers to return; in-flight jobs still finish"""
+        self._running = False
+
+    async def close(self):
+        self._running = False
+        await asyncio.to_thread(self._pool.stop)
+        if self._relay:
+            self._relay.stop()
+        for q in self._queues.values():
+            await q.close()
+        await self._db_call(self._c.disconnect)
+        self._db.shutdown(wait=True)
+        print("AsyncJobManager stopped")
+
+
+async def main():
+    jm = AsyncJobManager()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, jm.stop)
+    try:
+        await jm.start()
+        await jm.run()
+        print("\nShutting down...")
+    finally:
+        await jm.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Framed receive throughput: util.rec_sock / FrameReader vs the old rec_sock
+
+A sender thread pushes frames of 1 KB, 1 MB and 100 MB through a unix
+socketpair with send_sock; the receiver reads them with the old
+recv(4096)-and-join loop, the recv_into rec_sock, and a reused FrameReader.
+Reports MB/s (best of N) per size.
+
+    python3 bench/bench_framing.py [N]
+"""
+import os
+import sys
+import time
+import struct
+import socket
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from util import send_sock, rec_sock, FrameReader
+
+def rec_sock_old(sock) -> bytes:
+    """rec_sock before recv_into, kept here for comparison"""
+    raw_len = sock.recv(4)
+    if not raw_len or len(raw_len) < 4:
+        raise RuntimeError("Failed to receive length header")
+    msg_len = struct.unpack(">I", raw_len)[0]
+    chunks = []
+    bytes_received = 0
+    while bytes_received < msg_len:
+        chunk = sock.recv(min(msg_len - bytes_received, 4096))
+        if not chunk:
+            raise RuntimeError("Socket connection broken")
+        chunks.append(chunk)
+        bytes_received += len(chunk)
+    return b''.join(chunks)
+
+def throughput(receive, payload, frames):
+    """MB/s receiving `frames` frames of payload"""
+    a, b = socket.socketpair()
+    with a, b:
+        def send():
+            for _ in range(frames):
+                send_sock(a, payload)
+        t = threading.Thread(target=send)
+        t0 = time.perf_counter()
+        t.start()
+        for _ in range(frames):
+            receive(b)
+        dt = time.perf_counter() - t0
+        t.join()
+    return len(payload) * frames / dt / 1e6
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sizes = [("1 KB", 1024, 2000), ("1 MB", 1 << 20, 50), ("100 MB", 100 << 20, 1)]
+    reader = FrameReader(max_size=200 << 20)
+    receivers = [
+        ("old rec_sock", rec_sock_old),
+        ("rec_sock", lambda s: rec_sock(s, max_size=200 << 20)),
+        ("FrameReader", reader.read),
+    ]
+    for label, size, frames in sizes:
+        payload = os.urandom(size)
+        row = [f"{label:>7s}"]
+        for name, receive in receivers:
+            best = max(throughput(receive, payload, frames) for _ in range(n))
+            row.append(f"{name} {best:9.1f} MB/s")
+        print("  ".join(row))
+
+if __name__ == "__main__":
+    main()
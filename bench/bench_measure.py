@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Per-job harness overhead: measure.Harness vs execute.sh
+
+Runs the same trivial C program N times through each harness and reports
+wall time per job and overhead, i.e. wall time minus the compile and the
+program's own run time as each harness measured them. Run inside the guest
+(or anywhere execute.sh's tools are installed); the compile cache is
+bypassed by changing the source every iteration.
+
+    python3 bench/bench_measure.py [N] [EXECUTE_SH]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from measure import Harness
+from util import latency_stats
+
+SRC = '#include <stdio.h>\nint main(void) { puts("%d"); return 0; }\n'
+
+def job_dir(i):
+    d = tempfile.mkdtemp()
+    src = os.path.join(d, "source.c")
+    with open(src, 'w') as f:
+        f.write(SRC % i)
+    return d, src
+
+def run_harness(h, i):
+    d, src = job_dir(i)
+    try:
+        t0 = time.perf_counter()
+        res = h.run({'lang': 'c', 'compiler': 'gcc', 'opts': '-O2'}, d, src)
+        wall = (time.perf_counter() - t0) * 1000
+        inner = res['timing']['compile_ms'] + res['time']['elapsed_time_total_seconds'] * 1000
+        return wall, wall - inner
+    finally:
+        shutil.rmtree(d)
+
+def run_shell(script, i):
+    d, src = job_dir(i)
+    try:
+        t0 = time.perf_counter()
+        subprocess.run(["bash", script, d, src, 'c', 'gcc', '-O2'], capture_output=True)
+        wall = (time.perf_counter() - t0) * 1000
+        with open(os.path.join(d, "result.json"), 'r') as f:
+            res = json.load(f)
+        inner = res['compilation'].get('compile_ms', 0) + \
+            (res['time'].get('elapsed_time_total_seconds') or 0) * 1000
+        return wall, wall - inner
+    finally:
+        shutil.rmtree(d)
+
+def report(name, samples):
+    wall = latency_stats([s[0] / 1000 for s in samples])
+    over = latency_stats([s[1] / 1000 for s in samples])
+    print(f"{name:10s} wall mean {wall['mean_ms']:8.1f} ms p95 {wall['p95_ms']:8.1f} ms | "
+          f"overhead mean {over['mean_ms']:8.1f} ms p95 {over['p95_ms']:8.1f} ms")
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    script = sys.argv[2] if len(sys.argv) > 2 else \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "execute.sh")
+
+    h = Harness()
+    report("measure", [run_harness(h, i) for i in range(n)])
+    if shutil.which("jq"):
+        report("execute.sh", [run_shell(script, i + n) for i in range(n)])
+    else:
+        print("execute.sh  skipped, jq not installed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Queue backend throughput: list (RedisQueue) vs stream (StreamQueue)
+
+Pushes N job ids, then C consumer threads pend()+ack() until all are done.
+Uses its own queue name so it never touches the live "benchr" queue.
+
+    REDIS_URL=redis://localhost:6379/0 python3 bench/bench_queue.py [N] [C]
+"""
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from IQueue import make_queue
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+def bench(backend, n, consumers):
+    name = f"bench-{backend}"
+    q = make_queue(backend, name=name, redis_url=REDIS_URL, maxsize=n + 1)
+    q.clear()
+
+    t0 = time.perf_counter()
+    for i in range(n):
+        q.push(i + 1)
+    push_s = time.perf_counter() - t0
+
+    done = []
+    lock = threading.Lock()
+
+    def consume(idx):
+        cq = make_queue(backend, name=name, redis_url=REDIS_URL, owner=f"bench-{idx}")
+        while True:
+            with lock:
+                if len(done) >= n:
+                    return
+            job_id = cq.pend(timeout=0.1)
+            if job_id is None:
+                continue
+            cq.ack(job_id)
+            with lock:
+                done.append(job_id)
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(consumers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    pend_s = time.perf_counter() - t0
+
+    q.clear()
+    return n / push_s, n / pend_s
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    consumers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    print(f"{n} jobs, {consumers} consumers, {REDIS_URL}")
+    print(f"{'backend':<8} {'push/s':>12} {'pend+ack/s':>12}")
+    for backend in ("list", "stream"):
+        push_rate, pend_rate = bench(backend, n, consumers)
+        print(f"{backend:<8} {push_rate:>12.0f} {pend_rate:>12.0f}")
+
+if __name__ == "__main__":
+    main()
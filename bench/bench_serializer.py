@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Result serializers on the agent <-> manager channel
+
+Builds results shaped like the harness's (see res-tmpl.json) at a few
+sizes and reports, per serializer, serialize and deserialize time, the
+time to push the frame through a unix socketpair with send_sock/rec_sock
+(a stand-in for the vsock copy), and bytes on the wire.
+
+    python3 bench/bench_serializer.py [N] [OBJDUMP_TARGET]
+"""
+import os
+import sys
+import time
+import random
+import socket
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from util import serializers, send_sock, rec_sock
+
+def asm_text(target, limit):
+    """Real objdump text, so compression ratios are realistic"""
+    try:
+        out = subprocess.run(["objdump", "-d", target], capture_output=True).stdout
+        text = out.decode('utf-8', errors='replace')
+    except OSError:
+        text = ""
+    if not text:
+        text = "  401000:\t48 89 e5             \tmov    %rsp,%rbp\n" * (limit // 40)
+    return text[:limit]
+
+def result(asm, output_bytes, runs):
+    rng = random.Random(0)
+    lines = [f"{i} {rng.random():.6f}" for i in range(output_bytes // 12)]
+    vmstat = [{
+        'runnable_procs': 1, 'uninterruptible_sleeping_procs': 0, 'virtual_mem_used': 0,
+        'free_mem': 900000 + i, 'buffer_mem': 1234, 'cache_mem': 56789,
+        'inactive_mem': None, 'active_mem': None, 'swap_in': 0, 'swap_out': 0,
+        'blocks_in': 0, 'blocks_out': 0, 'interrupts': 400 + i, 'context_switches': 800 + i,
+        'user_time': 97, 'system_time': 3, 'idle_time': 0, 'io_wait_time': 0, 'stolen_time': 0
+    } for i in range(50)]
+    series = lambda: [rng.randrange(1 << 20) for _ in range(200)]
+    return {
+        'success': True,
+        'timestamp': "2025-10-25T12:34:56.789Z",
+        'exit_code': 0,
+        'output': "\n".join(lines),
+        'output_bytes': output_bytes,
+        'output_truncated': False,
+        'asm': asm,
+        'perf': {'cycles': 123456789, 'instructions': 234567890, 'cache_misses': 12345,
+                 'branch_misses': 678, 'ipc': 1.9},
+        'time': {'user_time': 0.1, 'system_time': 0.02, 'maximum_resident_set_size': 2048,
+                 'elapsed_time_total_seconds': 0.123},
+        'vmstat': vmstat,
+        'timeline': {k: series() for k in ('t_ms', 'rss_kb', 'cpu_ms', 'minor_faults')},
+        'runs': {'count': runs, 'samples': [
+            {'wall_ms': rng.uniform(10, 11), 'cycles': rng.randrange(10**8), 'instructions':
+             rng.randrange(10**8), 'exit_code': 0} for _ in range(runs)]},
+        'timing': {'compile_ms': 40.1, 'disasm_ms': 3.2, 'run_ms': 120.5, 'total_ms': 170.2}
+    }
+
+def transfer(frame):
+    a, b = socket.socketpair()
+    with a, b:
+        t = threading.Thread(target=send_sock, args=(a, frame))
+        t0 = time.perf_counter()
+        t.start()
+        rec_sock(b, max_size=len(frame))
+        dt = time.perf_counter() - t0
+        t.join()
+    return dt
+
+def bench(ser, res, n):
+    ser_s, wire_s, de_s = [], [], []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        frame = ser.serialize(res)
+        ser_s.append(time.perf_counter() - t0)
+        wire_s.append(transfer(frame))
+        t0 = time.perf_counter()
+        ser.deserialize(frame)
+        de_s.append(time.perf_counter() - t0)
+    best = lambda xs: min(xs) * 1000
+    return len(frame), best(ser_s), best(wire_s), best(de_s)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    target = sys.argv[2] if len(sys.argv) > 2 else sys.executable
+    cases = [
+        ("small", result(asm_text(target, 20_000), 100, 1)),
+        ("typical", result(asm_text(target, 400_000), 4_000, 10)),
+        ("large", result(asm_text(target, 4_000_000), 256 * 1024, 50)),
+    ]
+    for label, res in cases:
+        print(f"--- {label} result")
+        base = None
+        for name, ser in serializers().items():
+            size, s_ms, w_ms, d_ms = bench(ser, res, n)
+            base = base or size
+            print(f"{name:14s} {size:>10,d} B ({size / base:5.1%})  ser {s_ms:7.2f} ms  "
+                  f"wire {w_ms:7.2f} ms  deser {d_ms:7.2f} ms  total {s_ms + w_ms + d_ms:7.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+SqliteQueue throughput from multiple processes
+
+P producer processes push N jobs between them, then C consumer processes
+pend()+ack() until all are done. Runs against a scratch database.
+
+    python3 bench/bench_sqlite_queue.py [N] [P] [C]
+"""
+import os
+import sys
+import time
+import tempfile
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from IQueue import SqliteQueue
+
+def produce(path, ids):
+    q = SqliteQueue("bench", path=path, maxsize=len(ids) * 1000)
+    for i in ids:
+        q.push(i)
+
+def consume(path, done, n):
+    q = SqliteQueue("bench", path=path)
+    while True:
+        with done.get_lock():
+            if done.value >= n:
+                return
+        job_id = q.pend(timeout=0.1)
+        if job_id is None:
+            continue
+        q.ack(job_id)
+        with done.get_lock():
+            done.value += 1
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    producers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    consumers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "queue.db")
+        SqliteQueue("bench", path=path)   # create schema up front
+
+        procs = [mp.Process(target=produce, args=(path, range(p + 1, n + 1, producers)))
+                 for p in range(producers)]
+        t0 = time.perf_counter()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        push_s = time.perf_counter() - t0
+
+        done = mp.Value('i', 0)
+        procs = [mp.Process(target=consume, args=(path, done, n)) for _ in range(consumers)]
+        t0 = time.perf_counter()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        pend_s = time.perf_counter() - t0
+
+    print(f"{n} jobs, {producers} producers, {consumers} consumers")
+    print(f"push:     {n / push_s:10.0f} jobs/s")
+    print(f"pend+ack: {n / pend_s:10.0f} jobs/s")
+
+if __name__ == "__main__":
+    main()
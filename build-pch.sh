@@ -0,0 +1,97 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# build-pch.sh
+
+# Precompile <bits/stdc++.h> for every installed C++ compiler, standard and
+# optimization level execute.sh may be asked for. Runs at image build time
+# (see Dockerfile). Layout:
+#   $PCH_ROOT/<compiler>/<std>-<O>/bits/stdc++.h.gch   gcc, found through -I
+#   $PCH_ROOT/<compiler>/<std>-<O>/stdc++.h.pch        clang, -include-pch
+#   $PCH_ROOT/<compiler>/<std>-<O>/meta.json           compile time with/without
+# <std> is "default" when no -std flag is given.
+
+PCH_ROOT="${PCH_ROOT:-/opt/pch}"
+COMPILERS="${PCH_COMPILERS:-g++ g++-12 g++-11 clang++ clang++-17}"
+STDS="${PCH_STDS:-default c++17 c++20}"
+OLEVELS="${PCH_OLEVELS:--O2}"
+HEADER="bits/stdc++.h"
+
+TMP=$(mktemp -d)
+trap 'rm -rf "$TMP"' EXIT
+printf '#include <%s>\nint main() { return 0; }\n' "$HEADER" > "$TMP/probe.cpp"
+
+now_ms() {
+	echo $(( $(date +%s%N) / 1000000 ))
+}
+
+# Wall time of compiling the probe TU, best of 3
+probe_ms() {
+	local best="" t0 t
+	for _ in 1 2 3; do
+		t0=$(now_ms)
+		"$@" -c -o "$TMP/probe.o" "$TMP/probe.cpp"
+		t=$(( $(now_ms) - t0 ))
+		if [ -z "$best" ] || [ "$t" -lt "$best" ]; then best=$t; fi
+	done
+	echo "$best"
+}
+
+# Find the header the compiler would include, so clang can precompile it
+header_path() {
+	echo "#include <$HEADER>" | "$1" -x c++ -E -H - 2>&1 >/dev/null \
+		| awk -v h="$HEADER" 'index($0, h) && !found { sub(/^\.+ /, ""); print; found = 1 }'
+}
+
+for CXX in $COMPILERS; do
+	command -v "$CXX" &>/dev/null || { echo "[build-pch] $CXX not installed, skipping"; continue; }
+	HDR=$(header_path "$CXX")
+	if [ -z "$HDR" ]; then
+		echo "[build-pch] $CXX has no <$HEADER>, skipping"
+		continue
+	fi
+	VERSION=$("$CXX" --version | head -1)
+
+	for STD in $STDS; do
+		for O in $OLEVELS; do
+			FLAGS="$O"
+			[ "$STD" != "default" ] && FLAGS="-std=$STD $O"
+			OUT="$PCH_ROOT/$CXX/$STD$O"
+			mkdir -p "$OUT"
+
+			case "$CXX" in
+				clang*)
+					$CXX $FLAGS -x c++-header "$HDR" -o "$OUT/stdc++.h.pch"
+					USE=(-include-pch "$OUT/stdc++.h.pch")
+					;;
+				*)
+					mkdir -p "$OUT/bits"
+					$CXX $FLAGS -x c++-header "$HDR" -o "$OUT/bits/stdc++.h.gch"
+					USE=(-I"$OUT" -Winvalid-pch)
+					;;
+			esac
+
+			PLAIN_MS=$(probe_ms $CXX $FLAGS)
+			PCH_MS=$(probe_ms $CXX $FLAGS "${USE[@]}")
+
+			jq -n \
+				--arg compiler "$CXX" \
+				--arg version "$VERSION" \
+				--arg flags "$FLAGS" \
+				--arg header "$HEADER" \
+				--argjson plain_ms "$PLAIN_MS" \
+				--argjson pch_ms "$PCH_MS" \
+				'{
+					compiler: $compiler,
+					version: $version,
+					flags: $flags,
+					header: $header,
+					plain_ms: $plain_ms,
+					pch_ms: $pch_ms,
+					saving_ms: ($plain_ms - $pch_ms)
+				}' > "$OUT/meta.json"
+
+			echo "[build-pch] $CXX $FLAGS: ${PLAIN_MS} ms -> ${PCH_MS} ms"
+		done
+	done
+done
@@ -0,0 +1,243 @@
+import os
+import time
+import signal
+import subprocess
+from typing import List, Optional
+
+# cgroup.py
+
+# cgroup v2 isolation and accounting for the agent's jobs. setup() mounts
+# the unified hierarchy if init did not, enables the memory, pids and cpu
+# controllers and makes ROOT/benchr, under which every job phase (compile,
+# run) gets a cgroup of its own:
+#   memory.max       JOB_MEMORY_MAX_MB, swap off, the whole group OOM-killed
+#                    together (memory.oom.group) rather than the agent
+#   pids.max         fork bombs stop there
+#   cpu.max          optional quota, a fraction of one CPU
+# Processes are moved in by the agent while they are held before exec
+# (JobCgroup.add, see measure.Harness._spawn_held), so everything they start
+# is accounted and capped too. stats() reads
+# memory.peak (kernel >= 5.19, None before that), cpu.stat with throttling,
+# memory.events and pids.peak; close() kills whatever is left and removes
+# the group.
+#
+# The agent itself stays in the root cgroup with oom_score_adj -1000 and
+# job processes get JOB_OOM_SCORE_ADJ, so a job that exhausts the guest is
+# what gets killed and the VM can take the next job.
+
+ROOT = "/sys/fs/cgroup"
+PARENT = "benchr"
+CONTROLLERS = ("memory", "pids", "cpu")
+
+# 1024 MiB guest: leave room for the kernel, page cache and the agent
+JOB_MEMORY_MAX_MB = 768
+JOB_PIDS_MAX = 256
+CPU_PERIOD_US = 100000
+
+AGENT_OOM_SCORE_ADJ = -1000
+JOB_OOM_SCORE_ADJ = 500
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write(path: str, value: str):  # throws
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def _int(path: str) -> Optional[int]:
+    text = _read(path)
+    try:
+        return int(text) if text is not None else None
+    except ValueError:
+        # "max"
+        return None
+
+
+def _keyed(path: str) -> dict:
+    """Flat keyed file (cpu.stat, memory.events) as {key: int}"""
+    out = {}
+    for line in (_read(path) or "").splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            out[parts[0]] = int(parts[1])
+    return out
+
+
+def setup(root: str = ROOT) -> Optional['Manager']:
+    """
+    Prepare ROOT/PARENT for job cgroups
+
+    Returns:
+        Manager, or None if cgroup v2 cannot be used here
+    """
+    try:
+        if not os.path.exists(os.path.join(root, "cgroup.controllers")):
+            os.makedirs(root, exist_ok=True)
+            subprocess.run(["mount", "-t", "cgroup2", "none", root],
+                           check=True, capture_output=True)
+        available = (_read(os.path.join(root, "cgroup.controllers")) or "").split()
+        enabled = [c for c in CONTROLLERS if c in available]
+        control = " ".join("+" + c for c in enabled)
+        parent = os.path.join(root, PARENT)
+        if enabled:
+            _write(os.path.join(root, "cgroup.subtree_control"), control)
+        os.makedirs(parent, exist_ok=True)
+        if enabled:
+            _write(os.path.join(parent, "cgroup.subtree_control"), control)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"[cgroup] cgroup v2 unavailable, jobs run uncapped: {e}")
+        return None
+    print(f"[cgroup] Job cgroups under {parent}, controllers: {' '.join(enabled) or 'none'}")
+    return Manager(parent, enabled)
+
+
+def protect_agent() -> bool:
+    """Make the calling process the OOM killer's last choice"""
+    try:
+        _write("/proc/self/oom_score_adj", str(AGENT_OOM_SCORE_ADJ))
+        return True
+    except OSError as e:
+        print(f"[cgroup] Could not set oom_score_adj: {e}")
+        return False
+
+
+class Manager:
+    """Creates job cgroups under one parent"""
+
+    def __init__(self, path: str, controllers: List[str]):
+        self.path = path
+        self.controllers = controllers
+
+    def create(self, name: str, memory_max_mb: Optional[int] = JOB_MEMORY_MAX_MB,
+               pids_max: Optional[int] = JOB_PIDS_MAX,
+               cpu: Optional[float] = None) -> 'JobCgroup':  # throws
+        return JobCgroup(os.path.join(self.path, name), self.controllers,
+                         memory_max_mb, pids_max, cpu)
+
+
+class JobCgroup:
+    """One job phase's cgroup, with its limits applied"""
+
+    def __init__(self, path: str, controllers: List[str],
+                 memory_max_mb: Optional[int] = JOB_MEMORY_MAX_MB,
+                 pids_max: Optional[int] = JOB_PIDS_MAX,
+                 cpu: Optional[float] = None):  # throws
+        """
+        Args:
+            memory_max_mb: memory.max, None for no cap
+            pids_max: pids.max, None for no cap
+            cpu: cpu.max as a fraction of one CPU, None for no quota
+        """
+        self.path = path
+        if os.path.isdir(path):
+            # left over from a job the agent did not see finish
+            self._kill()
+            self._rmdir()
+        os.mkdir(path)
+        self.limits = {'memory_max_mb': None, 'pids_max': None, 'cpu': None}
+        if 'memory' in controllers and memory_max_mb:
+            self._set("memory.max", str(memory_max_mb * 1024 * 1024))
+            self._set("memory.swap.max", "0", optional=True)
+            self._set("memory.oom.group", "1", optional=True)
+            self.limits['memory_max_mb'] = memory_max_mb
+        if 'pids' in controllers and pids_max:
+            self._set("pids.max", str(pids_max))
+            self.limits['pids_max'] = pids_max
+        if 'cpu' in controllers and cpu:
+            self._set("cpu.max", f"{int(cpu * CPU_PERIOD_US)} {CPU_PERIOD_US}")
+            self.limits['cpu'] = cpu
+        # kept open for add()
+        self._procs = os.open(os.path.join(path, "cgroup.procs"),
+                              os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC, 0o644)
+
+    def _set(self, name: str, value: str, optional: bool = False):  # throws
+        path = os.path.join(self.path, name)
+        if optional and not os.path.exists(path):
+            return
+        _write(path, value)
+
+    def add(self, pid: int):  # throws
+        """Move a process held before exec into the cgroup, the OOM killer's first victim"""
+        os.write(self._procs, f"{pid}\n".encode())
+        try:
+            _write(f"/proc/{pid}/oom_score_adj", str(JOB_OOM_SCORE_ADJ))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        """
+        Accounting since the cgroup was made
+
+        Returns:
+            {'memory_peak_bytes', 'memory_current_bytes', 'oom_kills',
+             'memory_max_hits', 'cpu_usage_ms', 'cpu_user_ms', 'cpu_system_ms',
+             'nr_periods', 'nr_throttled', 'throttled_ms', 'pids_peak', 'limits'};
+            None where this kernel does not report it
+        """
+        cpu = _keyed(os.path.join(self.path, "cpu.stat"))
+        events = _keyed(os.path.join(self.path, "memory.events"))
+        ms = lambda key: round(cpu[key] / 1000, 3) if key in cpu else None
+        return {
+            'memory_peak_bytes': _int(os.path.join(self.path, "memory.peak")),
+            'memory_current_bytes': _int(os.path.join(self.path, "memory.current")),
+            'oom_kills': events.get('oom_kill'),
+            'memory_max_hits': events.get('max'),
+            'cpu_usage_ms': ms('usage_usec'),
+            'cpu_user_ms': ms('user_usec'),
+            'cpu_system_ms': ms('system_usec'),
+            'nr_periods': cpu.get('nr_periods'),
+            'nr_throttled': cpu.get('nr_throttled'),
+            'throttled_ms': ms('throttled_usec'),
+            'pids_peak': _int(os.path.join(self.path, "pids.peak")),
+            'limits': self.limits
+        }
+
+    def kill(self):
+        """Kill every process in the cgroup, which stays in place"""
+        self._kill()
+
+    def _kill(self):
+        if os.path.exists(os.path.join(self.path, "cgroup.kill")):
+            try:
+                _write(os.path.join(self.path, "cgroup.kill"), "1")
+                return
+            except OSError:
+                pass
+        for pid in (_read(os.path.join(self.path, "cgroup.procs")) or "").split():
+            # never 0 (our own process group) or anything else not a real pid
+            if not pid.isdigit() or int(pid) <= 0:
+                continue
+            try:
+                os.kill(int(pid), signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _rmdir(self):
+        # busy until the killed processes are gone
+        for _ in range(100):
+            try:
+                os.rmdir(self.path)
+                return
+            except FileNotFoundError:
+                return
+            except OSError as e:
+                if e.errno != 16:   # EBUSY
+                    print(f"[cgroup] Could not remove {self.path}: {e}")
+                    return
+                time.sleep(0.01)
+        print(f"[cgroup] {self.path} still busy, left in place")
+
+    def close(self):
+        """Kill anything left in the cgroup and remove it"""
+        if self._procs is not None:
+            os.close(self._procs)
+            self._procs = None
+        self._kill()
+        self._rmdir()
@@ -11,6 +11,8 @@ class Config:
     
     
     QUEUE_NAME = os.getenv('RATE_QUEUE_NAME', 'benchmark_jobs')
+    QUEUE_BACKEND = os.getenv('QUEUE_BACKEND', 'list')   # list | stream | sqlite
+    QUEUE_DB = os.getenv('QUEUE_DB', 'data/queue.db')   # sqlite backend only
     RATE_MAX_REQUESTS = int(os.getenv('RATE_MAX_REQUESTS', '100'))
     RATE_WINDOW_SEC = int(os.getenv('RATE_WINDOW_SEC', '3600'))
     RATE_MAX_QUEUE_SIZE = int(os.getenv('RATE_MAX_QUEUE_SIZE', '1000'))
@@ -21,6 +23,62 @@ class Config:
     FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     
     
+    # Repeated runs per job (submit "runs"/"warmup")
+    MAX_RUNS = int(os.getenv('MAX_RUNS', '50'))
+    MAX_WARMUP = int(os.getenv('MAX_WARMUP', '10'))
+    ADAPTIVE_BUDGET_SEC = float(os.getenv('ADAPTIVE_BUDGET_SEC', '10'))   # precision mode
+    MIN_COUNTER_INTERVAL_MS = int(os.getenv('MIN_COUNTER_INTERVAL_MS', '1'))  # counter timeline
+    
+    # Time limits (submit "time_limit_sec"), seconds. The run phase limit may
+    # go up to the caller's tier maximum; the tier comes from the API key
+    # (API_KEY_TIERS "key:tier,..."), DEFAULT_TIER without one.
+    TIME_LIMIT_TIERS = {t: float(sec) for t, sec in (
+        p.split(':') for p in os.getenv('TIME_LIMIT_TIERS', 'default:10,extended:60').split(','))}
+    API_KEY_TIERS = dict(p.split(':') for p in os.getenv('API_KEY_TIERS', '').split(',') if p)
+    DEFAULT_TIER = os.getenv('DEFAULT_TIER', 'default')
+    DEFAULT_TIME_LIMIT_SEC = float(os.getenv('DEFAULT_TIME_LIMIT_SEC', '10'))
+    COMPILE_TIME_LIMIT_SEC = float(os.getenv('COMPILE_TIME_LIMIT_SEC', '30'))
+    
+    # Per-phase cgroup limits inside the guest (cgroup.py), JOB_CPU_LIMIT as
+    # a fraction of one CPU, 0 for no quota
+    JOB_MEMORY_LIMIT_MB = int(os.getenv('JOB_MEMORY_LIMIT_MB', '768'))
+    JOB_PIDS_LIMIT = int(os.getenv('JOB_PIDS_LIMIT', '256'))
+    JOB_CPU_LIMIT = float(os.getenv('JOB_CPU_LIMIT', '0'))
+    
+    # Result cache, bump TOOLCHAIN_VERSION whenever the guest image changes
+    TOOLCHAIN_VERSION = os.getenv('TOOLCHAIN_VERSION', '1')
+    
+    # Job manager
+    MANAGER = os.getenv('MANAGER', 'sync')   # sync | async
+    POOL_SIZE = int(os.getenv('POOL_SIZE', '1'))
+    SNAPSHOT = os.getenv('SNAPSHOT', 'True').lower() == 'true'
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshot')
+    LEASE_SEC = int(os.getenv('LEASE_SEC', '120'))
+    REAP_INTERVAL_SEC = int(os.getenv('REAP_INTERVAL_SEC', '5'))
+    # offered to agents in this order, see util.negotiate and bench/bench_serializer.py
+    SERIALIZERS = os.getenv('SERIALIZERS', 'msgpack,json')
+    MAX_FRAME_BYTES = int(os.getenv('MAX_FRAME_BYTES', str(64 * 1024 * 1024)))   # agent -> manager
+    # jobs sent ahead to each protocol 2 agent, it queues them and runs one at a time
+    PIPELINE_DEPTH = int(os.getenv('PIPELINE_DEPTH', '2'))
+    # no job is queued behind one whose program has been learned to run longer
+    # (util.ProgramCosts); it waits for a free guest instead
+    PIPELINE_MAX_MS = float(os.getenv('PIPELINE_MAX_MS', '2000'))
+    CANCEL_POLL_SEC = float(os.getenv('CANCEL_POLL_SEC', '1'))
+    
+    # Compile-only jobs (/api/compiler/<id>/compile): COMPILE_LANE_SIZE guests
+    # on top of POOL_SIZE take them from their own queue so they never wait
+    # behind a benchmark, 0 to queue them with the benchmarks. The API waits
+    # up to COMPILE_WAIT_SEC for the job's completion notice (redis backends).
+    COMPILE_LANE_SIZE = int(os.getenv('COMPILE_LANE_SIZE', '1'))
+    COMPILE_QUEUE_NAME = os.getenv('COMPILE_QUEUE_NAME', 'benchr-compile')
+    COMPILE_WAIT_SEC = float(os.getenv('COMPILE_WAIT_SEC', '5'))
+    
+    # Program output: head+tail kept up to OUTPUT_LIMIT_BYTES; with
+    # STREAM_OUTPUT agents also send it live on OUTPUT_STREAM_PORT (vsock)
+    OUTPUT_LIMIT_BYTES = int(os.getenv('OUTPUT_LIMIT_BYTES', str(256 * 1024)))
+    STREAM_OUTPUT = os.getenv('STREAM_OUTPUT', 'False').lower() == 'true'
+    OUTPUT_STREAM_PORT = int(os.getenv('OUTPUT_STREAM_PORT', '5001'))
+    
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'logs/api.log')
     
@@ -3,10 +3,18 @@
 MOUNTDIR=mnt
 FS=deploy.ext4
 SZ=1M
+CACHE_FS=cache.ext4
+CACHE_SZ=512M
 
 mkdir $MOUNTDIR
 qemu-img create -f raw $FS "$SZ"
 mkfs.ext4 $FS
 mount $FS $MOUNTDIR
-cp agent-claude.py execute.sh config.json vm_config.json env.py util.py $MOUNTDIR
+cp agent.py execute.sh config.json vm_config.json env.py util.py measure.py stats.py perf_events.py sampler.py output.py protocol.py cgroup.py workspace.py disasm.py $MOUNTDIR
 umount $MOUNTDIR
+
+# compile cache drive, kept across deploys (guests mount it at /mnt/cache)
+if [ ! -f $CACHE_FS ]; then
+	qemu-img create -f raw $CACHE_FS "$CACHE_SZ"
+	mkfs.ext4 -q $CACHE_FS
+fi
@@ -0,0 +1,100 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# disasm.py
+
+# Function-scoped disassembly of native binaries for the measure harness.
+# `objdump -d` over a whole executable is mostly crt, PLT stubs and, for
+# static or libstdc++-heavy builds, megabytes of library code nobody looks
+# at. The harness compiles the translation unit to an object first and
+# keeps its defined text symbols (tu_symbols() over `nm` of the object);
+# the binary's own `nm -S` then gives their addresses, objdump only runs
+# over the address range they span (objdump_argv) and keep_functions()
+# drops whatever else lies in between. Names are demangled (-C), source lines are
+# interleaved (-S) when asked for and the binary has debug info, Intel
+# syntax (-M intel) on request.
+#
+# Anything missing along the way (no symbols, LTO objects nm cannot read)
+# falls back to the whole binary, scope 'full'.
+
+HEADER = re.compile(r'^([0-9a-f]+) <.*>:$')
+SECTION = "Disassembly of section "
+
+# nm types of code: text, and weak symbols (inline functions, templates)
+TEXT_TYPES = "tTwW"
+
+
+def tu_symbols(nm_out: str) -> List[str]:
+    """Defined code symbols from `nm --defined-only` of the object file"""
+    names = []
+    for line in nm_out.splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[1] in TEXT_TYPES:
+            names.append(parts[2])
+    return names
+
+
+def symbol_table(nm_out: str) -> Dict[str, List[Tuple[int, int]]]:
+    """`nm -S --defined-only` of the binary as {name: [(address, size)]}"""
+    table = {}
+    for line in nm_out.splitlines():
+        parts = line.split()
+        try:
+            if len(parts) == 4:
+                addr, size, name = int(parts[0], 16), int(parts[1], 16), parts[3]
+            elif len(parts) == 3:
+                addr, size, name = int(parts[0], 16), 0, parts[2]
+            else:
+                continue
+        except ValueError:
+            continue
+        table.setdefault(name, []).append((addr, size))
+    return table
+
+
+def locate(table: Dict[str, List[Tuple[int, int]]],
+           symbols: Iterable[str]) -> Tuple[Set[int], Optional[Tuple[int, int]]]:
+    """
+    Addresses of symbols in the binary
+
+    Returns:
+        (start addresses, (lo, hi) range covering them) or (set(), None)
+    """
+    addrs, lo, hi = set(), None, None
+    for name in symbols:
+        for addr, size in table.get(name, ()):
+            addrs.add(addr)
+            lo = addr if lo is None else min(lo, addr)
+            hi = addr + max(size, 1) if hi is None else max(hi, addr + max(size, 1))
+    return addrs, (lo, hi) if addrs else None
+
+
+def objdump_argv(binary: str, source: bool = False,
+                 span: Optional[Tuple[int, int]] = None, intel: bool = False) -> List[str]:
+    argv = ["objdump", "-d", "-C"]
+    if source:
+        argv.append("-S")
+    if intel:
+        argv += ["-M", "intel"]
+    if span is not None:
+        argv += [f"--start-address={span[0]:#x}", f"--stop-address={span[1]:#x}"]
+    return argv + [binary]
+
+
+def keep_functions(text: str, addrs: Set[int]) -> str:
+    """Keep objdump's preamble and the functions starting at addrs"""
+    out, section, keep, started = [], None, True, False
+    for line in text.splitlines():
+        if line.startswith(SECTION):
+            section, keep, started = line, False, True
+            continue
+        m = HEADER.match(line)
+        if m:
+            keep = int(m.group(1), 16) in addrs
+            if keep and section is not None:
+                # only sections with something left in them
+                out += [section, ""]
+                section = None
+        if keep or not started:
+            out.append(line)
+    return "\n".join(out) + "\n"
@@ -19,19 +19,254 @@ COMPILE_STDERR="$DIR/compile.stderr"
 EXIT_STATUS=0
 COMPILE_ERROR=255
 
+# Bytes of program output kept in result.json, see capped_output
+OUTPUT_LIMIT="${OUTPUT_LIMIT:-262144}"
+
+# Seconds per compile step and for the run. `timeout` runs the step in its
+# own process group and kills all of it; the phase is then written to
+# $TIMED_OUT for the agent, which reports the job as timed out.
+COMPILE_TIMEOUT="${COMPILE_TIMEOUT:-30}"
+RUN_TIMEOUT="${RUN_TIMEOUT:-10}"
+TIMED_OUT="$DIR/timed_out"
+
+# Compile cache on the third drive (see config.json), kept per pool member
+# across restarts. It is mounted for the compile step only (cache_mount,
+# cache_release) rather than in init.sh, so the boot snapshot holds no
+# filesystem state for it and the program never sees it. An entry is reused
+# only if it matches its sha256 under $CACHE_SUMS, a directory only root can
+# read (same as measure.py).
+CACHE_DEV=/dev/vdc
+CACHE_MNT=/mnt/cache
+CC_CACHE="$CACHE_MNT/cc"
+CACHE_SUMS="$CACHE_MNT/sums"
+CACHE_HIGH_PCT=90
+CACHE_HIT=false
+COMPILE_MS=0
+
+# Compilers, tools and the program run as nobody (measure.JOB_UID), in $DIR
+# handed over to it
+JOB_UID=65534
+AS_JOB=(setpriv --reuid="$JOB_UID" --regid="$JOB_UID" --clear-groups)
+
+# Precompiled <bits/stdc++.h> from build-pch.sh, see pch_select
+PCH_ROOT=/opt/pch
+PCH_FLAGS=""
+PCH_META=""
+PCH_USED=false
+
 export GCC_EXEC_PREFIX=/usr/lib/gcc/
 export PATH="/usr/lib/gcc/x86_64-linux-gnu/13:/usr/lib/gcc/x86_64-linux-gnu/12:/usr/lib/gcc/x86_64-linux-gnu/11:${PATH}"
 export LD_LIBRARY_PATH=/usr/lib/jvm/java-11-openjdk-amd64/lib:/usr/lib/jvm/java-17-openjdk-amd64/lib:/usr/lib/jvm/java-21-openjdk-amd64/lib
 
 # Clean previous runs
-rm -f "$BIN" "$OUT_RAW" "$PERF_STDERR" "$TIME_STDERR" "$VMSTAT_RAW" "$ASM_OUT" "$RESULT_JSON" "$COMPILE_STDERR"
+rm -f "$BIN" "$OUT_RAW" "$PERF_STDERR" "$TIME_STDERR" "$VMSTAT_RAW" "$ASM_OUT" "$RESULT_JSON" "$COMPILE_STDERR" "$TIMED_OUT"
+chown "$JOB_UID:$JOB_UID" "$DIR"
+
+# Program output as a JSON string, at most OUTPUT_LIMIT bytes of it: the
+# head and tail halves with a marker in between (same as output.py)
+capped_output() {
+	OUTPUT_BYTES=$(stat -c%s "$OUT_RAW" 2>/dev/null || echo 0)
+	OUTPUT_TRUNCATED=false
+	if [ "$OUTPUT_BYTES" -le "$OUTPUT_LIMIT" ]; then
+		PROGRAM_OUTPUT=$(jq -Rs . < "$OUT_RAW" 2>/dev/null || echo '""')
+		return
+	fi
+	OUTPUT_TRUNCATED=true
+	local half=$(( OUTPUT_LIMIT / 2 ))
+	PROGRAM_OUTPUT=$({
+		head -c "$half" "$OUT_RAW"
+		printf '\n... [%d bytes truncated] ...\n' $(( OUTPUT_BYTES - 2 * half ))
+		tail -c "$half" "$OUT_RAW"
+	} | jq -Rs . 2>/dev/null || echo '""')
+}
 
 run_and_capture() {
 	EXIT_STATUS=0
-	perf stat -e cycles,instructions,cache-misses,branch-misses \
+	timeout -k 1 "$RUN_TIMEOUT" \
+		perf stat -e cycles,instructions,cache-misses,branch-misses \
 		-o "$PERF_STDERR" \
 		/usr/bin/time -v -o "$TIME_STDERR" \
-		"$@" > "$OUT_RAW" 2>&1 || EXIT_STATUS=$?
+		"${AS_JOB[@]}" "$@" > "$OUT_RAW" 2>&1 || EXIT_STATUS=$?
+	if [ "$EXIT_STATUS" -eq 124 ]; then
+		echo run > "$TIMED_OUT"
+	fi
+}
+
+# Run a compile step under COMPILE_TIMEOUT
+compile_step() {
+	local status=0
+	timeout -k 1 "$COMPILE_TIMEOUT" "${AS_JOB[@]}" "$@" || status=$?
+	if [ "$status" -eq 124 ]; then
+		echo compile > "$TIMED_OUT"
+	fi
+	return $status
+}
+
+now_ms() {
+	echo $(( $(date +%s%N) / 1000000 ))
+}
+
+cache_mount() {
+	mountpoint -q "$CACHE_MNT" && return 0
+	[ -b "$CACHE_DEV" ] || return 1
+	mkdir -p "$CACHE_MNT"
+	mount -o rw,nosuid,nodev,noexec,noatime "$CACHE_DEV" "$CACHE_MNT" 2>/dev/null
+}
+
+# Unmount the cache before anything past the compile step runs; a busy
+# mount is detached now and finished by the kernel once its last user goes
+cache_release() {
+	mountpoint -q "$CACHE_MNT" || return 0
+	umount "$CACHE_MNT" 2>/dev/null || umount -l "$CACHE_MNT" 2>/dev/null ||
+		echo "[execute.sh] Warning: could not unmount the compile cache"
+}
+
+# sha256 of an entry's binary, .stderr and .syms (measure.py's _cache_digest)
+cache_digest() {
+	{
+		cat "$1"
+		cat "$1.stderr" "$1.syms" 2>/dev/null || true
+	} | sha256sum | cut -d' ' -f1
+}
+
+# Whether entry $1 still matches the sum stored when it was made
+cache_verified() {
+	local want
+	want=$(cat "$CACHE_SUMS/$(basename "$1")" 2>/dev/null) || return 1
+	[ -n "$want" ] && [ "$want" = "$(cache_digest "$1" 2>/dev/null)" ]
+}
+
+cache_drop() {
+	rm -f "$1" "$1.stderr" "$1.syms" "$CACHE_SUMS/$(basename "$1")"
+}
+
+# Drop the least recently used quarter of the entries once the drive fills up
+cache_trim() {
+	local used n
+	used=$(df --output=pcent "$CACHE_MNT" | tail -1 | tr -dc 0-9)
+	[ "${used:-0}" -lt "$CACHE_HIGH_PCT" ] && return 0
+	n=$(find "$CC_CACHE" -type f ! -name '*.stderr' ! -name '*.syms' | wc -l)
+	find "$CC_CACHE" -type f ! -name '*.stderr' ! -name '*.syms' -printf '%T@ %p\n' \
+		| sort -n | head -n $(( n / 4 + 1 )) | cut -d' ' -f2- \
+		| while read -r f; do cache_drop "$f"; done
+}
+
+# Key: compiler identity + flags + preprocessed source. Both preprocessing and
+# the build run from $DIR on the relative file name, so per-job temp paths do
+# not leak into the key or into __FILE__.
+cache_key() {
+	{
+		$COMPILER --version
+		echo "$LANG $OPTS"
+		(cd "$DIR" && "${AS_JOB[@]}" $COMPILER $OPTS -E "$(basename "$SRC")")
+	} 2>/dev/null | sha256sum | cut -d' ' -f1
+}
+
+# Pick the PCH built with this job's compiler, -std and -O. It is only used
+# when <bits/stdc++.h> is the first thing in the source (a PCH cannot follow
+# other code, and clang's -include-pch always goes first) and every other
+# flag is a warning flag, since anything else may change what the header
+# means. Sets PCH_FLAGS and PCH_META.
+pch_select() {
+	local std="default" olvl="-O0" opt dir
+	PCH_FLAGS=""
+	PCH_META=""
+	[ "$LANG" = "cpp" ] || return 0
+
+	awk '
+		/^[[:space:]]*(\/\/.*)?$/ { next }
+		{ exit !($0 ~ /^[[:space:]]*#[[:space:]]*include[[:space:]]*<bits\/stdc\+\+\.h>/) }
+	' "$SRC" || return 0
+
+	for opt in $OPTS; do
+		case "$opt" in
+			-O) olvl="-O1" ;;
+			-O*) olvl="$opt" ;;
+			-std=*) std="${opt#-std=}" ;;
+			-W*|-w) ;;
+			*) return 0 ;;
+		esac
+	done
+
+	dir="$PCH_ROOT/$(basename "$COMPILER")/$std$olvl"
+	[ -f "$dir/meta.json" ] || return 0
+	case "$COMPILER" in
+		*clang*) PCH_FLAGS="-include-pch $dir/stdc++.h.pch" ;;
+		*) PCH_FLAGS="-I$dir -Winvalid-pch" ;;
+	esac
+	PCH_META="$dir/meta.json"
+}
+
+# Compile $SRC into $BIN with the PCH if one fits, retrying without it if
+# clang rejects the PCH. Sets PCH_USED.
+compile_src() {
+	local status=0
+	PCH_USED=false
+	pch_select
+	(cd "$DIR" && compile_step $COMPILER $OPTS $PCH_FLAGS -o "$(basename "$BIN")" "$(basename "$SRC")") \
+		2>"$COMPILE_STDERR" || status=$?
+	[ -z "$PCH_FLAGS" ] && return $status
+
+	if [ "$status" -ne 0 ] && grep -qi "precompiled\|\.pch" "$COMPILE_STDERR"; then
+		echo "[execute.sh] PCH rejected, compiling without it"
+		status=0
+		(cd "$DIR" && compile_step $COMPILER $OPTS -o "$(basename "$BIN")" "$(basename "$SRC")") \
+			2>"$COMPILE_STDERR" || status=$?
+		return $status
+	fi
+	# gcc falls back to the header by itself and says so with -Winvalid-pch
+	grep -q "stdc++.h.gch" "$COMPILE_STDERR" || PCH_USED=true
+	return $status
+}
+
+# Estimated compile time the PCH saved, from build-pch.sh's measurement
+pch_saving_ms() {
+	if [ "$PCH_USED" = true ]; then
+		jq '.saving_ms' "$PCH_META" 2>/dev/null || echo 0
+	else
+		echo 0
+	fi
+}
+
+# Build $BIN, from the cache when possible. Sets CACHE_HIT and COMPILE_MS.
+compile_cached() {
+	local t0 key="" entry="" status=0
+	t0=$(now_ms)
+	CACHE_HIT=false
+
+	if cache_mount; then
+		key=$(cache_key) || key=""
+		entry="$CC_CACHE/${key:0:2}/$key"
+	fi
+
+	if [ -n "$key" ] && [ -f "$entry" ] && ! cache_verified "$entry"; then
+		echo "[execute.sh] Compile cache entry $key does not match its sum, rebuilding it"
+		cache_drop "$entry"
+	fi
+
+	if [ -n "$key" ] && [ -f "$entry" ] && cp "$entry" "$BIN" 2>/dev/null; then
+		cp "$entry.stderr" "$COMPILE_STDERR" 2>/dev/null || : > "$COMPILE_STDERR"
+		touch "$entry" || true
+		CACHE_HIT=true
+	else
+		compile_src || status=$?
+		if [ "$status" -eq 0 ] && [ -n "$key" ]; then
+			{
+				cache_drop "$entry" &&
+				mkdir -p "$(dirname "$entry")" &&
+				mkdir -p -m 700 "$CACHE_SUMS" &&
+				cp "$COMPILE_STDERR" "$entry.stderr" &&
+				cp "$BIN" "$entry.tmp.$$" &&
+				mv "$entry.tmp.$$" "$entry" &&
+				cache_digest "$entry" > "$CACHE_SUMS/$key" &&
+				cache_trim
+			} 2>/dev/null || echo "[execute.sh] Warning: could not store compile cache entry"
+		fi
+	fi
+	cache_release
+
+	COMPILE_MS=$(( $(now_ms) - t0 ))
+	return $status
 }
 
 case "$LANG" in
@@ -39,23 +274,26 @@ case "$LANG" in
 		echo "[execute.sh] Compiling $LANG code with $COMPILER $OPTS..."
 
 		# --- compile ---
-		if ! $COMPILER $OPTS -o "$BIN" "$SRC" 2>"$COMPILE_STDERR"; then
+		if ! compile_cached; then
 			COMPILE_ERR=$(cat "$COMPILE_STDERR" 2>/dev/null || echo "Unknown compilation error")
 			jq -n \
 				--arg err "$COMPILE_ERR" \
+				--argjson compile_ms "$COMPILE_MS" \
 				'{
 					success: false,
 					error: "compilation failed",
 					compilation: {
 						success: false,
 						error: "compilation failed",
-						details: $err
+						details: $err,
+						cache_hit: false,
+						compile_ms: $compile_ms
 					}
 				}' > "$RESULT_JSON"
 			exit $COMPILE_ERROR
 		fi
 
-		echo "[execute.sh] Compilation successful"
+		echo "[execute.sh] Compilation successful (cache hit: $CACHE_HIT, $COMPILE_MS ms)"
 
 		# --- disassemble ---
 		objdump -d "$BIN" > "$ASM_OUT" 2>&1 || echo "/* disassembly failed */" > "$ASM_OUT"
@@ -89,11 +327,7 @@ case "$LANG" in
 		fi
 
 		# --- escape output safely ---
-		if [ -f "$OUT_RAW" ]; then
-			PROGRAM_OUTPUT=$(cat "$OUT_RAW" | jq -Rs . 2>/dev/null || echo '""')
-		else
-			PROGRAM_OUTPUT='""'
-		fi
+		capped_output
 
 		if [ -f "$ASM_OUT" ]; then
 			ASM_CONTENT=$(cat "$ASM_OUT" | jq -Rs . 2>/dev/null || echo '""')
@@ -110,6 +344,8 @@ case "$LANG" in
 			--argjson time "$TIME_JSON" \
 			--argjson vmstat "$VMSTAT_JSON" \
 			--argjson output "$PROGRAM_OUTPUT" \
+			--argjson output_bytes "$OUTPUT_BYTES" \
+			--argjson output_truncated "$OUTPUT_TRUNCATED" \
 			--argjson asm "$ASM_CONTENT" \
 			--arg exit_code "$EXIT_STATUS" \
 			--arg timestamp "$TIMESTAMP" \
@@ -117,11 +353,17 @@ case "$LANG" in
 			--arg compiler "$COMPILER" \
 			--arg opts "$OPTS" \
 			--arg src_size "$SRC_SIZE" \
+			--argjson cache_hit "$CACHE_HIT" \
+			--argjson compile_ms "$COMPILE_MS" \
+			--argjson pch_used "$PCH_USED" \
+			--argjson pch_saving_ms "$(pch_saving_ms)" \
 			'{
 				success: true,
 				timestamp: $timestamp,
 				exit_code: ($exit_code | tonumber),
 				output: $output,
+				output_bytes: $output_bytes,
+				output_truncated: $output_truncated,
 				asm: $asm,
 				perf: $perf,
 				time: $time,
@@ -129,13 +371,20 @@ case "$LANG" in
 				compilation: {
 					success: true,
 					error: null,
-					details: null
+					details: null,
+					cache_hit: $cache_hit,
+					compile_ms: $compile_ms
 				},
 				metadata: {
 					language: $lang,
 					compiler: $compiler,
 					opts: $opts,
-					source_size_bytes: ($src_size | tonumber)
+					source_size_bytes: ($src_size | tonumber),
+					pch: {
+						used: $pch_used,
+						header: (if $pch_used then "bits/stdc++.h" else null end),
+						est_saving_ms: $pch_saving_ms
+					}
 				}
 			}' > "$RESULT_JSON"
 		;;
@@ -144,7 +393,7 @@ case "$LANG" in
 		echo "[execute.sh] Running Python code..."
 
 		# Python has no compilation, but we can check syntax
-		if ! python3 -m py_compile "$SRC" 2>"$COMPILE_STDERR"; then
+		if ! compile_step python3 -m py_compile "$SRC" 2>"$COMPILE_STDERR"; then
 			COMPILE_ERR=$(cat "$COMPILE_STDERR" 2>/dev/null || echo "Syntax error")
 			jq -n \
 				--arg err "$COMPILE_ERR" \
@@ -193,7 +442,7 @@ case "$LANG" in
 		fi
 
 		# --- escape output safely ---
-		PROGRAM_OUTPUT=$(cat "$OUT_RAW" 2>/dev/null | jq -Rs . || echo '""')
+		capped_output
 		ASM_CONTENT=$(cat "$ASM_OUT" 2>/dev/null | jq -Rs . || echo '""')
 
 		TIMESTAMP=$(date -u +"%Y-%m-%dT%H:%M:%S.%3NZ")
@@ -204,6 +453,8 @@ case "$LANG" in
 			--argjson time "$TIME_JSON" \
 			--argjson vmstat "$VMSTAT_JSON" \
 			--argjson output "$PROGRAM_OUTPUT" \
+			--argjson output_bytes "$OUTPUT_BYTES" \
+			--argjson output_truncated "$OUTPUT_TRUNCATED" \
 			--argjson asm "$ASM_CONTENT" \
 			--arg exit_code "$EXIT_STATUS" \
 			--arg timestamp "$TIMESTAMP" \
@@ -213,6 +464,8 @@ case "$LANG" in
 				timestamp: $timestamp,
 				exit_code: ($exit_code | tonumber),
 				output: $output,
+				output_bytes: $output_bytes,
+				output_truncated: $output_truncated,
 				asm: $asm,
 				perf: $perf,
 				time: $time,
@@ -239,7 +492,7 @@ case "$LANG" in
 		CLASS_FILE="$DIR/$CLASS_NAME.class"
 
 		# --- compile ---
-		if ! javac $OPTS -d "$DIR" "$SRC" 2>"$COMPILE_STDERR"; then
+		if ! compile_step javac $OPTS -d "$DIR" "$SRC" 2>"$COMPILE_STDERR"; then
 			COMPILE_ERR=$(cat "$COMPILE_STDERR" 2>/dev/null || echo "Compilation error")
 			jq -n \
 				--arg err "$COMPILE_ERR" \
@@ -289,7 +542,7 @@ case "$LANG" in
 		fi
 
 		# --- escape output safely ---
-		PROGRAM_OUTPUT=$(cat "$OUT_RAW" 2>/dev/null | jq -Rs . || echo '""')
+		capped_output
 		ASM_CONTENT=$(cat "$ASM_OUT" 2>/dev/null | jq -Rs . || echo '""')
 
 		TIMESTAMP=$(date -u +"%Y-%m-%dT%H:%M:%S.%3NZ")
@@ -300,6 +553,8 @@ case "$LANG" in
 			--argjson time "$TIME_JSON" \
 			--argjson vmstat "$VMSTAT_JSON" \
 			--argjson output "$PROGRAM_OUTPUT" \
+			--argjson output_bytes "$OUTPUT_BYTES" \
+			--argjson output_truncated "$OUTPUT_TRUNCATED" \
 			--argjson asm "$ASM_CONTENT" \
 			--arg exit_code "$EXIT_STATUS" \
 			--arg timestamp "$TIMESTAMP" \
@@ -310,6 +565,8 @@ case "$LANG" in
 				timestamp: $timestamp,
 				exit_code: ($exit_code | tonumber),
 				output: $output,
+				output_bytes: $output_bytes,
+				output_truncated: $output_truncated,
 				asm: $asm,
 				perf: $perf,
 				time: $time,
@@ -0,0 +1,70 @@
+import json
+import socket
+import http.client
+from typing import Optional
+
+# fc_api.py
+
+# Minimal client for the Firecracker API socket (HTTP over a unix socket).
+# Only the calls VmPool needs for snapshot/restore are wrapped.
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 5):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class FcApi:
+    """Firecracker API client bound to one VM's api socket"""
+
+    def __init__(self, api_sock: str, timeout: float = 30):
+        self.api_sock = api_sock
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, body: Optional[dict] = None):  # throws
+        conn = UnixHTTPConnection(self.api_sock, timeout=self.timeout)
+        try:
+            conn.request(
+                method,
+                path,
+                body=json.dumps(body) if body is not None else None,
+                headers={'Content-Type': 'application/json', 'Accept': 'application/json'}
+            )
+            res = conn.getresponse()
+            data = res.read()
+        finally:
+            conn.close()
+
+        if res.status >= 300:
+            raise RuntimeError(f"Firecracker API {method} {path} failed: {res.status} {data.decode(errors='replace')}")
+        return json.loads(data) if data else None
+
+    def pause(self):
+        self._request("PATCH", "/vm", {"state": "Paused"})
+
+    def resume(self):
+        self._request("PATCH", "/vm", {"state": "Resumed"})
+
+    def create_snapshot(self, snapshot_path: str, mem_path: str):
+        """Full snapshot, the VM must be paused"""
+        self._request("PUT", "/snapshot/create", {
+            "snapshot_type": "Full",
+            "snapshot_path": snapshot_path,
+            "mem_file_path": mem_path
+        })
+
+    def load_snapshot(self, snapshot_path: str, mem_path: str, resume: bool = True):
+        """Load a snapshot into a freshly started firecracker (no config)"""
+        self._request("PUT", "/snapshot/load", {
+            "snapshot_path": snapshot_path,
+            "mem_backend": {
+                "backend_type": "File",
+                "backend_path": mem_path
+            },
+            "resume_vm": resume
+        })
@@ -77,6 +77,8 @@ interface CompilationInfo {
   success: boolean;
   error: string | null;
   details: string;
+  cache_hit?: boolean;
+  compile_ms?: number;
 }
 
 // Result metadata
@@ -0,0 +1,110 @@
+import re
+from typing import List, Optional
+
+# godbolt.py
+
+# Compiler Explorer's compile call (POST /api/compiler/<id>/compile, the
+# request front/app/services/godbolt.service.ts sends to godbolt.org) served
+# by compile-only jobs on our own guests. The request maps onto a job:
+#   source, lang ("c" / "c++")          code, lang
+#   <id>                                guest_compiler(): our compiler names
+#                                       as they are, other ids by family
+#   options.userArguments               opts
+#   options.filters.intel               asm_syntax
+# and the job's result onto Compiler Explorer's response (response()):
+# {code, stdout, stderr, asm: [{text}]}. The assembly is objdump's of the
+# linked binary, scoped to the source's own functions and always demangled;
+# without filters.binary the addresses and opcode bytes are left out and
+# function headers become labels, which is close to what the compiler's
+# own output looks like. Nothing is executed, filters.execute is ignored.
+# A compile still running when the API stops waiting gets pending(), a
+# response in the same shape with code -1 asking for the request again.
+
+LANGS = {'c': 'c', 'c++': 'cpp', 'cpp': 'cpp'}
+GUEST_COMPILERS = ('gcc', 'g++', 'clang', 'clang++')
+GCC = {'c': 'gcc', 'cpp': 'g++'}
+CLANG = {'c': 'clang', 'cpp': 'clang++'}
+
+HEADER = re.compile(r'^[0-9a-f]+ <(.*)>:$')
+SECTION = "Disassembly of section "
+
+
+def guest_compiler(compiler_id: str, lang: str) -> str:
+    """Guest toolchain for a Compiler Explorer compiler id (g132, clang1701, ...)"""
+    if compiler_id in GUEST_COMPILERS:
+        return compiler_id
+    return CLANG[lang] if 'clang' in compiler_id else GCC[lang]
+
+
+def _trim(line: str) -> str:
+    indent = "  " if line[:1].isspace() else ""
+    return indent + " ".join(line.split())
+
+
+def asm_lines(text: str, filters: dict) -> List[str]:
+    """objdump output as Compiler Explorer would show it under filters"""
+    binary = filters.get('binary', False)
+    out, started = [], False
+    for line in text.splitlines():
+        m = HEADER.match(line)
+        if m:
+            started = True
+            if out and out[-1]:
+                out.append("")
+            out.append(line if binary else f"{m.group(1)}:")
+            continue
+        if not started or not line.strip() or line.startswith(SECTION):
+            # objdump's preamble, section headers and spacing
+            continue
+        parts = line.split('\t')
+        if parts[0].rstrip().endswith(':') and len(parts) >= 2:
+            if binary:
+                out.append(line)
+            elif len(parts) >= 3:
+                out.append("        " + '\t'.join(parts[2:]))
+            # else the opcode bytes of a long instruction, continued
+            continue
+        # source lines (asm_source)
+        out.append(line)
+    if filters.get('trim'):
+        out = [_trim(line) for line in out]
+    return out
+
+
+def response(result: dict, filters: Optional[dict] = None, skip_asm: bool = False,
+             extra: Optional[dict] = None) -> dict:
+    """Compiler Explorer compile response for a compile-only job's result"""
+    filters = filters or {}
+    compilation = result.get('compilation') or {}
+    ok = bool(result.get('success')) and compilation.get('success', True)
+    if ok:
+        # warnings
+        stderr = compilation.get('details') or ""
+    elif result.get('timed_out'):
+        stderr = f"Compilation timed out after {result.get('timeout', {}).get('limit_sec', '?')} s"
+    else:
+        stderr = compilation.get('details') or result.get('error') or "Compilation failed"
+    if not ok:
+        asm = ["<Compilation failed>"]
+    elif skip_asm:
+        asm = []
+    else:
+        asm = asm_lines(result.get('asm') or "", filters)
+    res = {
+        'code': 0 if ok else 1,
+        'stdout': [],
+        'stderr': [{'text': line} for line in stderr.splitlines()],
+        'asm': [{'text': line} for line in asm]
+    }
+    if extra:
+        res['benchr'] = extra
+    return res
+
+
+def pending(extra: Optional[dict] = None) -> dict:
+    """Compiler Explorer compile response for a job that has not finished yet"""
+    text = "<Compilation still running, send the request again>"
+    res = {'code': -1, 'stdout': [], 'stderr': [{'text': text}], 'asm': [{'text': text}]}
+    if extra:
+        res['benchr'] = extra
+    return res
@@ -1,18 +1,29 @@
-from models import db, Job, JobMetrics
+from models import db, Job, JobMetrics, JobTimeline, JobAsm
 from util import ISerializer, JsonSerializer
-from typing import Optional
+from config import Config
+from perf_events import derived
+import result_cache
+from typing import List, Optional
 import json
 import datetime
+import redis
 
 # job_cache.py
 
 # tight coupling to peewee
 # job_cache.py
+
+# finished jobs are announced on this redis channel, the message is the
+# job's status (for API requests waiting on a compile, see api.py)
+DONE_CHANNEL = "benchr:done:{}"
+
 class JobCache:
     """Simple job cache"""
     
-    def __init__(self):
+    def __init__(self, redis_url: Optional[str] = None):
         self.connected = False
+        # announces finished jobs when given
+        self._redis = redis.Redis.from_url(redis_url) if redis_url else None
     
     def connect(self):
         if not self.connected:
@@ -33,10 +44,28 @@ class JobCache:
             job = Job.get_by_id(job_id)
             print(f"job_cache: get_by_id {job_id}")
             return {
+                'job_id': job.id,
                 'code': job.code,
                 'lang': job.lang,
                 'compiler': job.compiler,
-                'opts': job.opts
+                'opts': job.opts,
+                'runs': job.runs,
+                'warmup': job.warmup,
+                'precision': job.precision,
+                'precision_metric': job.precision_metric,
+                'time_budget_sec': Config.ADAPTIVE_BUDGET_SEC,
+                'counter_interval_ms': job.counter_interval_ms,
+                'asm_source': job.asm_source,
+                'asm_scope': job.asm_scope,
+                'asm_syntax': job.asm_syntax,
+                'compile_only': job.compile_only,
+                'time_limit_sec': job.time_limit_sec or Config.DEFAULT_TIME_LIMIT_SEC,
+                'compile_time_limit_sec': Config.COMPILE_TIME_LIMIT_SEC,
+                'memory_limit_mb': Config.JOB_MEMORY_LIMIT_MB,
+                'pids_limit': Config.JOB_PIDS_LIMIT,
+                'cpu_limit': Config.JOB_CPU_LIMIT or None,
+                'output_limit': Config.OUTPUT_LIMIT_BYTES,
+                'stream_port': Config.OUTPUT_STREAM_PORT if Config.STREAM_OUTPUT else None
             }
         except:
             return None
@@ -45,44 +74,158 @@ class JobCache:
         """Update job with result"""
         try:
             job = Job.get_by_id(job_id)
+            # stored packed in its own table, not in the result JSON
+            series = result.pop('counter_timeline', None)
+            # a full disassembly is kept for the job it was fetched for
+            full_asm = result.pop('asm', None) if job.asm_of_id is not None else None
             job.set_result(result)
-            job.status = 'completed' if result.get('success') else 'failed'
+            if result.get('cancelled'):
+                job.status = 'cancelled'
+            elif result.get('timed_out'):
+                job.status = 'timeout'
+            elif job.compile_only and result.get('compilation'):
+                # a compiler error is as much an answer to a compile-only job
+                job.status = 'completed'
+            else:
+                job.status = 'completed' if result.get('success') else 'failed'
             job.completed_at = datetime.datetime.now()
             job.save()
+            result_cache.settle(job)
+            self._announce(job)
             
-            if result.get('success'):
+            if full_asm is not None and result.get('success'):
+                with db.atomic():
+                    JobAsm.delete().where(JobAsm.job == job.asm_of_id).execute()
+                    asm = JobAsm(job=job.asm_of_id)
+                    asm.set_text(full_asm)
+                    asm.save(force_insert=True)
+            if result.get('success') and not job.compile_only:
                 self._save_metrics(job, result)
+                if series:
+                    timeline = JobTimeline(job=job)
+                    timeline.set_series(series)
+                    timeline.save()
         except:
             pass
     
     def _save_metrics(self, job: Job, result: dict):
-        """Save metrics"""
+        """Save metrics, medians and their spread when the job ran repeatedly"""
         perf = result.get('perf', {})
         time_data = result.get('time', {})
         
         cycles = perf.get('cycles')
         instructions = perf.get('instructions')
-        ipc = instructions / cycles if cycles and cycles > 0 else None
         
-        exec_time = time_data.get('elapsed_time_seconds')
+        # elapsed_time_seconds is only the seconds field of h:mm:ss
+        exec_time = time_data.get('elapsed_time_total_seconds')
+        exec_time_ms = exec_time * 1000 if exec_time else None
+        
+        extra = {}
+        runs = result.get('runs')
+        if runs:
+            st = runs.get('stats', {})
+            wall = st.get('wall_ms') or {}
+            cyc = st.get('cycles') or {}
+            ins = st.get('instructions') or {}
+            cycles = cyc.get('median', cycles)
+            instructions = ins.get('median', instructions)
+            exec_time_ms = wall.get('median', exec_time_ms)
+            extra = dict(
+                runs=runs.get('count'),
+                warmup_runs=runs.get('warmup'),
+                outlier_runs=len(set(wall.get('outliers', []) + cyc.get('outliers', []) +
+                                     ins.get('outliers', []))),
+                wall_mean_ms=wall.get('mean'),
+                wall_stddev_ms=wall.get('stddev'),
+                wall_min_ms=wall.get('min'),
+                wall_ci_low_ms=wall.get('ci_low'),
+                wall_ci_high_ms=wall.get('ci_high'),
+                cycles_stddev=cyc.get('stddev'),
+                cycles_ci_low=cyc.get('ci_low'),
+                cycles_ci_high=cyc.get('ci_high'),
+                instructions_stddev=ins.get('stddev'),
+                instructions_ci_low=ins.get('ci_low'),
+                instructions_ci_high=ins.get('ci_high')
+            )
+        
+        cg = (result.get('cgroup') or {}).get('run')
+        if cg:
+            peak = cg.get('memory_peak_bytes')
+            extra.update(
+                memory_peak_kb=peak // 1024 if peak is not None else None,
+                cpu_throttled_ms=cg.get('throttled_ms'),
+                oom_kills=cg.get('oom_kills')
+            )
+        
+        ipc = instructions / cycles if cycles and instructions is not None else None
+        
+        page_faults = perf.get('page_faults')
+        if page_faults is None and 'minor_pagefaults' in time_data:
+            page_faults = time_data['minor_pagefaults'] + time_data.get('major_pagefaults', 0)
         
         JobMetrics.create(
             job=job,
             cycles=cycles,
             instructions=instructions,
+            cache_misses=perf.get('cache_misses'),
+            cache_references=perf.get('cache_references'),
+            branch_misses=perf.get('branch_misses'),
+            branch_instructions=perf.get('branch_instructions'),
             ipc=ipc,
-            execution_time_ms=exec_time * 1000 if exec_time else None
+            cache_miss_rate=perf.get('cache_miss_rate'),
+            branch_miss_rate=perf.get('branch_miss_rate'),
+            execution_time_ms=exec_time_ms,
+            max_rss_kb=time_data.get('maximum_resident_set_size'),
+            page_faults=page_faults,
+            **extra
         )
     
-    def set_running(self, job_id: int):
-        """Mark job as running"""
+    def _announce(self, job: Job):
+        if self._redis is None:
+            return
         try:
-            job = Job.get_by_id(job_id)
-            job.status = 'running'
-            job.started_at = datetime.datetime.now()
-            job.save()
+            self._redis.publish(DONE_CHANNEL.format(job.id), job.status)
+        except redis.RedisError as e:
+            print(f"[JobCache] Could not announce job {job.id}: {e}")
+
+    def set_running(self, job_id: int) -> bool:
+        """
+        Mark job as running
+
+        Returns:
+            False if it was cancelled (or finished) in the meantime
+        """
+        try:
+            # a job re-queued by the lease reaper is already running
+            return Job.update(status='running', started_at=datetime.datetime.now()).where(
+                    Job.id == job_id, Job.status.in_(('queued', 'running'))).execute() > 0
         except:
-            pass
+            return False
+
+    def cancel(self, job_id: int) -> Optional[str]:
+        """
+        Cancel a queued job outright, ask the manager to stop a running one
+
+        Returns:
+            'cancelled', 'cancelling', or None if the job is already done
+        """
+        now = datetime.datetime.now()
+        with db.atomic():
+            if Job.update(status='cancelled', completed_at=now).where(
+                    Job.id == job_id, Job.status == 'queued').execute():
+                result_cache.settle(Job.get_by_id(job_id))
+                return 'cancelled'
+            if Job.update(status='cancelling').where(
+                    Job.id == job_id, Job.status.in_(('running', 'cancelling'))).execute():
+                return 'cancelling'
+        return None
+
+    def cancel_requested(self, job_ids: List[int]) -> List[int]:
+        """Those of job_ids the API asked to cancel while they run"""
+        if not job_ids:
+            return []
+        return [j.id for j in Job.select(Job.id).where(
+                Job.id.in_(job_ids), Job.status == 'cancelling')]
     
     def get_full(self, job_id: int) -> Optional[dict]:
         """Get job with metrics"""
@@ -103,7 +246,9 @@ class JobCache:
                     'cycles': m.cycles,
                     'instructions': m.instructions,
                     'ipc': m.ipc,
-                    'execution_time_ms': m.execution_time_ms
+                    'execution_time_ms': m.execution_time_ms,
+                    'runs': m.runs,
+                    'wall_ci_ms': [m.wall_ci_low_ms, m.wall_ci_high_ms] if m.runs else None
                 }
             except:
                 result['metrics'] = None
@@ -111,3 +256,29 @@ class JobCache:
             return result
         except:
             return None
+    
+    def get_full_asm(self, job_id: int) -> Optional[str]:
+        """Whole-binary disassembly of a job, None until fetched"""
+        try:
+            return JobAsm.get(JobAsm.job == job_id).get_text()
+        except JobAsm.DoesNotExist:
+            return None
+    
+    def asm_job(self, job_id: int) -> Optional[Job]:
+        """Latest compile-only job fetching the full disassembly of job_id"""
+        return Job.select().where(Job.asm_of == job_id).order_by(Job.id.desc()).first()
+    
+    def get_timeline(self, job_id: int) -> Optional[dict]:
+        """Counter timeline of a job with per-interval ipc and miss rates, None if not recorded"""
+        try:
+            series = JobTimeline.get(JobTimeline.job == job_id).get_series()
+        except JobTimeline.DoesNotExist:
+            return None
+        events = series['events']
+        rates = [derived({name: values[i] for name, values in events.items()})
+                 for i in range(len(series['t_ms']))]
+        series['derived'] = {
+            key: [r[key] for r in rates]
+            for key in ('ipc', 'cache_miss_rate', 'branch_miss_rate')
+        }
+        return series
@@ -7,10 +7,18 @@ import shutil
 from typing import Optional
 import subprocess
 import socket
-from IQueue import IQueue, GlobalQueue, RedisQueue
+import threading
+import signal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from IQueue import IQueue, GlobalQueue, RedisQueue, LeaseReaper, make_queue
 from util import Container, FirecrackerCfg, send_sock, rec_sock, run_cmd, \
-ISerializer, JsonSerializer
+ISerializer, JsonSerializer, latency_stats, ProgramCosts, serializers
 from job_cache import JobCache
+from result_cache import program_key
+from vm_pool import VmPool, BENCH, COMPILE
+from output_relay import OutputRelay
+from config import Config
 import env
 from models import db
 import datetime
@@ -20,159 +28,236 @@ import datetime
 DEBUG = True
 
 class JobManager:
-    def __init__(self, ser: Optional = None):
+    def __init__(self, ser: Optional = None, pool_size: Optional[int] = None):
         self._running = False
         self._ser = ser or JsonSerializer()
         self._fc = FirecrackerCfg()
-        self._ctr = None
-        self._c = JobCache()
+        self._pool = VmPool(
+                size=(pool_size or Config.POOL_SIZE) + Config.COMPILE_LANE_SIZE,
+                fc=self._fc,
+                snapshot=Config.SNAPSHOT,
+                snapdir=Config.SNAPSHOT_DIR,
+                serializers=[n for n in Config.SERIALIZERS.split(',') if n in serializers()],
+                depth=Config.PIPELINE_DEPTH,
+                max_frame=Config.MAX_FRAME_BYTES,
+                lanes={COMPILE: Config.COMPILE_LANE_SIZE}
+                )
+        self._workers = None
+        self._cancel_poll = 0.0
+        self._db_lock = threading.Lock()   # one sqlite writer at a time
+        self._waits = deque(maxlen=1000)   # recent queue waits, seconds
+        self._costs = ProgramCosts(program_key)
+        self._expected = {}                # job id -> learned run-phase ms, while it runs
+        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        self._c = JobCache(redis_url=None if Config.QUEUE_BACKEND == 'sqlite' else redis_url)
         self._c.connect() # NEED TO CONNECT TOO   # NEED TO CONNECT TOO   # NEED TO CONNECT TOO   # NEED TO CONNECT TOO
-        self._q = RedisQueue(
-                name="benchr",
-                redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        # one queue per pool lane
+        self._queues = {
+            lane: make_queue(
+                Config.QUEUE_BACKEND,
+                name=name,
+                redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+                path=Config.QUEUE_DB,
+                lease=Config.LEASE_SEC
                 )
+            for lane, name in ((BENCH, "benchr"), (COMPILE, Config.COMPILE_QUEUE_NAME))
+            if lane == BENCH or lane in self._pool.lanes
+        }
+        self._q = self._queues[BENCH]
+        self._relay = OutputRelay(
+                Config.OUTPUT_STREAM_PORT,
+                os.getenv("REDIS_URL", "redis://localhost:6379/0")
+                ) if Config.STREAM_OUTPUT else None
+        self._reapers = [
+            LeaseReaper(q, inflight=lambda lane=lane: self._pool.inflight(lane),
+                        interval=Config.REAP_INTERVAL_SEC)
+            for lane, q in self._queues.items()
+        ]
     
-    def _execute(self, data: dict) -> dict:   # where data is job data in json
+    def _execute(self, ctr: Container, job_id: int, data: dict) -> dict:   # where data is job data in json
         """Execute a job on the container"""
-        if not self._ctr or not self._ctr.ready:
+        if not ctr or not ctr.ready:
             raise RuntimeError("Container not ready")
         
-        # Serialize job data
-        if DEBUG:
-            print(f"data: {data}")
-        bytez = self._ser.serialize(data)
-        
-        # Send to agent via vsock
-        send_sock(self._ctr.sock, bytez)
-        
-        # Block until result received
-        res_bytes = rec_sock(self._ctr.sock)
-        res = self._ser.deserialize(res_bytes)
-        if DEBUG:
-            print(f"res: {res}")
-        
-        return res
-    
-    def _start_ctr(self, ctr: Container):  # throws
-        """Start Firecracker VM and establish vsock connection"""
-        #cmd = f"{self._fc.bin} --config-file {ctr.cfg}"
-        cmd = f"{self._fc.bin}"
-        
-        # Start firecracker in background
-        proc = subprocess.Popen(
-            cmd.split(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        # Wait a moment for VM to boot
-        time.sleep(5)
-        
-        # Check if process is still running
-        if proc.poll() is not None:
-            stdout, stderr = proc.communicate()
-            raise RuntimeError(f"Firecracker failed to start: {stderr.decode()}")
-
-        if DEBUG:
-            print(f"ctr vsock: {ctr.vsock}")
-            print(f"ctr cid: {ctr.cid}")
-            print(f"ctr port: {ctr.port}")
-        
-        # Connect to vsock
-        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        max_retries = 10
-        retry_delay = 0.5
-        
-        for attempt in range(max_retries):
+        # the agent queues it behind whatever is already running there
+        progress = (lambda p: print(f"Job {job_id} on container {ctr.cid}: {p}")) if DEBUG else None
+        return ctr.chan.submit(job_id, data, progress).result()
+
+    def _run_job(self, ctr: Container, job_id: int, wait: Optional[float] = None,
+                 q: Optional[IQueue] = None):
+        """Worker: run one job on an acquired container slot, then release it"""
+        q = q or self._q
+        try:
+            data = self._c.get(job_id)
+            if data is None:
+                raise RuntimeError(f"Job {job_id} not found")
+            with self._db_lock:
+                running = self._c.set_running(job_id)
+            if not running:
+                q.ack(job_id)
+                print(f"Job {job_id} was cancelled before it ran")
+                return
+            self._expected[job_id] = self._costs.expected_ms(data)
+
             try:
-                sock.connect(ctr.vsock)
-                break
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    raise RuntimeError(f"Socket connection failed on vsock after {max_retries} attempts: {e}")
-                time.sleep(retry_delay)
-        
-        # Send handshake
-        sock.sendall(f"CONNECT {ctr.port}\n".encode('ascii'))
-        
-        # Wait for acknowledgement
-        ack = sock.recv(64).decode('ascii').strip()
-        if not ack.startswith("OK"):
-            sock.close()
-            raise RuntimeError(f"Socket acknowledgement failed: got '{ack}'")
-        
-        ctr.sock = sock
-        ctr.ready = True
-        print(f"Container {ctr.cid} started and ready")
+                result = self._execute(ctr, job_id, data)
+            except (OSError, RuntimeError) as e:
+                # connection to the guest is gone, replace the VM
+                ctr.ready = False
+                result = {'success': False, 'error': f"container {ctr.cid}: {e}"}
+            if wait is not None:
+                result.setdefault('timing', {})['queue_wait_ms'] = wait * 1000
+
+            with self._db_lock:
+                self._c.update(job_id, result)
+            self._costs.learn(data, result, verbose=DEBUG)
+            if not q.ack(job_id):
+                print(f"Lease on job {job_id} was lost, it may run twice")
+            print(f"Job {job_id} done on container {ctr.cid}")
+
+        except Exception as e:
+            print(f"Error processing job {job_id}: {e}")
+            # Continue running even if one job fails
+        finally:
+            self._expected.pop(job_id, None)
+            # the last job out of a broken container brings it back, on the
+            # pool's thread: restart() retries until it is up
+            if self._pool.release(ctr, job_id) and self._running:
+                self._pool.recover(ctr)
+            if DEBUG:
+                print(f"pool: {self._pool.occupancy()}")
+                print(f"queue wait: {self.queue_wait_stats()}")
     
+    def _poll_cancels(self):
+        """Pass the API's cancel requests for jobs running here on to their agents"""
+        now = time.monotonic()
+        if now - self._cancel_poll < Config.CANCEL_POLL_SEC:
+            return
+        self._cancel_poll = now
+        jobs = {j: cid for cid, ids in self._pool.occupancy()['jobs'].items() for j in ids}
+        try:
+            with self._db_lock:
+                cancel = self._c.cancel_requested(list(jobs))
+        except Exception as e:
+            print(f"Cancel poll failed: {e}")
+            return
+        ctrs = {c.cid: c for c in self._pool.containers()}
+        for job_id in cancel:
+            ctr = ctrs.get(jobs[job_id])
+            if ctr is not None and ctr.chan is not None:
+                print(f"Cancelling job {job_id} on container {ctr.cid}")
+                ctr.chan.cancel(job_id)
+
     def start(self):
-        """Initialize the VM and prepare for job execution"""
-        cid = 3
-        # xxx make sure config paths are correct!
-        cfg = "config.json"
-        vm_cfg = "vm_config.json"
-        vsock = "fc.vsock"
-        port = env.PORT_START
-        
-        self._ctr = Container(cid=cid, cfg=cfg, vm_cfg=vm_cfg, vsock=vsock, port=port)
-        
+        """Boot the VM pool and prepare for job execution"""
         try:
-            self._start_ctr(self._ctr)
+            self._pool.start()
+            if self._relay:
+                self._relay.start(self._pool.containers(ready_only=False))
+            self._workers = ThreadPoolExecutor(max_workers=self._pool.size * self._pool.depth)
+            for reaper in self._reapers:
+                reaper.start()
             self._running = True
             print("JobManager started successfully")
         except Exception as e:
-            print(f"Failed to start container: {e}")
+            print(f"Failed to start containers: {e}")
             raise
     
     def run(self):
-        """Main event loop - pop jobs from queue and execute"""
+        """Main event loop - block on the queue and hand jobs to idle VMs"""
         print("JobManager running, waiting for jobs...")
-        
+        # reserved lanes (compile-only jobs) dispatch from threads of their own
+        lanes = [threading.Thread(target=self._dispatch, args=(lane, q), name=f"lane-{lane}", daemon=True)
+                 for lane, q in self._queues.items() if lane != BENCH]
+        for t in lanes:
+            t.start()
+        self._dispatch(BENCH, self._q)
+        for t in lanes:
+            t.join()
+
+    def _dispatch(self, lane: str, q: IQueue):
+        """Hand the lane's queue to the lane's VMs until stop()"""
         while self._running:
-            # Poll queue (non-blocking check)
-            if self._q.hasFront():
-                try:
-                    # Pop blocks until job available
-                    # xxx NEEDS to block with this design
-                    job_id = self._q.pend()
-                    print(f"Received job: {job_id}")
-                    
-                    data = self._c.get(job_id)
-
-                    # Execute job
-                    result = self._execute(data)
-                    #print(f"Job {job.job_id} completed: {result}")
-
-                    self._c.update(job_id, result)
-                    self._q.pop()
-                    
-                    # TODO: Update Redis/DB with result
-                    # TODO: Signal Flask to update frontend
-                    # For now, just print
-                    
-                except Exception as e:
-                    print(f"Error processing job: {e}")
-                    # Continue running even if one job fails
-            else:
-                # No jobs available, sleep briefly
-                time.sleep(0.1)
+            if lane == BENCH:
+                self._poll_cancels()
+
+            # Only take a job off the queue once a VM has a free slot for it
+            ctr = self._pool.acquire(timeout=1, lane=lane)
+            if ctr is None:
+                continue
+            if not ctr.ready:
+                # a slot queued before its container broke
+                if self._pool.release(ctr):
+                    self._pool.recover(ctr)
+                continue
+            if self._long_running(ctr):
+                # a job sent now would wait for it; another guest may free up first
+                self._pool.hold(ctr)
+                continue
+
+            # Blocks in redis until a job arrives; the timeout only bounds
+            # how long stop() takes to be noticed
+            job_id = q.pend(timeout=1)
+            if job_id is None:
+                self._pool.release(ctr)
+                continue
+
+            wait = q.queue_wait(job_id)
+            if wait is not None and lane == BENCH:
+                self._waits.append(wait)
+            print(f"Received {lane} job: {job_id} (queued {wait * 1000 if wait is not None else -1:.1f} ms)")
+            self._pool.assign(ctr, job_id)
+            self._workers.submit(self._run_job, ctr, job_id, wait, q)
+
+    def _long_running(self, ctr: Container) -> bool:
+        """The guest runs a job its program's learned cost says is long"""
+        return any((self._expected.get(j) or 0) > Config.PIPELINE_MAX_MS for j in list(ctr.jobs))
+
+    def queue_wait_stats(self) -> dict:
+        """Submit-to-dispatch latency over the recent jobs, in ms"""
+        return latency_stats(self._waits)
+
+    def occupancy(self) -> dict:
+        """Pool occupancy: size, ready, busy, idle and jobs per busy VM"""
+        return self._pool.occupancy()
     
     def stop(self):
-        """Gracefully shutdown the job manager"""
+        """Ask run() to return; in-flight jobs still finish"""
+        self._running = False
+
+    def close(self):
+        """Wait for in-flight jobs, then release VMs and the DB connection"""
         self._running = False
-        if self._ctr and self._ctr.sock:
-            self._ctr.sock.close()
+        for reaper in self._reapers:
+            reaper.stop()
+        if self._workers:
+            self._workers.shutdown(wait=True)
+        self._pool.stop()
+        if self._relay:
+            self._relay.stop()
         self._c.disconnect()
         print("JobManager stopped")
 
 
-if __name__ == "__main__":
+def main():
     jm = JobManager()
+    # systemd stops us with SIGTERM
+    signal.signal(signal.SIGTERM, lambda *_: jm.stop())
+    signal.signal(signal.SIGINT, lambda *_: jm.stop())
     try:
         jm.start()
         jm.run()
-    except KeyboardInterrupt:
         print("\nShutting down...")
-        if not database.is_closed():
-            database.close()
-        jm.stop()
+    finally:
+        jm.close()
+        if not db.is_closed():
+            db.close()
+
+
+if __name__ == "__main__":
+    if Config.MANAGER == "async":
+        import asyncio
+        import async_job_manager
+        asyncio.run(async_job_manager.main())
+    else:
+        main()
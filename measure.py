@@ -0,0 +1,1281 @@
+import os
+import io
+import re
+import json
+import dis
+import time
+import select
+import shutil
+import signal
+import hashlib
+import ctypes
+import datetime
+import threading
+import subprocess
+from typing import Callable, List, Optional, Tuple
+import stats
+import output
+import sampler
+import perf_events
+import cgroup
+import disasm
+
+DEBUG = True
+
+# measure.py
+
+# In-process measurement harness for the agent. Compiles, disassembles and
+# runs a job and builds the result dict in memory, in the shape execute.sh
+# produced through perf/time/vmstat/jc/jq (see res-tmpl.json). The only
+# processes left are the compiler, objdump/javap, time and the program itself;
+# counters come from perf_event_open (perf_events.py) and vmstat/timeline
+# from a /proc sampler thread (sampler.py) instead of `vmstat 1`. Output is
+# read from a pipe keeping only its head and tail (output.py), and can be
+# streamed to the host while the program runs.
+#
+# Compile cache and PCH selection follow execute.sh, which stays available
+# as the fallback; both compute the same cache keys and share entries. The
+# cache drive is mounted for the compile step only and unmounted before
+# anything else runs; an entry is reused only if it still matches the sum
+# stored for it under CACHE_SUMS. With Harness.job_user set (the agent sets
+# JOB_UID) the compiler, tools and the program run as that user, in a
+# workdir handed over to it, so none of them can write the cache.
+#
+# With job['runs'] > 1 (after job['warmup'] discarded runs) perf/time/vmstat
+# describe the run closest to the median wall time, and result['runs'] holds
+# every sample with median/mean/stddev/min and a bootstrap CI per metric.
+# With job['precision'] set, job['runs'] is an upper bound instead: runs
+# continue until the CI of job['precision_metric'] is narrower than that
+# fraction of its median, or job['time_budget_sec'] is used up.
+# Runs cut short by the time limit after some samples are in return those,
+# with stop_reason 'time_limit', rather than a timeout.
+#
+# With job['counter_interval_ms'] set the counters are also read at that
+# interval and result['counter_timeline'] holds the per-interval deltas.
+#
+# C/C++ assembly covers the functions of the job's own translation unit
+# (disasm.py, metadata['asm']['scope'] 'tu'); job['asm_scope'] = 'full' asks
+# for the whole binary, job['asm_source'] for source lines in between and
+# job['asm_syntax'] = 'intel' for Intel syntax.
+# With job['compile_only'] the job stops after the disassembly.
+#
+# Harness.cancel() may be called from another thread: it kills the running
+# program's process group and run() raises Cancelled at the next step.
+#
+# Time limits: the compile phase (cache key, compile, disassembly) has until
+# job['compile_time_limit_sec'], the run phase (warmup and measured runs)
+# until job['time_limit_sec']. Every tool and the program run in their own
+# process group, which is killed as a whole at the deadline, and the job
+# comes back as timeout_result(). kill_strays() is for the agent, to clear
+# out anything that escaped its group (a daemonized child) between jobs.
+#
+# With Harness.cgroups set (cgroup.setup(), cgroup v2 in the guest) the
+# compile and run phases each get a cgroup capped at job['memory_limit_mb'],
+# job['pids_limit'] and job['cpu_limit'] (cgroup.py defaults otherwise), and
+# result['cgroup'] holds their accounting: memory.peak, cpu.stat with
+# throttling, OOM kills. Repeated runs share the run phase's cgroup, so its
+# figures cover all of them; without memory.peak the run's memory peak is
+# the largest max RSS of its samples.
+
+STEP_TIMEOUT = 30
+
+# defaults when the job does not say, seconds
+COMPILE_TIME_LIMIT = STEP_TIMEOUT
+RUN_TIME_LIMIT = 10
+
+PR_SET_CHILD_SUBREAPER = 36
+
+# precision mode: runs before the CI is first checked, default time budget
+ADAPTIVE_MIN_RUNS = 5
+ADAPTIVE_BUDGET_SEC = 10
+RUN_METRICS = ('wall_ms', 'cycles', 'instructions')
+
+# vmstat lines per run, built from the sampler's marks
+VMSTAT_POINTS = 50
+
+CACHE_DEV = "/dev/vdc"
+CACHE_MNT = "/mnt/cache"
+CC_CACHE = os.path.join(CACHE_MNT, "cc")
+# sha256 of each entry (see _cache_digest), in a directory only root can read
+CACHE_SUMS = os.path.join(CACHE_MNT, "sums")
+CACHE_HIGH_PCT = 90
+
+# uid and gid job processes run as when Harness.job_user is set (nobody)
+JOB_UID = 65534
+
+PCH_ROOT = "/opt/pch"
+PCH_HEADER = "bits/stdc++.h"
+PCH_FIRST_LINE = re.compile(r'^\s*#\s*include\s*<bits/stdc\+\+\.h>')
+
+# holds a process before exec until a line (or EOF) arrives on stdin, see _spawn_held
+HOLD = ["/bin/sh", "-c", 'read -r _; exec "$@" </dev/null', "benchr-hold"]
+
+ENV = dict(os.environ)
+ENV["GCC_EXEC_PREFIX"] = "/usr/lib/gcc/"
+ENV["PATH"] = ":".join([
+    "/usr/lib/gcc/x86_64-linux-gnu/13",
+    "/usr/lib/gcc/x86_64-linux-gnu/12",
+    "/usr/lib/gcc/x86_64-linux-gnu/11",
+    ENV.get("PATH", "/usr/bin:/bin")
+])
+ENV["LD_LIBRARY_PATH"] = ":".join([
+    "/usr/lib/jvm/java-11-openjdk-amd64/lib",
+    "/usr/lib/jvm/java-17-openjdk-amd64/lib",
+    "/usr/lib/jvm/java-21-openjdk-amd64/lib"
+])
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 3)
+
+def _timestamp() -> str:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return now.strftime("%Y-%m-%dT%H:%M:%S.") + f"{now.microsecond // 1000:03d}Z"
+
+def _read(path: str) -> str:
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', errors='replace')
+    except OSError:
+        return ""
+
+
+# `time -v` label -> `jc --time` key
+TIME_KEYS = {
+    'Command being timed': 'command_being_timed',
+    'User time (seconds)': 'user_time',
+    'System time (seconds)': 'system_time',
+    'Percent of CPU this job got': 'cpu_percent',
+    'Elapsed (wall clock) time (h:mm:ss or m:ss)': 'elapsed_time',
+    'Average shared text size (kbytes)': 'average_shared_text_size',
+    'Average unshared data size (kbytes)': 'average_unshared_data_size',
+    'Average stack size (kbytes)': 'average_stack_size',
+    'Average total size (kbytes)': 'average_total_size',
+    'Maximum resident set size (kbytes)': 'maximum_resident_set_size',
+    'Average resident set size (kbytes)': 'average_resident_set_size',
+    'Major (requiring I/O) page faults': 'major_pagefaults',
+    'Minor (reclaiming a frame) page faults': 'minor_pagefaults',
+    'Voluntary context switches': 'voluntary_context_switches',
+    'Involuntary context switches': 'involuntary_context_switches',
+    'Swaps': 'swaps',
+    'File system inputs': 'block_input_operations',
+    'File system outputs': 'block_output_operations',
+    'Socket messages sent': 'socket_messages_sent',
+    'Socket messages received': 'socket_messages_received',
+    'Signals delivered': 'signals_delivered',
+    'Page size (bytes)': 'page_size',
+    'Exit status': 'exit_status'
+}
+
+def _elapsed_fields(elapsed: float) -> dict:
+    hours, rem = divmod(elapsed, 3600)
+    minutes, seconds = divmod(rem, 60)
+    return {
+        'elapsed_time_hours': int(hours),
+        'elapsed_time_minutes': int(minutes),
+        'elapsed_time_seconds': int(seconds),
+        'elapsed_time_centiseconds': int(round(seconds * 100)) % 100,
+        'elapsed_time_total_seconds': round(elapsed, 6)
+    }
+
+def parse_time_v(text: str) -> dict:
+    """Parse GNU `time -v` output into the dict `jc --time` produces"""
+    res = {}
+    for line in text.splitlines():
+        label, sep, value = line.strip().rpartition(': ')
+        key = TIME_KEYS.get(label)
+        if not sep or key is None:
+            continue
+        if key == 'command_being_timed':
+            res[key] = value.strip('"')
+        elif key == 'elapsed_time':
+            res[key] = value
+            total = 0.0
+            for part in value.split(':'):
+                total = total * 60 + float(part)
+            res.update(_elapsed_fields(total))
+        elif key == 'cpu_percent':
+            res[key] = int(value.rstrip('%')) if value.rstrip('%').isdigit() else None
+        else:
+            try:
+                res[key] = int(value)
+            except ValueError:
+                try:
+                    res[key] = float(value)
+                except ValueError:
+                    res[key] = value
+    return res
+
+
+def rusage_time_stats(ru, elapsed: float, status: int, argv: List[str]) -> dict:
+    """
+    Same figures from a wait4 rusage, for guests without /usr/bin/time. The
+    program is forked from the agent, so its max RSS starts at the agent's.
+    """
+    user, system = ru.ru_utime, ru.ru_stime
+    fields = _elapsed_fields(elapsed)
+    hours, minutes = fields['elapsed_time_hours'], fields['elapsed_time_minutes']
+    seconds = elapsed - hours * 3600 - minutes * 60
+    if hours:
+        elapsed_str = f"{hours}:{minutes:02d}:{seconds:05.2f}"
+    else:
+        elapsed_str = f"{minutes}:{seconds:05.2f}"
+
+    return {
+        'command_being_timed': " ".join(argv),
+        'user_time': round(user, 2),
+        'system_time': round(system, 2),
+        'cpu_percent': int((user + system) / elapsed * 100) if elapsed > 0 else 0,
+        'elapsed_time': elapsed_str,
+        'average_shared_text_size': 0,
+        'average_unshared_data_size': 0,
+        'average_stack_size': 0,
+        'average_total_size': 0,
+        'maximum_resident_set_size': ru.ru_maxrss,
+        'average_resident_set_size': 0,
+        'major_pagefaults': ru.ru_majflt,
+        'minor_pagefaults': ru.ru_minflt,
+        'voluntary_context_switches': ru.ru_nvcsw,
+        'involuntary_context_switches': ru.ru_nivcsw,
+        'swaps': ru.ru_nswap,
+        'block_input_operations': ru.ru_inblock,
+        'block_output_operations': ru.ru_oublock,
+        'socket_messages_sent': ru.ru_msgsnd,
+        'socket_messages_received': ru.ru_msgrcv,
+        'signals_delivered': ru.ru_nsignals,
+        'page_size': os.sysconf('SC_PAGE_SIZE'),
+        'exit_status': status,
+        **fields
+    }
+
+
+def _proc_snapshot() -> dict:
+    """Counters from /proc that vmstat reports"""
+    snap = {}
+    with open("/proc/stat", 'r') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] == 'cpu':
+                snap['cpu'] = [int(x) for x in parts[1:]]
+            elif parts[0] in ('intr', 'ctxt', 'procs_running', 'procs_blocked'):
+                snap[parts[0]] = int(parts[1])
+    with open("/proc/meminfo", 'r') as f:
+        for line in f:
+            key, value = line.split(':', 1)
+            snap[key] = int(value.split()[0])
+    with open("/proc/vmstat", 'r') as f:
+        for line in f:
+            key, value = line.split()
+            if key in ('pswpin', 'pswpout', 'pgpgin', 'pgpgout'):
+                snap[key] = int(value)
+    return snap
+
+
+def vmstat_record(before: dict, after: dict, elapsed: float) -> dict:
+    """One `vmstat` line over the interval, keyed like `jc --vmstat`"""
+    secs = max(elapsed, 1e-6)
+    rate = lambda k: int((after.get(k, 0) - before.get(k, 0)) / secs)
+
+    # user nice system idle iowait irq softirq steal
+    cpu = [a - b for a, b in zip(after['cpu'], before['cpu'])] + [0] * 8
+    total = sum(cpu[:8]) or 1
+    pct = lambda *idx: int(round(sum(cpu[i] for i in idx) * 100 / total))
+
+    return {
+        'runnable_procs': after.get('procs_running', 0),
+        'uninterruptible_sleeping_procs': after.get('procs_blocked', 0),
+        'virtual_mem_used': after.get('SwapTotal', 0) - after.get('SwapFree', 0),
+        'free_mem': after.get('MemFree', 0),
+        'buffer_mem': after.get('Buffers', 0),
+        'cache_mem': after.get('Cached', 0) + after.get('SReclaimable', 0),
+        'inactive_mem': None,
+        'active_mem': None,
+        'swap_in': rate('pswpin'),
+        'swap_out': rate('pswpout'),
+        'blocks_in': rate('pgpgin'),
+        'blocks_out': rate('pgpgout'),
+        'interrupts': rate('intr'),
+        'context_switches': rate('ctxt'),
+        'user_time': pct(0, 1),
+        'system_time': pct(2, 5, 6),
+        'idle_time': pct(3),
+        'io_wait_time': pct(4),
+        'stolen_time': pct(7)
+    }
+
+
+def vmstat_records(before: dict, after: dict, elapsed: float, marks: List[dict]) -> List[dict]:
+    """
+    vmstat lines between the sampler's /proc/stat marks. Memory columns are
+    the final snapshot's and swap/block rates the whole run's, which the
+    sampler does not read.
+    """
+    whole = vmstat_record(before, after, elapsed)
+    records, prev = [], dict(before, t=0.0)
+    for mark in marks:
+        dt = mark['t'] - prev['t']
+        if dt <= 0:
+            continue
+        rec = vmstat_record(prev, dict(after, **mark), dt)
+        for key in ('swap_in', 'swap_out', 'blocks_in', 'blocks_out'):
+            rec[key] = whole[key]
+        records.append(rec)
+        prev = mark
+    return records or [whole]
+
+
+def _link_args(argv: List[str]) -> List[str]:
+    """Compiler argv without -x, which would apply to the object file too"""
+    out, skip = [], False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == "-x":
+            skip = True
+        elif not arg.startswith("-x"):
+            out.append(arg)
+    return out
+
+
+def timeout_result(phase: str, limit: float, output: Optional[str] = None) -> dict:
+    """Result of a job killed at its time limit"""
+    result = {
+        'success': False,
+        'timestamp': _timestamp(),
+        'error': f"{phase} time limit exceeded ({limit:g}s)",
+        'timed_out': True,
+        'timeout': {'phase': phase, 'limit_sec': limit}
+    }
+    if output is not None:
+        result['output'] = output
+    return result
+
+
+def become_subreaper() -> bool:
+    """Adopt orphaned descendants (a job's daemonized children) instead of init"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+def descendants(root: int) -> List[int]:
+    """Every process below root, from the ppid links in /proc"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        ppid = int(stat[stat.rfind(b')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [root]
+    while stack:
+        for pid in children.get(stack.pop(), []):
+            found.append(pid)
+            stack.append(pid)
+    return found
+
+
+def kill_strays(keep=()) -> int:
+    """
+    SIGKILL every process left below this one, except those in keep, and
+    reap the ones that are our children
+
+    Returns:
+        number of processes killed
+    """
+    strays = [pid for pid in descendants(os.getpid()) if pid not in keep]
+    for pid in strays:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    for pid in strays:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            # a grandchild, reaped by its parent or by us on the next sweep
+            pass
+    return len(strays)
+
+
+class Cancelled(Exception):
+    """The job was cancelled through Harness.cancel()"""
+
+
+class SetupFailed(Exception):
+    """The harness could not set the job up; nothing of it has run yet"""
+
+
+class TimeLimitExceeded(Exception):
+    """A job phase ran past its deadline; its process group has been killed"""
+
+    def __init__(self, phase: str, output: Optional[str] = None):
+        super().__init__(f"{phase} time limit exceeded")
+        self.phase = phase
+        self.output = output
+
+
+class Harness:
+    """Runs jobs for the agent; keeps state that outlives a job (cache mount, compiler versions)"""
+
+    def __init__(self, sample_interval_ms: float = sampler.SAMPLE_INTERVAL_MS):
+        self.sample_interval_ms = sample_interval_ms
+        self._time = "/usr/bin/time" if os.access("/usr/bin/time", os.X_OK) else None
+        self._versions = {}
+        self._cache_ok = None
+        # set by cancel(), cleared by the caller before the next job
+        self.cancelled = threading.Event()
+        self._pid = None
+        # cgroup.Manager when the guest has cgroup v2, set by the agent
+        self.cgroups = None
+        self._cg = None
+        self._job_cgroups = {}
+        # whether the current job has started a process yet, see run()
+        self._spawned = False
+        # uid (and gid) for compilers, tools and programs, set by the agent;
+        # None runs them as the agent's own user
+        self.job_user = None
+
+    def cancel(self):
+        """Stop the current job: kill its program, run() raises Cancelled"""
+        self.cancelled.set()
+        pid = self._pid
+        if pid is not None:
+            self._kill(pid)
+
+    @staticmethod
+    def _kill(pid: int):
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            # still held before its setsid()
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _kill_leftovers(self, pgid: int):
+        """Kill what is left of a reaped program: its process group and cgroup"""
+        try:
+            os.killpg(pgid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        if self._cg is not None:
+            self._cg.kill()
+
+    def _check_cancelled(self):  # throws
+        if self.cancelled.is_set():
+            raise Cancelled()
+
+    def _step(self, argv: List[str], workdir: str, deadline: float) -> subprocess.CompletedProcess:  # throws
+        """
+        Run a compile-phase tool in its own process group and cgroup (see
+        _spawn_held()), all of it killed at deadline
+        """
+        out_r, out_w = os.pipe2(os.O_CLOEXEC)
+        err_r, err_w = os.pipe2(os.O_CLOEXEC)
+        try:
+            proc, barrier = self._spawn_held(argv, workdir, out_w, err_w)
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+        pid = self._pid = proc.pid
+        if self.cancelled.is_set():
+            self._kill(pid)
+        os.write(barrier, b"x")
+        os.close(barrier)
+        try:
+            bufs, done = self._collect([out_r, err_r], deadline)
+            if not done:
+                self._kill(pid)
+                # dead, but something that left the group may hold its pipes
+                self._collect([out_r, err_r], time.monotonic() + 1, bufs)
+            proc.wait()
+        finally:
+            self._pid = None
+            os.close(out_r)
+            os.close(err_r)
+        if not done:
+            raise TimeLimitExceeded('compile')
+        return subprocess.CompletedProcess(argv, proc.returncode,
+                                           b"".join(bufs[out_r]), b"".join(bufs[err_r]))
+
+    @staticmethod
+    def _collect(fds: List[int], deadline: float, bufs: Optional[dict] = None) -> Tuple[dict, bool]:
+        """
+        Read fds until EOF on all of them or deadline
+
+        Returns:
+            ({fd: [chunks]}, whether every fd reached EOF)
+        """
+        bufs = bufs if bufs is not None else {fd: [] for fd in fds}
+        open_fds = set(fds)
+        while open_fds:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return bufs, False
+            ready, _, _ = select.select(list(open_fds), [], [], left)
+            for fd in ready:
+                chunk = os.read(fd, 65536)
+                if chunk:
+                    bufs[fd].append(chunk)
+                else:
+                    open_fds.discard(fd)
+        return bufs, True
+
+    def _enter_cgroup(self, job: dict, phase: str):
+        """Put the phase's processes from here on in a cgroup of their own"""
+        self._cg = None
+        if self.cgroups is None:
+            return
+        try:
+            self._cg = self.cgroups.create(
+                f"job-{job.get('job_id', 0)}-{phase}",
+                memory_max_mb=job.get('memory_limit_mb') or cgroup.JOB_MEMORY_MAX_MB,
+                pids_max=job.get('pids_limit') or cgroup.JOB_PIDS_MAX,
+                cpu=job.get('cpu_limit') or None)
+            self._job_cgroups[phase] = self._cg
+        except OSError as e:
+            print(f"[Harness] No cgroup for the {phase} phase: {e}")
+
+    def _cgroup_stats(self, samples: List[dict]) -> Optional[dict]:
+        """result['cgroup']: accounting of each phase's cgroup"""
+        if not self._job_cgroups:
+            return None
+        res = {phase: cg.stats() for phase, cg in self._job_cgroups.items()}
+        run = res.get('run')
+        if run is not None:
+            run['memory_peak_source'] = 'cgroup'
+            if run['memory_peak_bytes'] is None:
+                rss = [s['time'].get('maximum_resident_set_size') for s in samples]
+                rss = [r for r in rss if r is not None]
+                run['memory_peak_bytes'] = max(rss) * 1024 if rss else None
+                run['memory_peak_source'] = 'rss'
+        return res
+
+    def _close_cgroups(self):
+        self._cg = None
+        for cg in self._job_cgroups.values():
+            try:
+                cg.close()
+            except OSError as e:
+                print(f"[Harness] Could not remove cgroup {cg.path}: {e}")
+        self._job_cgroups = {}
+
+    # --- compile cache, same layout and keys as execute.sh ---
+
+    def _cache_mount(self) -> bool:
+        """Mount the cache drive for the compile step, see _cache_release()"""
+        if self._cache_ok is False:
+            return False
+        if not os.path.ismount(CACHE_MNT):
+            if not os.path.exists(CACHE_DEV):
+                self._cache_ok = False
+                return False
+            os.makedirs(CACHE_MNT, exist_ok=True)
+            res = subprocess.run(["mount", "-o", "rw,nosuid,nodev,noexec,noatime", CACHE_DEV, CACHE_MNT],
+                                 capture_output=True)
+            if res.returncode != 0:
+                print(f"[Harness] Could not mount the compile cache: {res.stderr.decode(errors='replace').strip()}")
+                self._cache_ok = False
+                return False
+        self._cache_ok = True
+        return True
+
+    def _cache_release(self):
+        """Unmount the cache drive, which nothing past the compile step may see"""
+        if not self._cache_ok or not os.path.ismount(CACHE_MNT):
+            return
+        res = subprocess.run(["umount", CACHE_MNT], capture_output=True)
+        if res.returncode != 0:
+            # busy: detach it now, the kernel finishes once its last user is gone
+            res = subprocess.run(["umount", "-l", CACHE_MNT], capture_output=True)
+        if res.returncode != 0:
+            print(f"[Harness] Could not unmount the compile cache: {res.stderr.decode(errors='replace').strip()}")
+
+    def _version(self, compiler: str) -> bytes:
+        if compiler not in self._versions:
+            res = subprocess.run([compiler, "--version"], capture_output=True, env=ENV)
+            self._versions[compiler] = res.stdout
+        return self._versions[compiler]
+
+    def _cache_key(self, workdir: str, src: str, lang: str, compiler: str, opts: str,
+                   deadline: float) -> Optional[str]:
+        pp = self._step([compiler] + opts.split() + ["-E", os.path.basename(src)], workdir, deadline)
+        if pp.returncode != 0:
+            return None
+        h = hashlib.sha256()
+        h.update(self._version(compiler))
+        h.update(f"{lang} {opts}\n".encode())
+        h.update(pp.stdout)
+        return h.hexdigest()
+
+    @staticmethod
+    def _cache_digest(entry: str) -> str:  # throws
+        """sha256 of an entry's binary, .stderr and .syms, as `cat` of the three gives them"""
+        h = hashlib.sha256()
+        with open(entry, 'rb') as f:
+            h.update(f.read())
+        for p in (entry + ".stderr", entry + ".syms"):
+            try:
+                with open(p, 'rb') as f:
+                    h.update(f.read())
+            except FileNotFoundError:
+                pass
+        return h.hexdigest()
+
+    def _cache_verified(self, entry: str) -> bool:
+        """Whether entry still matches the sum stored when it was made"""
+        try:
+            with open(os.path.join(CACHE_SUMS, os.path.basename(entry))) as f:
+                return f.read().strip() == self._cache_digest(entry)
+        except OSError:
+            return False
+
+    @staticmethod
+    def _cache_drop(entry: str):
+        for p in (entry, entry + ".stderr", entry + ".syms",
+                  os.path.join(CACHE_SUMS, os.path.basename(entry))):
+            try:
+                os.unlink(p)
+            except OSError:
+                pass
+
+    def _cache_store(self, entry: str, binary: str, stderr: str, symbols: Optional[List[str]]):
+        try:
+            self._cache_drop(entry)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            os.makedirs(CACHE_SUMS, mode=0o700, exist_ok=True)
+            with open(entry + ".stderr", 'w') as f:
+                f.write(stderr)
+            if symbols:
+                with open(entry + ".syms", 'w') as f:
+                    f.write("\n".join(symbols) + "\n")
+            tmp = f"{entry}.tmp.{os.getpid()}"
+            shutil.copy(binary, tmp)
+            os.rename(tmp, entry)
+            # last, so an entry without its sum is never reused
+            with open(os.path.join(CACHE_SUMS, os.path.basename(entry)), 'w') as f:
+                f.write(self._cache_digest(entry) + "\n")
+            self._cache_trim()
+        except OSError as e:
+            print(f"[Harness] Could not store compile cache entry: {e}")
+
+    def _cache_trim(self):
+        """Drop the least recently used quarter once the drive fills up"""
+        usage = shutil.disk_usage(CACHE_MNT)
+        if usage.used * 100 < usage.total * CACHE_HIGH_PCT:
+            return
+        entries = []
+        for root, _, files in os.walk(CC_CACHE):
+            for name in files:
+                if not name.endswith((".stderr", ".syms")):
+                    path = os.path.join(root, name)
+                    entries.append((os.stat(path).st_mtime, path))
+        entries.sort()
+        for _, path in entries[:len(entries) // 4 + 1]:
+            self._cache_drop(path)
+
+    # --- precompiled headers, see build-pch.sh ---
+
+    def _pch_select(self, src: str, lang: str, compiler: str, opts: str) -> Tuple[List[str], Optional[str]]:
+        """PCH flags and meta.json path, or ([], None) if no PCH fits this job"""
+        if lang != 'cpp':
+            return [], None
+        with open(src, 'r', errors='replace') as f:
+            for line in f:
+                if line.strip() == "" or line.lstrip().startswith("//"):
+                    continue
+                if not PCH_FIRST_LINE.match(line):
+                    return [], None
+                break
+            else:
+                return [], None
+
+        std, olvl = "default", "-O0"
+        for opt in opts.split():
+            if opt == "-O":
+                olvl = "-O1"
+            elif opt.startswith("-O"):
+                olvl = opt
+            elif opt.startswith("-std="):
+                std = opt[len("-std="):]
+            elif not (opt.startswith("-W") or opt == "-w"):
+                return [], None
+
+        d = os.path.join(PCH_ROOT, os.path.basename(compiler), std + olvl)
+        meta = os.path.join(d, "meta.json")
+        if not os.path.exists(meta):
+            return [], None
+        if "clang" in compiler:
+            return ["-include-pch", os.path.join(d, "stdc++.h.pch")], meta
+        return [f"-I{d}", "-Winvalid-pch"], meta
+
+    def _pch_saving_ms(self, meta: str) -> float:
+        try:
+            with open(meta, 'r') as f:
+                return json.load(f).get('saving_ms', 0)
+        except (OSError, ValueError):
+            return 0
+
+    # --- steps ---
+
+    def _compile_native(self, workdir: str, src: str, binary: str, lang: str,
+                        compiler: str, opts: str, deadline: float) -> Tuple[bool, str, dict]:  # throws
+        """
+        Build binary, from the compile cache when possible
+
+        The translation unit is compiled to an object and linked in a second
+        step, the same work the driver does in one, so that its symbols are
+        known for disasm.py.
+
+        Returns:
+            (ok, compiler stderr, {cache_hit, compile_ms, pch_used, pch_saving_ms,
+             symbols}), symbols None when not known
+        """
+        t0 = time.perf_counter()
+        info = {'cache_hit': False, 'pch_used': False, 'pch_saving_ms': 0, 'symbols': None}
+
+        key = None
+        if self._cache_mount():
+            key = self._cache_key(workdir, src, lang, compiler, opts, deadline)
+        entry = os.path.join(CC_CACHE, key[:2], key) if key else None
+
+        if entry and os.path.exists(entry) and not self._cache_verified(entry):
+            print(f"[Harness] Compile cache entry {key} does not match its sum, rebuilding it")
+            self._cache_drop(entry)
+        if entry and os.path.exists(entry):
+            try:
+                shutil.copy(entry, binary)
+                os.utime(entry)
+                info['cache_hit'] = True
+                if os.path.exists(entry + ".syms"):
+                    # entries made by execute.sh have none
+                    info['symbols'] = _read(entry + ".syms").split()
+                info['compile_ms'] = _ms(t0)
+                return True, _read(entry + ".stderr"), info
+            except OSError:
+                pass
+
+        pch, meta = self._pch_select(src, lang, compiler, opts)
+        base = [compiler] + opts.split()
+        obj = os.path.basename(binary) + ".o"
+        tail = ["-c", "-o", obj, os.path.basename(src)]
+        res = self._step(base + pch + tail, workdir, deadline)
+        stderr = res.stderr.decode('utf-8', errors='replace')
+
+        if pch and res.returncode != 0 and ("precompiled" in stderr.lower() or ".pch" in stderr):
+            print("[Harness] PCH rejected, compiling without it")
+            res = self._step(base + tail, workdir, deadline)
+            stderr = res.stderr.decode('utf-8', errors='replace')
+        elif pch and "stdc++.h.gch" not in stderr:
+            # gcc falls back to the header by itself and says so with -Winvalid-pch
+            info['pch_used'] = True
+            info['pch_saving_ms'] = self._pch_saving_ms(meta)
+
+        if res.returncode == 0:
+            res = self._step(_link_args(base) + ["-o", os.path.basename(binary), obj],
+                             workdir, deadline)
+            stderr += res.stderr.decode('utf-8', errors='replace')
+        if res.returncode == 0:
+            nm = self._step(["nm", "--defined-only", obj], workdir, deadline)
+            if nm.returncode == 0:
+                info['symbols'] = disasm.tu_symbols(nm.stdout.decode('utf-8', errors='replace')) or None
+
+        if res.returncode == 0 and entry:
+            self._cache_store(entry, binary, stderr, info['symbols'])
+        info['compile_ms'] = _ms(t0)
+        return res.returncode == 0, stderr, info
+
+    def _spawn_held(self, cmd: List[str], workdir: str, out_fd: Optional[int],
+                    err_fd: Optional[int] = None) -> Tuple[subprocess.Popen, int]:
+        """
+        Start cmd in its own session and the phase's cgroup, held before exec
+        until the returned pipe fd is written to (or closed); stderr goes to
+        err_fd, to out_fd without one. The process is a shell (HOLD) waiting on
+        the pipe, which the parent moves into the cgroup before releasing it
+        to exec cmd under the same pid: no Python runs between fork and exec,
+        which is not safe with the agent's other threads
+
+        Returns:
+            (process, write end of the barrier pipe)
+        """
+        r, w = os.pipe2(os.O_CLOEXEC)
+        out = subprocess.DEVNULL if out_fd is None else out_fd
+        # Popen switches user in C, before the exec
+        user = {} if self.job_user is None else \
+            {'user': self.job_user, 'group': self.job_user, 'extra_groups': []}
+        try:
+            proc = subprocess.Popen(HOLD + list(cmd), cwd=workdir, env=ENV, stdin=r, stdout=out,
+                                    stderr=out if err_fd is None else err_fd,
+                                    start_new_session=True, **user)
+        except BaseException:
+            os.close(w)
+            raise
+        finally:
+            os.close(r)
+        self._spawned = True
+        if self._cg is not None:
+            try:
+                self._cg.add(proc.pid)
+            except OSError as e:
+                print(f"[Harness] Could not move {proc.pid} into {self._cg.path}: {e}")
+        return proc, w
+
+    def run_measured(self, argv: List[str], workdir: str,
+                     capture: Optional[output.OutputCapture] = None,
+                     timeout: float = STEP_TIMEOUT,
+                     counter_interval_ms: Optional[int] = None) -> dict:  # throws
+        """
+        Run argv with stdout+stderr into capture (/dev/null without one), counting it with perf events
+        opened on the held child (see perf_events.py). /usr/bin/time stays the
+        program's direct parent so its rusage (max RSS in particular) is the
+        program's own; the counters start at time's exec, as they did at
+        perf stat's.
+
+        Args:
+            counter_interval_ms: also read the counters at this interval,
+                returned as 'counter_timeline'
+
+        Returns:
+            {'exit_code', 'elapsed', 'perf', 'perf_scaling', 'time', 'vmstat',
+             'timeline', 'counter_timeline'}
+        """
+        time_out = os.path.join(workdir, "time.stderr")
+        cmd = list(argv)
+        if self._time:
+            cmd = [self._time, "-v", "-o", time_out] + cmd
+
+        proc, barrier = self._spawn_held(cmd, workdir, capture.write_fd if capture else None)
+        pid = self._pid = proc.pid
+        if self.cancelled.is_set():
+            # cancel() came before the pid was known
+            self._kill(pid)
+        counters = None
+        try:
+            try:
+                counters = perf_events.Counters(pid)
+            except OSError as e:
+                print(f"[Harness] perf_event_open failed: {e}")
+            pidfd = os.pidfd_open(pid)
+            smp = sampler.Sampler(pid, self.sample_interval_ms, follow_child=bool(self._time))
+        except BaseException:
+            self._pid = None
+            os.close(barrier)
+            os.kill(pid, signal.SIGKILL)
+            proc.wait()
+            if counters is not None:
+                counters.close()
+            if capture is not None:
+                capture.finish()
+            raise
+
+        reader = None
+        if counter_interval_ms and counters is not None and counters.opened:
+            reader = perf_events.IntervalReader(counters, counter_interval_ms)
+
+        before = _proc_snapshot()
+        if capture is not None:
+            capture.start()
+        smp.start()
+        if reader is not None:
+            reader.start()
+        t0 = time.perf_counter()
+        os.write(barrier, b"x")
+        os.close(barrier)
+        try:
+            ready, _, _ = select.select([pidfd], [], [], timeout)
+            if not ready:
+                os.killpg(pid, signal.SIGKILL)
+            _, status, ru = os.wait4(pid, 0)
+            # reaped here for the rusage, Popen must not wait for it again
+            proc.returncode = os.waitstatus_to_exitcode(status)
+        finally:
+            self._pid = None
+            os.close(pidfd)
+            # anything the program left running would keep the output pipe open
+            self._kill_leftovers(pid)
+            smp.stop()
+            if reader is not None:
+                reader.stop()
+            if capture is not None:
+                capture.finish()
+        elapsed = time.perf_counter() - t0
+        after = _proc_snapshot()
+
+        perf, scaling = {}, {}
+        if counters is not None:
+            try:
+                counts, scaling = counters.read()
+            finally:
+                counters.close()
+            perf = {k: v for k, v in counts.items() if k != 'task_clock'}
+            perf.update((name, None) for name in counters.unavailable)
+            if counts.get('task_clock') is not None:
+                perf['task_clock_ms'] = round(counts['task_clock'] / 1e6, 3)
+            perf.update(perf_events.derived(counts))
+
+        exit_code = os.waitstatus_to_exitcode(status)
+        if exit_code < 0:
+            exit_code = 128 - exit_code
+        self._check_cancelled()
+        if not ready:
+            raise subprocess.TimeoutExpired(argv, timeout)
+
+        if self._time:
+            time_stats = parse_time_v(_read(time_out))
+        else:
+            time_stats = rusage_time_stats(ru, elapsed, exit_code, argv)
+        return {
+            'exit_code': exit_code,
+            'elapsed': elapsed,
+            'perf': perf,
+            'perf_scaling': scaling,
+            'time': time_stats,
+            'vmstat': vmstat_records(before, after, elapsed, smp.system_marks(VMSTAT_POINTS)),
+            'timeline': smp.timeline(),
+            'counter_timeline': reader.series() if reader is not None else None
+        }
+
+    def _disassemble(self, argv: List[str], workdir: str, failed: str, deadline: float) -> str:  # throws
+        res = self._step(argv, workdir, deadline)
+        out = (res.stdout + res.stderr).decode('utf-8', errors='replace')
+        return out if res.returncode == 0 else out or failed
+
+    def _disassemble_native(self, binary: str, workdir: str, symbols: Optional[List[str]],
+                            source: bool, intel: bool, deadline: float) -> Tuple[str, str]:  # throws
+        """
+        objdump of the translation unit's functions (see disasm.py), of the
+        whole binary when its symbols are not known
+
+        Returns:
+            (asm, 'tu' | 'full')
+        """
+        if symbols:
+            nm = self._step(["nm", "-S", "--defined-only", binary], workdir, deadline)
+            addrs, span = set(), None
+            if nm.returncode == 0:
+                addrs, span = disasm.locate(
+                    disasm.symbol_table(nm.stdout.decode('utf-8', errors='replace')), symbols)
+            if span is not None:
+                res = self._step(disasm.objdump_argv(binary, source, span, intel), workdir, deadline)
+                if res.returncode == 0:
+                    return disasm.keep_functions(res.stdout.decode('utf-8', errors='replace'), addrs), 'tu'
+        return self._disassemble(disasm.objdump_argv(binary, source, intel=intel), workdir,
+                                 "/* disassembly failed */", deadline), 'full'
+
+    @staticmethod
+    def _compile_failed(error: str, details: str, extra: Optional[dict] = None) -> dict:
+        compilation = {'success': False, 'error': error, 'details': details}
+        compilation.update(extra or {})
+        return {'success': False, 'error': error, 'compilation': compilation}
+
+    def run(self, job: dict, workdir: str, src: str,
+            report: Optional[Callable[[str, dict], None]] = None) -> dict:  # throws
+        """
+        Compile, disassemble and run one job written to src inside workdir;
+        raises SetupFailed for a failure before the job's first process started
+
+        Args:
+            report: called as report('progress', {'phase', ...}) along the
+                way, and report('partial', {...}) with the compilation, asm
+                and metadata before the runs; those values are also in the result
+        """
+        limits = {
+            'compile': float(job.get('compile_time_limit_sec') or COMPILE_TIME_LIMIT),
+            'run': float(job.get('time_limit_sec') or RUN_TIME_LIMIT)
+        }
+        self._spawned = False
+        try:
+            return self._run(job, workdir, src, report or (lambda kind, body: None), limits)
+        except TimeLimitExceeded as e:
+            print(f"[Harness] {e}")
+            return timeout_result(e.phase, limits[e.phase], e.output)
+        except OSError as e:
+            if not self._spawned:
+                raise SetupFailed(str(e)) from e
+            raise
+        finally:
+            self._close_cgroups()
+
+    def _run(self, job: dict, workdir: str, src: str,
+             report: Callable[[str, dict], None], limits: dict) -> dict:  # throws
+        report('progress', {'phase': 'compile'})
+        if self.job_user is not None:
+            # the job's tools write here, and only here
+            os.chown(workdir, self.job_user, self.job_user)
+        self._enter_cgroup(job, 'compile')
+        deadline = time.monotonic() + limits['compile']
+        t_job = time.perf_counter()
+        lang = job.get('lang', 'cpp')
+        compiler = job.get('compiler', 'g++')
+        opts = job.get('opts', '-O2 -Wall') or ""
+        timing = {}
+
+        compilation = {'success': True, 'error': None, 'details': None}
+        metadata = {'opts': opts, 'source_size_bytes': os.path.getsize(src)}
+
+        if lang in ('c', 'cpp'):
+            binary = os.path.join(workdir, "bin")
+            source = bool(job.get('asm_source'))
+            cc_opts = opts
+            if source and not any(o.startswith("-g") for o in opts.split()):
+                # objdump -S needs debug info; -g leaves the code itself alone
+                cc_opts = opts + " -g"
+            try:
+                ok, stderr, info = self._compile_native(workdir, src, binary, lang, compiler, cc_opts, deadline)
+            finally:
+                self._cache_release()
+            timing['compile_ms'] = info['compile_ms']
+            self._check_cancelled()
+            if not ok:
+                return self._compile_failed("compilation failed", stderr or "Unknown compilation error",
+                                            {'cache_hit': False, 'compile_ms': info['compile_ms']})
+            # warnings
+            compilation.update(cache_hit=info['cache_hit'], compile_ms=info['compile_ms'],
+                               details=stderr or None)
+
+            t0 = time.perf_counter()
+            intel = job.get('asm_syntax') == 'intel'
+            asm, scope = self._disassemble_native(
+                binary, workdir, info['symbols'] if job.get('asm_scope', 'tu') == 'tu' else None,
+                source, intel, deadline)
+            timing['disasm_ms'] = _ms(t0)
+            metadata['asm'] = {'scope': scope, 'source': source, 'syntax': 'intel' if intel else 'att'}
+
+            argv = [binary]
+            metadata.update(language=lang, compiler=compiler)
+            metadata['pch'] = {
+                'used': info['pch_used'],
+                'header': PCH_HEADER if info['pch_used'] else None,
+                'est_saving_ms': info['pch_saving_ms']
+            }
+
+        elif lang in ('python', 'py'):
+            t0 = time.perf_counter()
+            with open(src, 'rb') as f:
+                source = f.read()
+            try:
+                code = compile(source, src, 'exec')
+            except (SyntaxError, ValueError) as e:
+                return self._compile_failed("syntax error", f"{type(e).__name__}: {e}")
+            timing['compile_ms'] = _ms(t0)
+            compilation['details'] = "interpreted language"
+
+            t0 = time.perf_counter()
+            buf = io.StringIO()
+            dis.dis(code, file=buf)
+            asm = buf.getvalue()
+            timing['disasm_ms'] = _ms(t0)
+
+            argv = ["python3", src]
+            metadata.update(language="python", interpreter="python3", opts=None)
+
+        elif lang == 'java':
+            class_name = os.path.splitext(os.path.basename(src))[0]
+            t0 = time.perf_counter()
+            res = self._step(["javac"] + opts.split() + ["-d", workdir, src], workdir, deadline)
+            timing['compile_ms'] = _ms(t0)
+            self._check_cancelled()
+            if res.returncode != 0:
+                return self._compile_failed("compilation failed",
+                                            res.stderr.decode('utf-8', errors='replace') or "Compilation error")
+            compilation['details'] = res.stderr.decode('utf-8', errors='replace') or None
+
+            t0 = time.perf_counter()
+            asm = self._disassemble(["javap", "-c", "-p", os.path.join(workdir, class_name + ".class")],
+                                    workdir, "/* disassembly failed */", deadline)
+            timing['disasm_ms'] = _ms(t0)
+
+            argv = ["java", "-cp", workdir, class_name]
+            metadata.update(language="java", compiler="javac")
+
+        else:
+            return {
+                'success': False,
+                'timestamp': _timestamp(),
+                'error': "unsupported language",
+                'language': lang
+            }
+
+        runs = max(1, int(job.get('runs') or 1))
+        warmup = max(0, int(job.get('warmup') or 0))
+        self._check_cancelled()
+        if job.get('compile_only'):
+            timing['total_ms'] = _ms(t_job)
+            return {
+                'success': True,
+                'timestamp': _timestamp(),
+                'asm': asm,
+                'compilation': compilation,
+                'metadata': metadata,
+                'timing': timing
+            }
+        report('partial', {'compilation': compilation, 'asm': asm, 'metadata': metadata})
+
+        self._enter_cgroup(job, 'run')
+        # one deadline for the warmup and measured runs together
+        deadline = time.monotonic() + limits['run']
+        def remaining() -> float:  # throws
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise TimeLimitExceeded('run')
+            return left
+
+        t0 = time.perf_counter()
+        for i in range(warmup):
+            report('progress', {'phase': 'warmup', 'run': i + 1, 'runs': warmup})
+            try:
+                self.run_measured(argv, workdir, timeout=remaining())
+            except subprocess.TimeoutExpired:
+                raise TimeLimitExceeded('run')
+        if warmup:
+            timing['warmup_ms'] = _ms(t0)
+
+        counter_interval = job.get('counter_interval_ms')
+        precision = job.get('precision')
+        metric = job.get('precision_metric') or 'wall_ms'
+        budget = job.get('time_budget_sec') or ADAPTIVE_BUDGET_SEC
+        # the budget cannot outlast the run deadline, warmup already used part of it
+        budget = min(budget, max(0.0, deadline - time.monotonic()))
+        stop, width = 'runs', None
+
+        # output of the first measured run only, the others go to /dev/null
+        capture = output.OutputCapture(job.get('output_limit') or output.OUTPUT_LIMIT,
+                                       self._open_stream(job))
+        t0 = time.perf_counter()
+        samples = []
+        try:
+            while len(samples) < runs:
+                report('progress', {'phase': 'run', 'run': len(samples) + 1, 'runs': runs})
+                try:
+                    samples.append(self.run_measured(argv, workdir, capture if not samples else None,
+                                                     timeout=remaining(),
+                                                     counter_interval_ms=counter_interval))
+                except (subprocess.TimeoutExpired, TimeLimitExceeded):
+                    if samples:
+                        # the runs that finished still make a result
+                        stop = 'time_limit'
+                        break
+                    if capture.write_fd is not None:
+                        # never started
+                        capture.finish()
+                    raise TimeLimitExceeded('run', capture.text() if capture.total else None)
+                if capture.stream is not None:
+                    self._close_stream(capture)
+                if precision and len(samples) >= min(ADAPTIVE_MIN_RUNS, runs):
+                    width = stats.relative_ci_width(stats.summarize(
+                        [self._sample(r)[metric] for r in samples]))
+                    if width is not None and width <= precision:
+                        stop = 'precision'
+                        break
+                    if time.perf_counter() - t0 >= budget:
+                        stop = 'time_budget'
+                        break
+        finally:
+            if capture.stream is not None:
+                self._close_stream(capture)
+        timing['run_ms'] = _ms(t0)
+        timing['total_ms'] = _ms(t_job)
+        # time spent in the harness itself rather than in the tools it drives
+        timing['overhead_ms'] = round(timing['total_ms'] - sum(
+            timing.get(k, 0) for k in ('compile_ms', 'disasm_ms', 'warmup_ms', 'run_ms')), 3)
+
+        run = self._representative(samples)
+        if DEBUG:
+            print(f"[Harness] {lang} job done, exit {run['exit_code']}, timing {timing}")
+
+        result = {
+            'success': True,
+            'timestamp': _timestamp(),
+            'exit_code': run['exit_code'],
+            'output': capture.text(),
+            'output_bytes': capture.total,
+            'output_truncated': capture.truncated,
+            'asm': asm,
+            'perf': run['perf'],
+            'perf_scaling': run['perf_scaling'],
+            'time': run['time'],
+            'vmstat': run['vmstat'],
+            'timeline': run['timeline'],
+            'compilation': compilation,
+            'metadata': metadata,
+            'timing': timing
+        }
+        if run['counter_timeline'] is not None:
+            result['counter_timeline'] = run['counter_timeline']
+        cg_stats = self._cgroup_stats(samples)
+        if cg_stats is not None:
+            result['cgroup'] = cg_stats
+            if cg_stats.get('run', {}).get('oom_kills'):
+                result['oom_killed'] = True
+        if runs > 1 or warmup or precision:
+            result['runs'] = self._summarize_runs(samples, warmup)
+            if stop == 'time_limit':
+                result['runs']['stop_reason'] = stop
+        if precision:
+            result['runs']['adaptive'] = {
+                'target': precision,
+                'metric': metric,
+                'rel_ci_width': width,
+                'converged': stop == 'precision',
+                'stop_reason': stop,
+                'max_runs': runs,
+                'time_budget_sec': budget
+            }
+            if DEBUG:
+                print(f"[Harness] {len(samples)} runs, {metric} CI width {width} ({stop})")
+        return result
+
+    @staticmethod
+    def _open_stream(job: dict) -> Optional[output.OutputStream]:
+        """Live output side channel, when the host asked for one"""
+        if not job.get('stream_port') or job.get('job_id') is None:
+            return None
+        try:
+            return output.OutputStream(job['job_id'], job['stream_port'])
+        except OSError as e:
+            print(f"[Harness] Output stream unavailable: {e}")
+            return None
+
+    @staticmethod
+    def _close_stream(capture: output.OutputCapture):
+        stream, capture.stream = capture.stream, None
+        stream.close()
+        if stream.dropped:
+            print(f"[Harness] Output stream dropped {stream.dropped} bytes")
+
+    @staticmethod
+    def _sample(run: dict) -> dict:
+        return {
+            'wall_ms': round(run['elapsed'] * 1000, 3),
+            'cycles': run['perf'].get('cycles'),
+            'instructions': run['perf'].get('instructions'),
+            'exit_code': run['exit_code']
+        }
+
+    @staticmethod
+    def _representative(samples: List[dict]) -> dict:
+        """The run closest to the median wall time, reported in perf/time/vmstat"""
+        mid = stats.median([r['elapsed'] for r in samples])
+        return min(samples, key=lambda r: abs(r['elapsed'] - mid))
+
+    @staticmethod
+    def _summarize_runs(samples: List[dict], warmup: int) -> dict:
+        """Per-run samples and their statistics, outliers flagged by index"""
+        rows = [Harness._sample(r) for r in samples]
+        return {
+            'count': len(rows),
+            'warmup': warmup,
+            'samples': rows,
+            'stats': {
+                metric: stats.summarize([row[metric] for row in rows])
+                for metric in RUN_METRICS
+            }
+        }
@@ -1,6 +1,9 @@
 from peewee import *
+from playhouse.migrate import SqliteMigrator, migrate
+from array import array
 import datetime
 import json
+import zlib
 from typing import Optional
 import os
 
@@ -35,9 +38,30 @@ class Job(BaseModel):
     lang = CharField(max_length=50)
     compiler = CharField(max_length=50)
     opts = CharField(max_length=255, default='')
+    runs = IntegerField(default=1)      # measured iterations
+    warmup = IntegerField(default=0)    # discarded iterations before them
+    # precision mode: stop once the CI of precision_metric is within
+    # precision * median, runs is then the cap
+    precision = FloatField(null=True)
+    precision_metric = CharField(max_length=20, null=True)
+    # read the counters every counter_interval_ms as well (JobTimeline)
+    counter_interval_ms = IntegerField(null=True)
+    # run phase limit, see Config.TIME_LIMIT_TIERS
+    time_limit_sec = FloatField(null=True)
+    # assembly: source lines interleaved; compile and disassemble only,
+    # asm_scope 'tu' (the job's own functions) or 'full' (the whole binary)
+    asm_source = BooleanField(default=False)
+    compile_only = BooleanField(default=False)
+    asm_scope = CharField(max_length=10, default='tu')
+    asm_syntax = CharField(max_length=10, default='att')     # or intel
+    # compile-only job fetching the full disassembly of that job (JobAsm)
+    asm_of = ForeignKeyField('self', null=True, backref='asm_jobs', on_delete='CASCADE')
     
     # Job status
-    status = CharField(max_length=20, default='queued')  # queued, running, completed, failed
+    status = CharField(max_length=20, default='queued')  # queued, running, cancelling, completed, failed, timeout, cancelled
+    
+    # result_cache.result_key() of the inputs
+    cache_key = CharField(max_length=64, null=True, index=True)
     
     # Job results (full JSON from execute.sh)
     result = TextField(null=True)
@@ -79,13 +103,106 @@ class JobMetrics(BaseModel):
     max_rss_kb = IntegerField(null=True)
     page_faults = IntegerField(null=True)
     
+    # Repeated runs: cycles/instructions/execution_time_ms above are medians
+    runs = IntegerField(null=True)
+    warmup_runs = IntegerField(null=True)
+    outlier_runs = IntegerField(null=True)
+    wall_mean_ms = FloatField(null=True)
+    wall_stddev_ms = FloatField(null=True)
+    wall_min_ms = FloatField(null=True)
+    wall_ci_low_ms = FloatField(null=True)
+    wall_ci_high_ms = FloatField(null=True)
+    cycles_stddev = FloatField(null=True)
+    cycles_ci_low = FloatField(null=True)
+    cycles_ci_high = FloatField(null=True)
+    instructions_stddev = FloatField(null=True)
+    instructions_ci_low = FloatField(null=True)
+    instructions_ci_high = FloatField(null=True)
+    
+    # Run phase cgroup (cgroup.py), over all runs
+    memory_peak_kb = IntegerField(null=True)
+    cpu_throttled_ms = FloatField(null=True)
+    oom_kills = IntegerField(null=True)
+    
     class Meta:
         table_name = 'job_metrics'
 
+class CachedResult(BaseModel):
+    """Job holding the result for a result_cache key (queued, running or done)"""
+    key = CharField(max_length=64, primary_key=True)
+    job = ForeignKeyField(Job, backref='cache_entries', on_delete='CASCADE')
+    
+    class Meta:
+        table_name = 'result_cache'
+
+class JobTimeline(BaseModel):
+    """Per-interval counter deltas of a job, packed (see set_series)"""
+    job = ForeignKeyField(Job, backref='timeline', unique=True, on_delete='CASCADE')
+    interval_ms = IntegerField()
+    points = IntegerField()
+    events = TextField()    # JSON list, the order of the series in data
+    data = BlobField()      # zlib'd int64: t_us, then one series per event
+    
+    class Meta:
+        table_name = 'job_timelines'
+    
+    def set_series(self, series: dict):
+        """Pack IntervalReader.series() output; None (not counting) is stored as -1"""
+        names = list(series['events'])
+        packed = array('q', (int(t * 1000) for t in series['t_ms']))
+        for name in names:
+            packed.extend(-1 if v is None else int(v) for v in series['events'][name])
+        self.interval_ms = series['interval_ms']
+        self.points = len(series['t_ms'])
+        self.events = json.dumps(names)
+        self.data = zlib.compress(packed.tobytes())
+    
+    def get_series(self) -> dict:
+        packed = array('q')
+        packed.frombytes(zlib.decompress(bytes(self.data)))
+        n = self.points
+        names = json.loads(self.events)
+        return {
+            'interval_ms': self.interval_ms,
+            't_ms': [t / 1000 for t in packed[:n]],
+            'events': {
+                name: [None if v < 0 else v for v in packed[(i + 1) * n:(i + 2) * n]]
+                for i, name in enumerate(names)
+            }
+        }
+
+class JobAsm(BaseModel):
+    """Full disassembly of a job, fetched after the fact (api /asm?full=1)"""
+    job = ForeignKeyField(Job, backref='full_asm', unique=True, on_delete='CASCADE')
+    data = BlobField()      # zlib'd text
+    
+    class Meta:
+        table_name = 'job_asm'
+    
+    def set_text(self, text: str):
+        self.data = zlib.compress(text.encode())
+    
+    def get_text(self) -> str:
+        return zlib.decompress(bytes(self.data)).decode()
+
+MODELS = [Job, JobMetrics, CachedResult, JobTimeline, JobAsm]
+
+def _add_missing_columns(model):
+    """Add columns declared on model since its table was created (nullable or with a default)"""
+    table = model._meta.table_name
+    have = {c.name for c in db.get_columns(table)}
+    missing = [f for f in model._meta.sorted_fields if f.column_name not in have]
+    if missing:
+        migrator = SqliteMigrator(db)
+        migrate(*[migrator.add_column(table, f.column_name, f) for f in missing])
+        print(f"Added columns to {table}: {[f.column_name for f in missing]}")
+
 def init_db():
     """Initialize database"""
     with db:
-        db.create_tables([Job, JobMetrics])
+        db.create_tables(MODELS)
+        for model in MODELS:
+            _add_missing_columns(model)
         print("Database initialized")
 
 def get_db():
@@ -0,0 +1,182 @@
+import os
+import json
+import fcntl
+import queue
+import select
+import socket
+import threading
+from typing import Optional
+from util import send_sock
+
+# output.py
+
+# Bounded capture of a program's stdout+stderr for the agent. The program
+# writes into a pipe and a reader thread keeps only the first and last
+# limit/2 bytes, so neither the agent nor anything downstream (vsock, the
+# manager's json.loads, SQLite) ever holds more than `limit` bytes of output,
+# however much the program prints.
+#
+# Optionally every chunk is also forwarded to the host as it is read, over a
+# guest-initiated vsock connection (Firecracker hands it to the host listener
+# on <uds_path>_<port>, see output_relay.py). Frames use util.send_sock: a
+# JSON hello {"job_id"}, raw output chunks, then an empty frame at the end.
+# The forwarding queue is bounded too; chunks that do not fit are dropped
+# and counted rather than stalling the program.
+#
+# finish() waits up to FINISH_TIMEOUT for EOF. Callers kill the program's
+# leftovers first (its process group and cgroup), so that is immediate unless
+# something escaped both; then the reader is woken through a second pipe,
+# takes what is buffered without blocking and stops before the pipe is
+# closed, so it never reads from a descriptor number reused by the next job.
+
+OUTPUT_LIMIT = 256 * 1024
+CHUNK = 64 * 1024
+PIPE_SIZE = 1 << 20         # fewer stalls for programs that print a lot
+HOST_CID = 2
+STREAM_QUEUE = 64           # chunks waiting for the host before dropping
+FINISH_TIMEOUT = 5          # a background child may hold the pipe open
+
+
+class OutputStream:
+    """Guest -> host side channel for live output of one job"""
+
+    def __init__(self, job_id: int, port: int, cid: int = HOST_CID,
+                 maxsize: int = STREAM_QUEUE):  # throws
+        self.sock = socket.socket(socket.AF_VSOCK, socket.SOCK_STREAM)
+        try:
+            self.sock.connect((cid, port))
+            send_sock(self.sock, json.dumps({'job_id': job_id}).encode('utf-8'))
+        except OSError:
+            self.sock.close()
+            raise
+        self.dropped = 0
+        self.broken = False
+        self._q = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._loop, name="output-stream", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            chunk = self._q.get()
+            if chunk is None:
+                return
+            if self.broken:
+                continue
+            try:
+                send_sock(self.sock, chunk)
+            except OSError as e:
+                print(f"[OutputStream] Host went away: {e}")
+                self.broken = True
+
+    def send(self, chunk: bytes):
+        try:
+            self._q.put_nowait(chunk)
+        except queue.Full:
+            self.dropped += len(chunk)
+
+    def close(self):
+        """Flush what is queued, send the end frame and close"""
+        self._q.put(None)
+        self._thread.join()
+        try:
+            if not self.broken:
+                send_sock(self.sock, b"")
+        except OSError:
+            pass
+        finally:
+            self.sock.close()
+
+
+class OutputCapture:
+    """Pipe for a program's stdout+stderr, keeping its head and tail"""
+
+    def __init__(self, limit: int = OUTPUT_LIMIT, stream: Optional[OutputStream] = None):
+        self.limit = limit
+        self.stream = stream
+        self.total = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._r, self.write_fd = os.pipe2(os.O_CLOEXEC)
+        try:
+            fcntl.fcntl(self.write_fd, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+        except OSError:
+            # over /proc/sys/fs/pipe-max-size, keep the default
+            pass
+        self._thread = None
+        self._wake_r, self._wake_w = os.pipe2(os.O_CLOEXEC)
+
+    def start(self):
+        """Close our copy of the write end (the child has it) and start reading"""
+        os.close(self.write_fd)
+        self.write_fd = None
+        self._thread = threading.Thread(target=self._loop, name="output", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                ready, _, _ = select.select([self._r, self._wake_r], [], [])
+                if self._r not in ready:
+                    self._drain()
+                    return
+                chunk = os.read(self._r, CHUNK)
+            except OSError:
+                return
+            if not chunk:
+                return
+            self._chunk(chunk)
+
+    def _drain(self):
+        """What is already in the pipe, without waiting for more"""
+        os.set_blocking(self._r, False)
+        while True:
+            try:
+                chunk = os.read(self._r, CHUNK)
+            except (BlockingIOError, OSError):
+                return
+            if not chunk:
+                return
+            self._chunk(chunk)
+
+    def _chunk(self, chunk: bytes):
+        self._add(chunk)
+        if self.stream is not None:
+            self.stream.send(chunk)
+
+    def _add(self, chunk: bytes):
+        self.total += len(chunk)
+        half = self.limit // 2
+        room = half - len(self._head)
+        if room > 0:
+            self._head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self._tail += chunk[-half:]
+            if len(self._tail) > half:
+                del self._tail[:len(self._tail) - half]
+
+    def finish(self, timeout: float = FINISH_TIMEOUT):
+        """Wait for EOF; a leftover background child holding the pipe is cut off"""
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                os.write(self._wake_w, b"x")
+                self._thread.join()
+        for fd in (self._r, self._wake_r, self._wake_w):
+            os.close(fd)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self._head) + len(self._tail)
+
+    def text(self) -> str:
+        if not self.truncated:
+            data = bytes(self._head + self._tail)
+        else:
+            skipped = self.total - len(self._head) - len(self._tail)
+            data = bytes(self._head) + f"\n... [{skipped} bytes truncated] ...\n".encode() + \
+                bytes(self._tail)
+        return data.decode('utf-8', errors='replace')
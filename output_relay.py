@@ -0,0 +1,101 @@
+import os
+import json
+import socket
+import threading
+from typing import List, Optional
+import redis
+from util import Container, rec_sock
+
+DEBUG = True
+
+# output_relay.py
+
+# Host end of the agents' live output side channel (see output.py). A
+# guest-initiated vsock connection to port P arrives on the unix socket
+# <uds_path>_P next to the guest's vsock UDS, so each guest gets a listener
+# there. Chunks are published on the redis channel OUTPUT_CHANNEL.format(job_id)
+# as they arrive, and an empty message marks the end; nothing is buffered, a
+# client that subscribes late (the API's SSE endpoint) sees the rest only.
+# A stream is relayed only for a job in flight on the guest that opened it
+# (Container.jobs), so no guest can write into another job's channel.
+
+OUTPUT_CHANNEL = "benchr:output:{}"
+# frames are output chunks (output.CHUNK), anything much bigger is bogus
+MAX_CHUNK = 1024 * 1024
+
+
+class OutputRelay:
+    """Listens for every guest's output stream and publishes it to redis"""
+
+    def __init__(self, port: int, redis_url: str):
+        self._port = port
+        self._r = redis.Redis.from_url(redis_url)
+        self._socks: List[socket.socket] = []
+        self._running = False
+
+    def path(self, ctr: Container) -> str:
+        return f"{ctr.vsock}_{self._port}"
+
+    def start(self, containers: List[Container]):
+        """
+        Listen for each guest, ready or not: one still booting or down at
+        start reuses the path when the pool brings it up (restart() keeps
+        the guest's directory and CID)
+        """
+        self._running = True
+        for ctr in containers:
+            path = self.path(ctr)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(path)
+            sock.listen(4)
+            self._socks.append(sock)
+            threading.Thread(target=self._accept, args=(sock, ctr), daemon=True).start()
+        print(f"[OutputRelay] Listening on port {self._port} for {len(containers)} guests")
+
+    def _accept(self, sock: socket.socket, ctr: Container):
+        while self._running:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._relay, args=(conn, ctr), daemon=True).start()
+
+    def _relay(self, conn: socket.socket, ctr: Container):
+        """Publish one job's stream: hello, chunks, empty end frame"""
+        cid = ctr.cid
+        job_id: Optional[int] = None
+        try:
+            claimed = json.loads(rec_sock(conn, MAX_CHUNK))['job_id']
+            if claimed not in list(ctr.jobs):
+                print(f"[OutputRelay] Container {cid} is not running job {claimed!r}, stream dropped")
+                return
+            job_id = claimed
+            channel = OUTPUT_CHANNEL.format(job_id)
+            sent = 0
+            while True:
+                chunk = rec_sock(conn, MAX_CHUNK)
+                self._r.publish(channel, chunk)
+                if not chunk:
+                    break
+                sent += len(chunk)
+            if DEBUG:
+                print(f"[OutputRelay] Job {job_id} on container {cid}: relayed {sent} bytes")
+        except (OSError, RuntimeError, ValueError, KeyError, TypeError) as e:
+            print(f"[OutputRelay] Stream from container {cid} ended: {e}")
+            if job_id is not None:
+                try:
+                    self._r.publish(OUTPUT_CHANNEL.format(job_id), b"")
+                except redis.RedisError:
+                    pass
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._running = False
+        for sock in self._socks:
+            sock.close()
+        self._socks = []
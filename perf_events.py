@@ -0,0 +1,275 @@
+import os
+import time
+import ctypes
+import struct
+import platform
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# perf_events.py
+
+# Counting perf events through perf_event_open(2) directly, so the agent does
+# not need to wrap every run in the perf binary. Counters are opened on a
+# child that is blocked before exec, disabled with enable_on_exec and inherit,
+# so they count exactly the exec'd program and everything it forks.
+#
+# Events are opened in groups; a group is scheduled onto the PMU as a whole,
+# and when not all groups fit they are multiplexed. Every counter is read with
+# TIME_ENABLED/TIME_RUNNING and scaled by enabled/running, the same
+# extrapolation perf stat does; the ratio is reported per event. (With
+# inherit, PERF_FORMAT_GROUP reads are not allowed, so each fd is read
+# separately.)
+
+NR_PERF_EVENT_OPEN = {'x86_64': 298, 'aarch64': 241}.get(platform.machine(), 298)
+
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+
+HW = {
+    'cycles': 0,
+    'instructions': 1,
+    'cache_references': 2,
+    'cache_misses': 3,
+    'branch_instructions': 4,
+    'branch_misses': 5,
+}
+SW = {
+    'task_clock': 1,
+    'page_faults': 2,
+    'context_switches': 3,
+    'cpu_migrations': 4,
+    'minor_faults': 5,
+    'major_faults': 6,
+}
+
+# cycles/instructions/branches together so IPC and branch miss rate come
+# from the same schedule; the cache pair on its own
+GROUPS = [
+    [(PERF_TYPE_HARDWARE, 'cycles'), (PERF_TYPE_HARDWARE, 'instructions'),
+     (PERF_TYPE_HARDWARE, 'branch_instructions'), (PERF_TYPE_HARDWARE, 'branch_misses')],
+    [(PERF_TYPE_HARDWARE, 'cache_references'), (PERF_TYPE_HARDWARE, 'cache_misses')],
+    [(PERF_TYPE_SOFTWARE, name) for name in SW],
+]
+
+FLAG_DISABLED = 1 << 0
+FLAG_INHERIT = 1 << 1
+FLAG_EXCLUDE_KERNEL = 1 << 5
+FLAG_EXCLUDE_HV = 1 << 6
+FLAG_ENABLE_ON_EXEC = 1 << 12
+
+FORMAT_TOTAL_TIME_ENABLED = 1 << 0
+FORMAT_TOTAL_TIME_RUNNING = 1 << 1
+
+PERF_FLAG_FD_CLOEXEC = 1 << 3
+
+
+class PerfEventAttr(ctypes.Structure):
+    """struct perf_event_attr up to PERF_ATTR_SIZE_VER5"""
+    _fields_ = [
+        ('type', ctypes.c_uint32),
+        ('size', ctypes.c_uint32),
+        ('config', ctypes.c_uint64),
+        ('sample_period', ctypes.c_uint64),
+        ('sample_type', ctypes.c_uint64),
+        ('read_format', ctypes.c_uint64),
+        ('flags', ctypes.c_uint64),
+        ('wakeup_events', ctypes.c_uint32),
+        ('bp_type', ctypes.c_uint32),
+        ('config1', ctypes.c_uint64),
+        ('config2', ctypes.c_uint64),
+        ('branch_sample_type', ctypes.c_uint64),
+        ('sample_regs_user', ctypes.c_uint64),
+        ('sample_stack_user', ctypes.c_uint32),
+        ('clockid', ctypes.c_int32),
+        ('sample_regs_intr', ctypes.c_uint64),
+        ('aux_watermark', ctypes.c_uint32),
+        ('sample_max_stack', ctypes.c_uint16),
+        ('reserved_2', ctypes.c_uint16),
+    ]
+
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.syscall.restype = ctypes.c_long
+
+
+def perf_event_open(attr: PerfEventAttr, pid: int, cpu: int = -1,
+                    group_fd: int = -1, flags: int = PERF_FLAG_FD_CLOEXEC) -> int:  # throws
+    fd = _libc.syscall(NR_PERF_EVENT_OPEN, ctypes.byref(attr), ctypes.c_int(pid),
+                       ctypes.c_int(cpu), ctypes.c_int(group_fd), ctypes.c_ulong(flags))
+    if fd < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return fd
+
+
+def _attr(type_: int, config: int, leader: bool, exclude_kernel: bool) -> PerfEventAttr:
+    attr = PerfEventAttr()
+    attr.type = type_
+    attr.size = ctypes.sizeof(PerfEventAttr)
+    attr.config = config
+    attr.read_format = FORMAT_TOTAL_TIME_ENABLED | FORMAT_TOTAL_TIME_RUNNING
+    attr.flags = FLAG_INHERIT | FLAG_EXCLUDE_HV
+    if exclude_kernel:
+        attr.flags |= FLAG_EXCLUDE_KERNEL
+    if leader:
+        # members follow their leader's enable state
+        attr.flags |= FLAG_DISABLED | FLAG_ENABLE_ON_EXEC
+    return attr
+
+
+class Counters:
+    """perf event groups attached to one (not yet exec'd) process"""
+
+    def __init__(self, pid: int, groups: List[List[Tuple[int, str]]] = GROUPS):
+        self.pid = pid
+        self._fds: List[Tuple[str, int]] = []
+        self.unavailable: Dict[str, str] = {}
+        self.exclude_kernel = False
+        for group in groups:
+            self._open_group(group)
+
+    def _open_group(self, group: List[Tuple[int, str]]):
+        leader = -1
+        for type_, name in group:
+            config = (HW if type_ == PERF_TYPE_HARDWARE else SW)[name]
+            try:
+                fd = self._open(type_, config, leader)
+            except OSError as e:
+                # no PMU in the guest, or the event is not supported
+                self.unavailable[name] = e.strerror
+                continue
+            if leader == -1:
+                leader = fd
+            self._fds.append((name, fd))
+
+    def _open(self, type_: int, config: int, leader: int) -> int:  # throws
+        try:
+            return perf_event_open(_attr(type_, config, leader == -1, self.exclude_kernel),
+                                   self.pid, group_fd=leader)
+        except OSError as e:
+            # perf_event_paranoid >= 2 without CAP_PERFMON: user space only
+            if e.errno not in (1, 13) or self.exclude_kernel:
+                raise
+            self.exclude_kernel = True
+            return perf_event_open(_attr(type_, config, leader == -1, True),
+                                   self.pid, group_fd=leader)
+
+    @property
+    def opened(self) -> bool:
+        return bool(self._fds)
+
+    @property
+    def names(self) -> List[str]:
+        return [name for name, _ in self._fds]
+
+    def read(self) -> Tuple[Dict[str, Optional[float]], Dict[str, Optional[float]]]:
+        """
+        Returns:
+            ({event: scaled count or None if never scheduled},
+             {event: fraction of the enabled time it was counting})
+        """
+        counts, scaling = {}, {}
+        for name, fd in self._fds:
+            value, enabled, running = struct.unpack("QQQ", os.read(fd, 24))
+            if running == 0:
+                counts[name], scaling[name] = None, 0.0
+                continue
+            ratio = running / enabled if enabled else 1.0
+            counts[name] = int(round(value / ratio)) if ratio < 1 else value
+            scaling[name] = round(ratio, 4)
+        return counts, scaling
+
+    def close(self):
+        for _, fd in self._fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._fds = []
+
+
+def derived(counts: Dict[str, Optional[float]]) -> dict:
+    """ipc and miss rates from raw counts, None where a count is missing"""
+    def ratio(a, b):
+        x, y = counts.get(a), counts.get(b)
+        return round(x / y, 6) if x is not None and y else None
+    return {
+        'ipc': ratio('instructions', 'cycles'),
+        'cache_miss_rate': ratio('cache_misses', 'cache_references'),
+        'branch_miss_rate': ratio('branch_misses', 'branch_instructions'),
+    }
+
+
+class IntervalReader:
+    """
+    Reads Counters every interval_ms from a background thread, for a per-interval
+    timeline. Reads of an inherit counter include its live children, so this
+    works with /usr/bin/time in between. When max_points is reached every other
+    reading is dropped and the interval doubles; series() reports the interval
+    its points are spaced at, initial_interval_ms the one asked for.
+    """
+
+    def __init__(self, counters: Counters, interval_ms: float, max_points: int = 2000):
+        self.counters = counters
+        self.names = counters.names
+        self.interval = interval_ms / 1000
+        self.interval_ms = interval_ms
+        self.initial_interval_ms = interval_ms
+        self.max_points = max_points
+        self._t: List[int] = []
+        self._readings: List[Dict[str, Optional[float]]] = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._t0 = 0
+
+    def start(self):
+        self._t0 = time.perf_counter_ns()
+        self._thread = threading.Thread(target=self._loop, name="perf-interval", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Take a last reading (before the counters are closed) and stop"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._read()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._read()
+
+    def _read(self):
+        if len(self._t) == self.max_points:
+            self._t = self._t[1::2]
+            self._readings = self._readings[1::2]
+            self.interval_ms *= 2
+            self.interval = self.interval_ms / 1000
+        counts, _ = self.counters.read()
+        self._t.append(time.perf_counter_ns() - self._t0)
+        self._readings.append(counts)
+
+    def series(self) -> dict:
+        """
+        Per-interval deltas of every counted event
+
+        Returns:
+            {'interval_ms': current interval, 't_ms': [end of each interval],
+             'events': {event: [delta or None if not counting]}}
+        """
+        names = self.names
+        events = {n: [] for n in names}
+        prev = {n: 0 for n in names}
+        for counts in self._readings:
+            for n in names:
+                v = counts.get(n)
+                if v is None:
+                    events[n].append(None)
+                    continue
+                # scaled counts of a multiplexed event can step back slightly
+                events[n].append(max(v - prev[n], 0))
+                prev[n] = v
+        return {
+            'interval_ms': self.interval_ms,
+            't_ms': [round(t / 1e6, 3) for t in self._t],
+            'events': events
+        }
@@ -0,0 +1,222 @@
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from util import ISerializer, FrameReader, MAX_FRAME, send_sock, rec_sock
+
+DEBUG = True
+
+# protocol.py
+
+# Host <-> agent message protocol, version 2. Every frame (util.send_sock,
+# serialized with the negotiated serializer) is one message
+#   {"type": ..., "id": <job id or ping sequence>, "body": {...}}
+# host -> agent
+#   submit    body is the job; the agent queues it and runs jobs in order
+#   cancel    stop that job (kills its program) or drop it from the queue
+#   ping      answered with pong right away, even while a job runs
+# agent -> host
+#   progress  {"phase": "compile" | "warmup" | "run", "run", "runs"}
+#   partial   part of the result ready early (compilation, asm, metadata);
+#             keys sent here may be left out of the result
+#   result    the final result; the job is done
+#   pong
+# so the manager can send the next job while one runs and interleave control
+# messages with results. Version 1 is the original exchange, one job frame
+# then one result frame, which guest images without this module still speak;
+# the version is agreed in the hello (util.negotiate).
+
+PROTOCOL_VERSION = 2
+PROTOCOLS = (2, 1)
+
+SUBMIT = "submit"
+PROGRESS = "progress"
+PARTIAL = "partial"
+RESULT = "result"
+CANCEL = "cancel"
+PING = "ping"
+PONG = "pong"
+
+
+def message(type_: str, id_: Optional[int] = None, body: Optional[dict] = None) -> dict:
+    return {'type': type_, 'id': id_, 'body': body if body is not None else {}}
+
+
+class Channel:
+    """Host end of a version 2 connection, replies matched to jobs by id"""
+
+    version = 2
+
+    def __init__(self, sock, ser: ISerializer, max_frame: int = MAX_FRAME):
+        self._sock = sock
+        self._ser = ser
+        self._frames = FrameReader(max_frame)
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, Tuple[Future, Optional[Callable[[dict], None]]]] = {}
+        self._partials: Dict[int, dict] = {}
+        self._pings: Dict[int, Future] = {}
+        self._seq = itertools.count(1)
+        self.closed = False
+        self._thread = threading.Thread(target=self._loop, name="channel", daemon=True)
+        self._thread.start()
+
+    def _send(self, msg: dict):  # throws
+        data = self._ser.serialize(msg)
+        with self._send_lock:
+            send_sock(self._sock, data)
+
+    def submit(self, job_id: int, data: dict,
+               on_progress: Optional[Callable[[dict], None]] = None) -> Future:
+        """
+        Queue a job on the agent
+
+        Returns:
+            Future of the result dict; fails with RuntimeError if the
+            connection is lost first
+        """
+        fut = Future()
+        with self._lock:
+            if self.closed:
+                fut.set_exception(RuntimeError("channel closed"))
+                return fut
+            self._jobs[job_id] = (fut, on_progress)
+        try:
+            self._send(message(SUBMIT, job_id, data))
+        except OSError as e:
+            self._fail(e)
+        return fut
+
+    def cancel(self, job_id: int) -> bool:
+        """Ask the agent to stop the job; its result still arrives, flagged cancelled"""
+        try:
+            self._send(message(CANCEL, job_id))
+            return True
+        except OSError as e:
+            self._fail(e)
+            return False
+
+    def ping(self, timeout: float = 5.0) -> float:  # throws
+        """Round trip to the agent in ms"""
+        seq = next(self._seq)
+        fut = Future()
+        with self._lock:
+            self._pings[seq] = fut
+        t0 = time.perf_counter()
+        try:
+            self._send(message(PING, seq))
+        except OSError as e:
+            self._fail(e)
+        fut.result(timeout)
+        return (time.perf_counter() - t0) * 1000
+
+    @property
+    def inflight(self) -> List[int]:
+        with self._lock:
+            return list(self._jobs)
+
+    def _loop(self):
+        try:
+            while True:
+                msg = self._ser.deserialize(self._frames.read(self._sock))
+                self._dispatch(msg.get('type'), msg.get('id'), msg.get('body') or {})
+        except (OSError, RuntimeError, ValueError) as e:
+            self._fail(e)
+
+    def _dispatch(self, type_: str, id_: int, body: dict):
+        with self._lock:
+            if type_ == PONG:
+                fut = self._pings.pop(id_, None)
+                if fut is not None:
+                    fut.set_result(None)
+                return
+            if type_ == RESULT:
+                fut, _ = self._jobs.pop(id_, (None, None))
+                partial = self._partials.pop(id_, {})
+            else:
+                fut, cb = self._jobs.get(id_, (None, None))
+        if fut is None:
+            if DEBUG:
+                print(f"[Channel] {type_} for unknown job {id_}")
+            return
+        if type_ == RESULT:
+            partial.update(body)
+            fut.set_result(partial)
+        elif type_ == PARTIAL:
+            with self._lock:
+                self._partials.setdefault(id_, {}).update(body)
+            if cb is not None:
+                cb({'partial': sorted(body)})
+        elif type_ == PROGRESS and cb is not None:
+            cb(body)
+
+    def _fail(self, err: Exception):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            pending = [f for f, _ in self._jobs.values()] + list(self._pings.values())
+            self._jobs.clear()
+            self._partials.clear()
+            self._pings.clear()
+        for fut in pending:
+            fut.set_exception(RuntimeError(f"connection lost: {err}"))
+
+    def close(self):
+        """Fail whatever is in flight; the socket itself belongs to the caller"""
+        self._fail(RuntimeError("channel closed"))
+
+
+class LegacyChannel:
+    """
+    Version 1 agents: one job frame, one result frame. Same interface as
+    Channel, jobs are sent one at a time and cannot be cancelled.
+    """
+
+    version = 1
+
+    def __init__(self, sock, ser: ISerializer, max_frame: int = MAX_FRAME):
+        self._sock = sock
+        self._ser = ser
+        self._max_frame = max_frame
+        self._exec = ThreadPoolExecutor(max_workers=1, thread_name_prefix="channel-v1")
+        self._inflight: List[int] = []
+        self.closed = False
+
+    def _roundtrip(self, job_id: int, data: dict) -> dict:  # throws
+        try:
+            send_sock(self._sock, self._ser.serialize(data))
+            return self._ser.deserialize(rec_sock(self._sock, self._max_frame))
+        except OSError as e:
+            self.closed = True
+            raise RuntimeError(f"connection lost: {e}")
+        finally:
+            self._inflight.remove(job_id)
+
+    def submit(self, job_id: int, data: dict,
+               on_progress: Optional[Callable[[dict], None]] = None) -> Future:
+        self._inflight.append(job_id)
+        return self._exec.submit(self._roundtrip, job_id, data)
+
+    def cancel(self, job_id: int) -> bool:
+        print(f"[LegacyChannel] Job {job_id}: version 1 agents cannot cancel")
+        return False
+
+    def ping(self, timeout: float = 5.0) -> float:  # throws
+        raise RuntimeError("version 1 agents do not answer pings")
+
+    @property
+    def inflight(self) -> List[int]:
+        return list(self._inflight)
+
+    def close(self):
+        self.closed = True
+        self._exec.shutdown(wait=False)
+
+
+def open_channel(sock, ser: ISerializer, version: int, max_frame: int = MAX_FRAME):
+    """Channel for the negotiated protocol version"""
+    if version >= 2:
+        return Channel(sock, ser, max_frame)
+    return LegacyChannel(sock, ser, max_frame)
@@ -0,0 +1,78 @@
+from models import db, Job, CachedResult
+from config import Config
+from typing import Optional
+from peewee import IntegrityError
+import hashlib
+
+# result_cache.py
+
+# Identical submissions (same code, language, compiler, options and guest
+# toolchain) share one job: a finished one is returned as is, a queued or
+# running one is attached to. CachedResult's primary key makes the claim
+# atomic across gunicorn workers.
+
+# statuses whose job can stand in for a new submission
+REUSABLE = ('queued', 'running', 'completed')
+
+def result_key(code: str, lang: str, compiler: str, opts: str,
+               toolchain: Optional[str] = None, variant: str = "") -> str:
+    """
+    sha256 over the inputs that determine a result
+    
+    Args:
+        variant: measurement settings such as repeated runs, left out of the
+        hash when empty so single-run keys stay as they were
+    """
+    h = hashlib.sha256()
+    parts = [toolchain or Config.TOOLCHAIN_VERSION, lang, compiler, opts, code]
+    if variant:
+        parts.insert(4, variant)
+    for part in parts:
+        h.update((part or '').encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def program_key(data: dict) -> str:
+    """Key of the job's program alone, without run settings (util.ProgramCosts)"""
+    return result_key(data['code'], data['lang'], data['compiler'], data['opts'])
+
+def lookup(key: str) -> Optional[Job]:
+    """Job for key if it is done or still on its way, else None"""
+    entry = CachedResult.get_or_none(CachedResult.key == key)
+    if entry is None:
+        return None
+    job = entry.job
+    if job.status in REUSABLE:
+        return job
+    # failed runs are not worth repeating to the user, drop them
+    entry.delete_instance()
+    return None
+
+def claim(key: str, job: Job) -> Optional[Job]:
+    """
+    Make job the holder of key
+    
+    Returns:
+        None if claimed, else the job that got there first
+    """
+    try:
+        with db.atomic():
+            CachedResult.create(key=key, job=job)
+        return None
+    except IntegrityError:
+        return lookup(key)
+
+def settle(job: Job):
+    """Point the key at job if it succeeded, forget it if it failed"""
+    if not job.cache_key:
+        return
+    if job.status == 'completed':
+        (CachedResult
+            .insert(key=job.cache_key, job=job)
+            .on_conflict_replace()
+            .execute())
+    else:
+        (CachedResult
+            .delete()
+            .where(CachedResult.key == job.cache_key, CachedResult.job == job)
+            .execute())
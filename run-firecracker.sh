@@ -2,10 +2,16 @@
 
 set -x
 
-#SOCK="${1:"fc3.vsock"}"
-SOCK="fc.vsock"
-rm -rvf /run/firecracker.socket
+# usage: run-firecracker.sh [CFG] [SOCK] [API_SOCK]
+# paths are relative to the cwd, VmPool runs each guest from its own dir
+HERE="$(cd "$(dirname "$0")" && pwd)"
+CFG="${1:-config.json}"
+SOCK="${2:-fc.vsock}"
+API_SOCK="${3:-/run/firecracker.socket}"
+rm -rvf "$API_SOCK"
 rm -rvf "$SOCK"
-kill -9 $(pgrep firecracker)
-CFG="config.json"
-./firecracker --config-file "$CFG"
+# only the single-VM default invocation owns every firecracker on the host
+if [ $# -eq 0 ]; then
+	kill -9 $(pgrep firecracker)
+fi
+exec "$HERE/firecracker" --api-sock "$API_SOCK" --config-file "$CFG"
@@ -0,0 +1,271 @@
+import os
+import time
+import threading
+from array import array
+from typing import List
+
+# sampler.py
+
+# High-frequency /proc sampler for the agent. A background thread reads the
+# measured process's stat/schedstat/status/io and /proc/stat every few ms into
+# one flat array of fixed size, so the cost per sample is a handful of
+# pread()s on fds opened once and no allocation beyond the parse.
+#
+# The buffer never grows: when it is full every other sample is dropped and
+# the interval doubles, so a long run keeps its beginning at a coarser rate
+# instead of losing it. Results are downsampled to a few hundred points.
+#
+# The guest has a single vCPU, so every tick preempts the program; the time
+# spent sampling is reported with the timeline.
+
+SAMPLE_INTERVAL_MS = 5
+MIN_INTERVAL_MS = 1
+MAX_INTERVAL_MS = 100
+CAPACITY = 4096
+TIMELINE_POINTS = 200
+
+# one row of the buffer
+FIELDS = (
+    't_ns',                         # since start()
+    'rss_kb',
+    'cpu_ns',                       # schedstat on-CPU time, ns resolution
+    'utime', 'stime',               # clock ticks
+    'minor_faults', 'major_faults',
+    'voluntary_switches', 'involuntary_switches',
+    'read_bytes', 'write_bytes',
+    # /proc/stat: user nice system idle iowait irq softirq steal
+    'sys_user', 'sys_nice', 'sys_system', 'sys_idle', 'sys_iowait',
+    'sys_irq', 'sys_softirq', 'sys_steal',
+    'sys_intr', 'sys_ctxt', 'procs_running', 'procs_blocked',
+)
+STRIDE = len(FIELDS)
+COL = {name: i for i, name in enumerate(FIELDS)}
+
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_KB = os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def _pread(fd: int, size: int = 4096) -> bytes:
+    try:
+        return os.pread(fd, size, 0)
+    except OSError:
+        # the process is gone
+        return b""
+
+
+def _after(buf: bytes, label: bytes) -> int:
+    i = buf.find(label)
+    if i < 0:
+        return 0
+    i += len(label)
+    j = i
+    while buf[j:j + 1] in (b' ', b'\t'):
+        j += 1
+    k = j
+    while buf[k:k + 1].isdigit():
+        k += 1
+    return int(buf[j:k] or 0)
+
+
+class Sampler:
+    """Samples one process and the system from a background thread"""
+
+    def __init__(self, pid: int, interval_ms: float = SAMPLE_INTERVAL_MS,
+                 capacity: int = CAPACITY, follow_child: bool = False):
+        """
+        Args:
+            pid: process to sample
+            interval_ms: initial sampling interval
+            capacity: samples kept before halving the rate
+            follow_child: sample pid's first child instead once it appears
+                (the program under /usr/bin/time)
+        """
+        self.pid = pid
+        self.interval = min(max(interval_ms, MIN_INTERVAL_MS), MAX_INTERVAL_MS) / 1000
+        self.initial_interval_ms = self.interval * 1000
+        self.capacity = capacity
+        self.follow_child = follow_child
+        self._buf = array('q', bytes(8 * STRIDE * capacity))
+        self._n = 0
+        self._fds = {}
+        self._stat_fd = os.open("/proc/stat", os.O_RDONLY)
+        self._stop = threading.Event()
+        self._thread = None
+        self._t0 = 0
+        self.busy_ns = 0
+        self.target = None
+        if not follow_child:
+            self._attach(pid)
+
+    def _attach(self, pid: int):
+        self.target = pid
+        for name in ('stat', 'schedstat', 'status', 'io'):
+            try:
+                self._fds[name] = os.open(f"/proc/{pid}/{name}", os.O_RDONLY)
+            except OSError:
+                pass
+
+    def _find_child(self):
+        try:
+            with open(f"/proc/{self.pid}/task/{self.pid}/children", 'rb') as f:
+                children = f.read().split()
+        except OSError:
+            # no CONFIG_PROC_CHILDREN: the wrapper is the best we can do
+            children = [str(self.pid).encode()]
+        if children:
+            self._attach(int(children[0]))
+
+    def start(self):
+        self._t0 = time.perf_counter_ns()
+        self._thread = threading.Thread(target=self._loop, name="sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Take a last sample and stop the thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+        for fd in list(self._fds.values()) + [self._stat_fd]:
+            os.close(fd)
+        self._fds = {}
+
+    def _loop(self):
+        while True:
+            self._sample()
+            if self._stop.wait(self.interval):
+                return
+
+    def _sample(self):
+        t = time.perf_counter_ns()
+        if self.target is None:
+            self._find_child()
+        if self._n == self.capacity:
+            self._decimate()
+
+        # fields that cannot be read (the process has been reaped) keep
+        # their last value, the counters are cumulative
+        if self._n:
+            off = (self._n - 1) * STRIDE
+            row = self._buf[off:off + STRIDE].tolist()
+        else:
+            row = [0] * STRIDE
+        row[0] = t - self._t0
+        fds = self._fds
+        if 'stat' in fds:
+            buf = _pread(fds['stat'])
+            f = buf[buf.rfind(b')') + 2:].split()
+            if len(f) > 21:
+                row[COL['minor_faults']] = int(f[7])
+                row[COL['major_faults']] = int(f[9])
+                row[COL['utime']] = int(f[11])
+                row[COL['stime']] = int(f[12])
+                row[COL['rss_kb']] = int(f[21]) * PAGE_KB
+        if 'schedstat' in fds:
+            f = _pread(fds['schedstat']).split()
+            if f:
+                row[COL['cpu_ns']] = int(f[0])
+        buf = _pread(fds['status']) if 'status' in fds else b""
+        if buf:
+            row[COL['voluntary_switches']] = _after(buf, b'\nvoluntary_ctxt_switches:')
+            row[COL['involuntary_switches']] = _after(buf, b'\nnonvoluntary_ctxt_switches:')
+        buf = _pread(fds['io']) if 'io' in fds else b""
+        if buf:
+            row[COL['read_bytes']] = _after(buf, b'\nread_bytes:')
+            row[COL['write_bytes']] = _after(buf, b'\nwrite_bytes:')
+
+        # the per-IRQ counts make /proc/stat large; only the head is parsed
+        buf = _pread(self._stat_fd, 65536)
+        cpu = buf[:buf.find(b'\n')].split()[1:9]
+        base = COL['sys_user']
+        for i, v in enumerate(cpu):
+            row[base + i] = int(v)
+        row[COL['sys_intr']] = _after(buf, b'\nintr')
+        row[COL['sys_ctxt']] = _after(buf, b'\nctxt')
+        row[COL['procs_running']] = _after(buf, b'\nprocs_running')
+        row[COL['procs_blocked']] = _after(buf, b'\nprocs_blocked')
+
+        off = self._n * STRIDE
+        self._buf[off:off + STRIDE] = array('q', row)
+        self._n += 1
+        self.busy_ns += time.perf_counter_ns() - t
+
+    def _decimate(self):
+        """Keep every other sample and halve the rate"""
+        keep = self._n // 2
+        for i in range(keep):
+            src, dst = (2 * i + 1) * STRIDE, i * STRIDE
+            self._buf[dst:dst + STRIDE] = self._buf[src:src + STRIDE]
+        self._n = keep
+        self.interval = min(self.interval * 2, MAX_INTERVAL_MS / 1000)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def rows(self) -> List[List[int]]:
+        return [self._buf[i * STRIDE:(i + 1) * STRIDE].tolist() for i in range(self._n)]
+
+    def _buckets(self, points: int) -> List[List[int]]:
+        """Last row of each of up to `points` equal slices (counters are cumulative)"""
+        rows = self.rows()
+        if len(rows) <= points:
+            return rows
+        step = len(rows) / points
+        return [rows[min(int((i + 1) * step) - 1, len(rows) - 1)] for i in range(points)]
+
+    def timeline(self, points: int = TIMELINE_POINTS) -> dict:
+        """
+        Downsampled per-process timeline, one list per series
+
+        Returns:
+            {'interval_ms', 'samples', 'overhead_ms', 't_ms', 'rss_kb',
+             'cpu_ms', 'user_ms', 'system_ms', 'voluntary_switches',
+             'involuntary_switches', 'minor_faults', 'major_faults',
+             'read_bytes', 'write_bytes'}
+        """
+        rows = self.rows()
+        picked = self._buckets(points)
+        # RSS is a gauge: report each slice's peak rather than its last value
+        peaks = []
+        if picked:
+            step = len(rows) / len(picked)
+            for i in range(len(picked)):
+                lo, hi = int(i * step), max(int((i + 1) * step), int(i * step) + 1)
+                peaks.append(max(r[COL['rss_kb']] for r in rows[lo:hi]))
+        col = lambda name: [r[COL[name]] for r in picked]
+        tick_ms = 1000 / CLK_TCK
+        return {
+            'interval_ms': self.initial_interval_ms,
+            'final_interval_ms': self.interval * 1000,
+            'samples': len(rows),
+            'overhead_ms': round(self.busy_ns / 1e6, 3),
+            't_ms': [round(r[0] / 1e6, 3) for r in picked],
+            'rss_kb': peaks,
+            'cpu_ms': [round(r[COL['cpu_ns']] / 1e6, 3) for r in picked],
+            'user_ms': [round(v * tick_ms, 1) for v in col('utime')],
+            'system_ms': [round(v * tick_ms, 1) for v in col('stime')],
+            'voluntary_switches': col('voluntary_switches'),
+            'involuntary_switches': col('involuntary_switches'),
+            'minor_faults': col('minor_faults'),
+            'major_faults': col('major_faults'),
+            'read_bytes': col('read_bytes'),
+            'write_bytes': col('write_bytes'),
+        }
+
+    def system_marks(self, points: int) -> List[dict]:
+        """
+        /proc/stat at the slice boundaries, keyed like measure._proc_snapshot
+
+        Returns:
+            [{'t', 'cpu', 'intr', 'ctxt', 'procs_running', 'procs_blocked'}]
+            with t in seconds since start()
+        """
+        base = COL['sys_user']
+        return [{
+            't': r[0] / 1e9,
+            'cpu': r[base:base + 8],
+            'intr': r[COL['sys_intr']],
+            'ctxt': r[COL['sys_ctxt']],
+            'procs_running': r[COL['procs_running']],
+            'procs_blocked': r[COL['procs_blocked']],
+        } for r in self._buckets(points)]
@@ -0,0 +1,88 @@
+import random
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# stats.py
+
+# Summary statistics for repeated benchmark runs. Standard library only, the
+# agent uses it inside the guest.
+
+def mean(xs: Sequence[float]) -> float:
+    return sum(xs) / len(xs)
+
+def median(xs: Sequence[float]) -> float:
+    s = sorted(xs)
+    m = len(s) // 2
+    return s[m] if len(s) % 2 else (s[m - 1] + s[m]) / 2
+
+def stddev(xs: Sequence[float]) -> float:
+    """Sample standard deviation, 0 for fewer than two samples"""
+    if len(xs) < 2:
+        return 0.0
+    mu = mean(xs)
+    return (sum((x - mu) ** 2 for x in xs) / (len(xs) - 1)) ** 0.5
+
+def quantile(xs: Sequence[float], q: float) -> float:
+    """Linear interpolation between closest ranks"""
+    s = sorted(xs)
+    pos = (len(s) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (pos - lo)
+
+def bootstrap_ci(xs: Sequence[float],
+                 stat: Callable[[Sequence[float]], float] = median,
+                 confidence: float = 0.95,
+                 resamples: int = 1000,
+                 seed: int = 0) -> Tuple[float, float]:
+    """
+    Percentile bootstrap confidence interval of stat
+
+    Seeded, so the same samples always give the same interval.
+    """
+    if len(xs) < 2:
+        return xs[0], xs[0]
+    rng = random.Random(seed)
+    estimates = [stat(rng.choices(xs, k=len(xs))) for _ in range(resamples)]
+    alpha = (1 - confidence) / 2
+    return quantile(estimates, alpha), quantile(estimates, 1 - alpha)
+
+def outliers(xs: Sequence[float], k: float = 1.5) -> List[int]:
+    """Indexes of samples outside Tukey's fences (k * IQR beyond the quartiles)"""
+    if len(xs) < 4:
+        return []
+    q1, q3 = quantile(xs, 0.25), quantile(xs, 0.75)
+    lo, hi = q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+    return [i for i, x in enumerate(xs) if x < lo or x > hi]
+
+def summarize(xs: Sequence[Optional[float]], confidence: float = 0.95) -> Optional[dict]:
+    """
+    Summary of one metric over the runs
+
+    Returns:
+        None if no run produced the metric, else
+        {n, median, mean, stddev, min, max, ci_low, ci_high, confidence, outliers}
+        where outliers are indexes into xs
+    """
+    present = [(i, x) for i, x in enumerate(xs) if x is not None]
+    if not present:
+        return None
+    values = [x for _, x in present]
+    lo, hi = bootstrap_ci(values, median, confidence)
+    return {
+        'n': len(values),
+        'median': median(values),
+        'mean': mean(values),
+        'stddev': stddev(values),
+        'min': min(values),
+        'max': max(values),
+        'ci_low': lo,
+        'ci_high': hi,
+        'confidence': confidence,
+        'outliers': [present[i][0] for i in outliers(values)]
+    }
+
+def relative_ci_width(summary: Optional[dict]) -> Optional[float]:
+    """(ci_high - ci_low) / |median|, None if undefined"""
+    if not summary or not summary['median']:
+        return None
+    return (summary['ci_high'] - summary['ci_low']) / abs(summary['median'])
@@ -0,0 +1,64 @@
+import os
+import shutil
+import pytest
+import cgroup
+import measure
+
+CONTROLLERS = ["memory", "pids", "cpu"]
+
+def test_limits_written(tmp_path):
+    cg = cgroup.Manager(str(tmp_path), CONTROLLERS).create("job-1-run", memory_max_mb=64,
+                                                            pids_max=32, cpu=0.5)
+    path = tmp_path / "job-1-run"
+    assert (path / "memory.max").read_text() == str(64 * 1024 * 1024)
+    assert (path / "pids.max").read_text() == "32"
+    assert (path / "cpu.max").read_text() == "50000 100000"
+    assert cg.limits == {'memory_max_mb': 64, 'pids_max': 32, 'cpu': 0.5}
+    cg.close()
+
+def test_disabled_controllers_not_limited(tmp_path):
+    cg = cgroup.JobCgroup(str(tmp_path / "job"), ["pids"], memory_max_mb=64, cpu=0.5)
+    assert not (tmp_path / "job" / "memory.max").exists()
+    assert cg.limits['memory_max_mb'] is None and cg.limits['pids_max'] == cgroup.JOB_PIDS_MAX
+    cg.close()
+
+def test_stats(tmp_path):
+    cg = cgroup.JobCgroup(str(tmp_path / "job"), CONTROLLERS)
+    (tmp_path / "job" / "memory.peak").write_text("1048576\n")
+    (tmp_path / "job" / "memory.current").write_text("max\n")
+    (tmp_path / "job" / "memory.events").write_text("low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n")
+    (tmp_path / "job" / "cpu.stat").write_text(
+        "usage_usec 25000\nuser_usec 20000\nsystem_usec 5000\n"
+        "nr_periods 10\nnr_throttled 4\nthrottled_usec 1500\n")
+    st = cg.stats()
+    assert st['memory_peak_bytes'] == 1048576 and st['memory_current_bytes'] is None
+    assert st['oom_kills'] == 1 and st['memory_max_hits'] == 3
+    assert st['cpu_usage_ms'] == 25.0 and st['cpu_system_ms'] == 5.0
+    assert st['nr_throttled'] == 4 and st['throttled_ms'] == 1.5
+    assert st['pids_peak'] is None
+    cg.close()
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_harness_reports_phase_cgroups(tmp_path, monkeypatch):
+    # the pids listed in the plain cgroup.procs below are long gone by close()
+    monkeypatch.setattr(cgroup.JobCgroup, "_kill", lambda self: None)
+    root = tmp_path / "cgroups"
+    root.mkdir()
+    work = tmp_path / "work"
+    work.mkdir()
+    src = work / "source.c"
+    src.write_text('int main(void) { return 0; }\n')
+    h = measure.Harness()
+    h.cgroups = cgroup.Manager(str(root), CONTROLLERS)
+    res = h.run({'job_id': 7, 'lang': 'c', 'compiler': 'gcc', 'opts': '-O2',
+                 'memory_limit_mb': 128}, str(work), str(src))
+    assert res['success']
+    assert set(res['cgroup']) == {'compile', 'run'}
+    run = res['cgroup']['run']
+    assert run['limits']['memory_max_mb'] == 128
+    # a plain directory has no memory.peak: falls back to the run's max RSS
+    assert run['memory_peak_source'] == 'rss' and run['memory_peak_bytes'] > 0
+    # the processes were moved in through cgroup.procs
+    pids = (root / "job-7-run" / "cgroup.procs").read_text().split()
+    assert pids and all(p.isdigit() and int(p) > 0 for p in pids)
+    assert h._job_cgroups == {} and h._cg is None
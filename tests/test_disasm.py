@@ -0,0 +1,70 @@
+import os
+import shutil
+import pytest
+import disasm
+import measure
+
+NM_OBJ = """0000000000000000 r .LC0
+0000000000000000 V DW.ref.__gxx_personality_v0
+0000000000000000 W _ZNSt12_Vector_baseIiSaIiEED2Ev
+0000000000000000 T main
+0000000000000000 t main.cold
+0000000000000000 b _ZL5cache
+"""
+
+NM_BIN = """0000000000001000 T _init
+00000000000010b0 000000000000000f t main.cold
+00000000000010c0 0000000000000080 T main
+0000000000001140 0000000000000026 T _start
+0000000000001260 0000000000000020 W _ZNSt12_Vector_baseIiSaIiEED2Ev
+"""
+
+OBJDUMP = """
+bin:     file format elf64-x86-64
+
+
+Disassembly of section .text:
+
+00000000000010b0 <main.cold>:
+    10b0:	e8 00 00 00 00       	call   1260
+
+00000000000010c0 <main>:
+    10c0:	c3                   	ret
+
+0000000000001140 <_start>:
+    1140:	f3 0f 1e fa          	endbr64
+
+0000000000001260 <std::_Vector_base<int, std::allocator<int> >::~_Vector_base()>:
+    1260:	c3                   	ret
+"""
+
+def test_tu_symbols_are_code_only():
+    assert disasm.tu_symbols(NM_OBJ) == ["_ZNSt12_Vector_baseIiSaIiEED2Ev", "main", "main.cold"]
+
+def test_locate_and_keep_functions():
+    table = disasm.symbol_table(NM_BIN)
+    addrs, span = disasm.locate(table, disasm.tu_symbols(NM_OBJ))
+    assert addrs == {0x10b0, 0x10c0, 0x1260} and span == (0x10b0, 0x1280)
+    assert disasm.objdump_argv("bin", True, span) == [
+        "objdump", "-d", "-C", "-S", "--start-address=0x10b0", "--stop-address=0x1280", "bin"]
+    out = disasm.keep_functions(OBJDUMP, addrs)
+    assert "<main>:" in out and "~_Vector_base()>:" in out and "<main.cold>:" in out
+    assert "_start" not in out
+    assert out.count("Disassembly of section .text:") == 1
+    assert disasm.locate(table, ["missing"]) == (set(), None)
+
+@pytest.mark.skipif(shutil.which("g++") is None or shutil.which("objdump") is None,
+                    reason="needs g++ and objdump")
+def test_compile_only_tu_scope(tmp_path):
+    src = os.path.join(tmp_path, "source.cpp")
+    with open(src, 'w') as f:
+        f.write('#include <cstdio>\nstatic int sq(int x) { return x * x; }\n'
+                'int main(int c, char **) { printf("%d\\n", sq(c)); }\n')
+    h = measure.Harness()
+    job = {'lang': 'cpp', 'compiler': 'g++', 'opts': '-O2', 'compile_only': True}
+    res = h.run(job, str(tmp_path), src)
+    assert res['success'] and 'output' not in res
+    assert res['metadata']['asm'] == {'scope': 'tu', 'source': False, 'syntax': 'att'}
+    assert "<main>:" in res['asm'] and "<_start>:" not in res['asm']
+    full = h.run(dict(job, asm_scope='full'), str(tmp_path), src)
+    assert full['metadata']['asm']['scope'] == 'full' and "<_start>:" in full['asm']
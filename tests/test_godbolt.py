@@ -0,0 +1,33 @@
+import godbolt
+from test_disasm import OBJDUMP
+
+def test_guest_compiler():
+    assert godbolt.guest_compiler("g++", "cpp") == "g++"
+    assert godbolt.guest_compiler("clang1701", "cpp") == "clang++"
+    assert godbolt.guest_compiler("cclang1701", "c") == "clang"
+    assert godbolt.guest_compiler("g132", "c") == "gcc"
+
+def test_response_asm():
+    res = godbolt.response({'success': True, 'compilation': {'success': True}, 'asm': OBJDUMP},
+                           {}, extra={'job_id': 1})
+    assert res['code'] == 0 and res['stderr'] == [] and res['benchr'] == {'job_id': 1}
+    text = [line['text'] for line in res['asm']]
+    assert text[:3] == ["main.cold:", "        call   1260", ""]
+    assert not any("file format" in t or "Disassembly" in t for t in text)
+    binary = godbolt.response({'success': True, 'asm': OBJDUMP}, {'binary': True, 'trim': True})
+    assert binary['asm'][0]['text'] == "00000000000010b0 <main.cold>:"
+    assert binary['asm'][1]['text'] == "  10b0: e8 00 00 00 00 call 1260"
+
+def test_response_compile_error():
+    res = godbolt.response({'success': False, 'compilation': {
+        'success': False, 'details': "a.cpp:1: error: x\na.cpp:2: note: y"}}, {})
+    assert res['code'] == 1 and res['asm'] == [{'text': "<Compilation failed>"}]
+    assert [line['text'] for line in res['stderr']] == ["a.cpp:1: error: x", "a.cpp:2: note: y"]
+
+def test_response_keeps_warnings_and_pending_shape():
+    res = godbolt.response({'success': True, 'compilation': {
+        'success': True, 'details': "a.cpp:3: warning: unused variable 'x'"}, 'asm': OBJDUMP}, {})
+    assert res['code'] == 0 and res['stderr'] == [{'text': "a.cpp:3: warning: unused variable 'x'"}]
+    pending = godbolt.pending({'job_id': 3, 'status': 'queued'})
+    assert pending['code'] == -1 and pending['asm'] and pending['benchr']['status'] == 'queued'
+    assert set(pending) - {'benchr'} == set(res)
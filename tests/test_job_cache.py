@@ -0,0 +1,68 @@
+import os
+import pytest
+import models
+from models import Job, JobMetrics, JobTimeline
+from job_cache import JobCache
+
+@pytest.fixture
+def db(tmp_path):
+    models.db.init(os.path.join(tmp_path, "benchr.db"))
+    models.init_db()
+    models.db.connect(reuse_if_open=True)
+    yield models.db
+    models.db.close()
+
+SERIES = {
+    'interval_ms': 10,
+    't_ms': [10.0, 20.5, 30.25],
+    'events': {
+        'cycles': [1000, 2000, 500],
+        'instructions': [3000, 1000, 500],
+        'cache_references': [10, None, 4],
+        'cache_misses': [5, None, 1],
+    }
+}
+
+def test_timeline_stored_apart_from_result(db):
+    job = Job.create(code="int main(){}", lang="c", compiler="gcc", opts="-O2",
+                     counter_interval_ms=10)
+    c = JobCache()
+    assert c.get(job.id)['counter_interval_ms'] == 10
+    c.update(job.id, {'success': True, 'perf': {'cycles': 3500}, 'time': {},
+                      'counter_timeline': SERIES})
+    assert 'counter_timeline' not in Job.get_by_id(job.id).get_result()
+    assert JobMetrics.get(JobMetrics.job == job).cycles == 3500
+
+    t = c.get_timeline(job.id)
+    assert t['interval_ms'] == 10 and t['t_ms'] == SERIES['t_ms']
+    assert t['events'] == SERIES['events']
+    assert t['derived']['ipc'] == [3.0, 0.5, 1.0]
+    assert t['derived']['cache_miss_rate'] == [0.5, None, 0.25]
+
+def test_no_timeline(db):
+    job = Job.create(code="int main(){}", lang="c", compiler="gcc")
+    assert JobCache().get_timeline(job.id) is None
+    assert JobTimeline.select().count() == 0
+
+def test_time_limit_and_timeout_status(db):
+    job = Job.create(code="int main(){for(;;);}", lang="c", compiler="gcc", opts="-O2",
+                     time_limit_sec=2.5)
+    c = JobCache()
+    data = c.get(job.id)
+    assert data['time_limit_sec'] == 2.5 and data['compile_time_limit_sec'] > 0
+    c.update(job.id, {'success': False, 'timed_out': True,
+                      'timeout': {'phase': 'run', 'limit_sec': 2.5}})
+    assert Job.get_by_id(job.id).status == 'timeout'
+
+def test_full_asm_kept_for_the_job_it_was_fetched_for(db):
+    job = Job.create(code="int main(){}", lang="c", compiler="gcc", opts="-O2")
+    fetch = Job.create(code=job.code, lang="c", compiler="gcc", opts="-O2",
+                       compile_only=True, asm_scope='full', asm_of=job)
+    c = JobCache()
+    data = c.get(fetch.id)
+    assert data['compile_only'] and data['asm_scope'] == 'full'
+    assert c.get_full_asm(job.id) is None and c.asm_job(job.id).id == fetch.id
+    c.update(fetch.id, {'success': True, 'asm': "<main>:\n ret\n", 'timing': {}})
+    assert c.get_full_asm(job.id) == "<main>:\n ret\n"
+    assert 'asm' not in Job.get_by_id(fetch.id).get_result()
+    assert JobMetrics.select().count() == 0
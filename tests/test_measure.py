@@ -0,0 +1,223 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import pytest
+import measure
+import output
+
+TIME = """\tCommand being timed: "./bin"
+\tUser time (seconds): 0.10
+\tSystem time (seconds): 0.02
+\tPercent of CPU this job got: 95%
+\tElapsed (wall clock) time (h:mm:ss or m:ss): 1:02.50
+\tMaximum resident set size (kbytes): 2048
+\tMinor (reclaiming a frame) page faults: 72
+\tFile system outputs: 8
+\tExit status: 3
+"""
+
+def test_parse_time_v_matches_jc_keys():
+    t = measure.parse_time_v(TIME)
+    assert t['command_being_timed'] == "./bin"
+    assert t['user_time'] == 0.10 and t['cpu_percent'] == 95
+    assert t['maximum_resident_set_size'] == 2048
+    assert t['block_output_operations'] == 8
+    assert t['exit_status'] == 3
+    assert t['elapsed_time_minutes'] == 1 and t['elapsed_time_seconds'] == 2
+    assert t['elapsed_time_centiseconds'] == 50
+    assert t['elapsed_time_total_seconds'] == 62.5
+
+def test_vmstat_record():
+    before = {'cpu': [10, 0, 10, 80, 0, 0, 0, 0], 'ctxt': 100, 'MemFree': 1}
+    after = {'cpu': [40, 0, 20, 140, 0, 0, 0, 0], 'ctxt': 300, 'MemFree': 2,
+             'procs_running': 2}
+    rec = measure.vmstat_record(before, after, 2.0)
+    assert rec['user_time'] == 30 and rec['system_time'] == 10 and rec['idle_time'] == 60
+    assert rec['context_switches'] == 100
+    assert rec['free_mem'] == 2 and rec['runnable_procs'] == 2
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_run_c(tmp_path):
+    src = os.path.join(tmp_path, "source.c")
+    with open(src, 'w') as f:
+        f.write('#include <stdio.h>\nint main(void) { puts("hi"); return 3; }\n')
+    res = measure.Harness().run({'lang': 'c', 'compiler': 'gcc', 'opts': '-O2'}, str(tmp_path), src)
+    assert res['success'] and res['exit_code'] == 3
+    assert res['output'] == "hi\n"
+    assert res['compilation']['success'] and 'compile_ms' in res['compilation']
+    assert res['time']['elapsed_time_total_seconds'] > 0
+    assert set(res['timing']) >= {'compile_ms', 'run_ms', 'overhead_ms'}
+
+def test_python_syntax_error(tmp_path):
+    src = os.path.join(tmp_path, "source.py")
+    with open(src, 'w') as f:
+        f.write("def (:\n")
+    res = measure.Harness().run({'lang': 'py'}, str(tmp_path), src)
+    assert not res['success']
+    assert res['compilation']['error'] == "syntax error"
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_repeated_runs(tmp_path):
+    src = os.path.join(tmp_path, "source.c")
+    with open(src, 'w') as f:
+        f.write('int main(void) { return 0; }\n')
+    job = {'lang': 'c', 'compiler': 'gcc', 'opts': '-O2', 'runs': 5, 'warmup': 2}
+    res = measure.Harness().run(job, str(tmp_path), src)
+    runs = res['runs']
+    assert runs['count'] == 5 and runs['warmup'] == 2
+    assert len(runs['samples']) == 5
+    wall = runs['stats']['wall_ms']
+    assert wall['n'] == 5 and wall['ci_low'] <= wall['median'] <= wall['ci_high']
+    assert 'warmup_ms' in res['timing']
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_precision_mode_stops_early(tmp_path):
+    src = os.path.join(tmp_path, "source.c")
+    with open(src, 'w') as f:
+        f.write('int main(void) { return 0; }\n')
+    # a target this loose is met as soon as the CI is first checked
+    job = {'lang': 'c', 'compiler': 'gcc', 'opts': '-O2', 'runs': 40, 'precision': 10.0}
+    res = measure.Harness().run(job, str(tmp_path), src)
+    adaptive = res['runs']['adaptive']
+    assert adaptive['converged'] and adaptive['stop_reason'] == 'precision'
+    assert res['runs']['count'] == measure.ADAPTIVE_MIN_RUNS
+
+def test_output_is_bounded(tmp_path):
+    src = os.path.join(tmp_path, "source.py")
+    with open(src, 'w') as f:
+        f.write("for i in range(100000):\n    print(i)\n")
+    res = measure.Harness().run({'lang': 'py', 'output_limit': 1000}, str(tmp_path), src)
+    assert res['output_truncated'] and res['output_bytes'] > 100000
+    assert res['output'].startswith("0\n1\n") and res['output'].endswith("99999\n")
+    assert len(res['output']) < 1100
+
+def test_cancel_kills_running_program(tmp_path):
+    src = os.path.join(tmp_path, "source.py")
+    with open(src, 'w') as f:
+        f.write("import time\ntime.sleep(30)\n")
+    h = measure.Harness()
+    progress = []
+    def report(kind, body):
+        progress.append((kind, body))
+        if kind == 'progress' and body['phase'] == 'run':
+            threading.Timer(0.2, h.cancel).start()
+    t0 = time.perf_counter()
+    with pytest.raises(measure.Cancelled):
+        h.run({'lang': 'py'}, str(tmp_path), src, report)
+    assert time.perf_counter() - t0 < 10
+    assert [k for k, _ in progress] == ['progress', 'partial', 'progress']
+    assert 'asm' in progress[1][1]
+
+def test_run_time_limit(tmp_path):
+    src = os.path.join(tmp_path, "source.py")
+    with open(src, 'w') as f:
+        f.write("print('started', flush=True)\nwhile True:\n    pass\n")
+    t0 = time.perf_counter()
+    res = measure.Harness().run({'lang': 'py', 'runs': 3, 'time_limit_sec': 0.5}, str(tmp_path), src)
+    assert time.perf_counter() - t0 < 5
+    assert not res['success'] and res['timed_out']
+    assert res['timeout'] == {'phase': 'run', 'limit_sec': 0.5}
+    assert res['output'] == "started\n"
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_compile_time_limit(tmp_path):
+    src = os.path.join(tmp_path, "source.c")
+    with open(src, 'w') as f:
+        f.write('int main(void) { return 0; }\n')
+    job = {'lang': 'c', 'compiler': 'gcc', 'opts': '-O2', 'compile_time_limit_sec': 0.001}
+    res = measure.Harness().run(job, str(tmp_path), src)
+    assert res['timed_out'] and res['timeout']['phase'] == 'compile'
+
+def test_kill_strays():
+    proc = subprocess.Popen(["sh", "-c", "sleep 30 & sleep 30"])
+    time.sleep(0.2)
+    pids = measure.descendants(os.getpid())
+    assert proc.pid in pids and len(pids) >= 3
+    assert measure.kill_strays() == len(pids)
+    assert measure.descendants(os.getpid()) == []
+
+def test_time_limit_keeps_finished_runs(tmp_path):
+    src = os.path.join(tmp_path, "source.py")
+    with open(src, 'w') as f:
+        f.write("import time\ntime.sleep(0.3)\n")
+    job = {'lang': 'py', 'runs': 50, 'warmup': 1, 'precision': 1e-6,
+           'time_budget_sec': 2, 'time_limit_sec': 2}
+    res = measure.Harness().run(job, str(tmp_path), src)
+    assert res['success'] and not res.get('timed_out')
+    assert 0 < res['runs']['count'] < 50
+    assert res['runs']['adaptive']['stop_reason'] in ('time_budget', 'time_limit')
+    assert res['runs']['adaptive']['time_budget_sec'] < 2
+
+def test_background_child_does_not_hold_output(tmp_path):
+    src = os.path.join(tmp_path, "source.py")
+    with open(src, 'w') as f:
+        f.write("import subprocess\nprint('parent', flush=True)\nsubprocess.Popen(['sleep', '30'])\n")
+    t0 = time.perf_counter()
+    res = measure.Harness().run({'lang': 'py'}, str(tmp_path), src)
+    assert time.perf_counter() - t0 < output.FINISH_TIMEOUT
+    assert res['success'] and res['output'] == "parent\n"
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs gcc")
+def test_cache_entry_not_matching_its_sum_is_rebuilt(tmp_path, monkeypatch):
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(measure, "CACHE_MNT", str(cache))
+    monkeypatch.setattr(measure, "CC_CACHE", str(cache / "cc"))
+    monkeypatch.setattr(measure, "CACHE_SUMS", str(cache / "sums"))
+    monkeypatch.setattr(measure.Harness, "_cache_mount", lambda self: True)
+    src = os.path.join(tmp_path, "source.c")
+    with open(src, 'w') as f:
+        f.write('#include <stdio.h>\nint main(void) { puts("real"); return 0; }\n')
+    job = {'lang': 'c', 'compiler': 'gcc', 'opts': '-O2'}
+    h = measure.Harness()
+    assert not h.run(job, str(tmp_path), src)['compilation']['cache_hit']
+    assert h.run(job, str(tmp_path), src)['compilation']['cache_hit']
+
+    # the program of another job written over the entry
+    entry, = [p for p in (cache / "cc").rglob("*") if p.is_file() and not p.suffix]
+    shutil.copy("/bin/true", entry)
+    res = h.run(job, str(tmp_path), src)
+    assert not res['compilation']['cache_hit'] and res['output'] == "real\n"
+    assert h.run(job, str(tmp_path), src)['compilation']['cache_hit']
+
+@pytest.mark.skipif(shutil.which("gcc") is None or os.geteuid() != 0, reason="needs gcc and root")
+def test_job_user_runs_compiler_and_program():
+    # pytest's own tmp_path is not reachable for other users
+    workdir = tempfile.mkdtemp()
+    try:
+        src = os.path.join(workdir, "source.c")
+        with open(src, 'w') as f:
+            f.write('#include <stdio.h>\n#include <unistd.h>\n'
+                    'int main(void) { printf("%d\\n", (int)getuid()); return 0; }\n')
+        h = measure.Harness()
+        h.job_user = measure.JOB_UID
+        res = h.run({'lang': 'c', 'compiler': 'gcc', 'opts': '-O2'}, workdir, src)
+        assert res['success'] and res['output'] == f"{measure.JOB_UID}\n"
+        assert os.stat(os.path.join(workdir, "bin")).st_uid == measure.JOB_UID
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def test_setup_failure_only_before_anything_ran(tmp_path, monkeypatch):
+    src = os.path.join(tmp_path, "source.py")
+    with open(src, 'w') as f:
+        f.write("print('ran')\n")
+    popen = subprocess.Popen
+    def no_process(*args, **kw):
+        raise PermissionError("no processes")
+    monkeypatch.setattr(measure.subprocess, "Popen", no_process)
+    with pytest.raises(measure.SetupFailed):
+        measure.Harness().run({'lang': 'py'}, str(tmp_path), src)
+
+    # the program has run when the second run cannot start: not a setup failure
+    started = []
+    def second_fails(*args, **kw):
+        if started:
+            raise PermissionError("no processes")
+        started.append(1)
+        return popen(*args, **kw)
+    monkeypatch.setattr(measure.subprocess, "Popen", second_fails)
+    with pytest.raises(PermissionError) as e:
+        measure.Harness().run({'lang': 'py', 'runs': 2}, str(tmp_path), src)
+    assert not isinstance(e.value, measure.SetupFailed)
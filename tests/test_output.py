@@ -0,0 +1,35 @@
+import os
+import signal
+import subprocess
+import output
+
+def capture_of(argv, limit):
+    cap = output.OutputCapture(limit)
+    proc = subprocess.Popen(argv, stdout=cap.write_fd, stderr=cap.write_fd)
+    cap.start()
+    proc.wait()
+    cap.finish()
+    return cap
+
+def test_small_output_is_kept_whole():
+    cap = capture_of(["sh", "-c", "echo out; echo err >&2"], 1024)
+    assert not cap.truncated and cap.total == 8
+    assert sorted(cap.text().split()) == ["err", "out"]
+
+def test_large_output_keeps_head_and_tail():
+    cap = capture_of(["seq", "1", "200000"], 64)
+    assert cap.truncated and cap.total == len(b"".join(b"%d\n" % i for i in range(1, 200001)))
+    text = cap.text()
+    assert text.startswith("1\n2\n3\n")
+    assert text.endswith("199999\n200000\n")
+    assert f"[{cap.total - 64} bytes truncated]" in text
+
+def test_finish_cuts_off_background_child():
+    cap = output.OutputCapture(1024)
+    proc = subprocess.Popen(["sh", "-c", "echo out; sleep 30 &"], stdout=cap.write_fd,
+                            stderr=cap.write_fd, start_new_session=True)
+    cap.start()
+    proc.wait()
+    cap.finish(timeout=0.2)
+    os.killpg(proc.pid, signal.SIGKILL)
+    assert not cap._thread.is_alive() and cap.text() == "out\n"
@@ -0,0 +1,43 @@
+import json
+import socket
+import output_relay
+from util import Container, send_sock
+
+class Published:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, channel, data):
+        self.messages.append((channel, bytes(data)))
+
+def stream(relay, ctr, job_id, chunks):
+    host, guest = socket.socketpair()
+    send_sock(guest, json.dumps({'job_id': job_id}).encode())
+    for chunk in chunks + [b""]:
+        send_sock(guest, chunk)
+    guest.close()
+    relay._relay(host, ctr)
+
+def test_relays_only_jobs_in_flight_on_the_guest(monkeypatch):
+    monkeypatch.setattr(output_relay.redis.Redis, "from_url", lambda url: Published())
+    relay = output_relay.OutputRelay(5001, "redis://fake")
+    ctr = Container(cid=3, cfg="", vm_cfg="", vsock="", port=5000, jobs=[7])
+
+    stream(relay, ctr, 8, [b"forged"])
+    assert relay._r.messages == []
+
+    stream(relay, ctr, 7, [b"hi"])
+    assert relay._r.messages == [("benchr:output:7", b"hi"), ("benchr:output:7", b"")]
+
+def test_listens_for_guests_not_up_yet(monkeypatch, tmp_path):
+    monkeypatch.setattr(output_relay.redis.Redis, "from_url", lambda url: Published())
+    relay = output_relay.OutputRelay(5001, "redis://fake")
+    down = Container(cid=4, cfg="", vm_cfg="", vsock=str(tmp_path / "fc.vsock"), port=5000, ready=False)
+    relay.start([down])
+    try:
+        # the guest restarted later connects on the same path
+        guest = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        guest.connect(relay.path(down))
+        guest.close()
+    finally:
+        relay.stop()
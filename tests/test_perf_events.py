@@ -0,0 +1,87 @@
+import os
+import pytest
+import perf_events
+
+def test_derived():
+    d = perf_events.derived({'cycles': 200, 'instructions': 300,
+                             'cache_references': 10, 'cache_misses': None,
+                             'branch_instructions': 0, 'branch_misses': 5})
+    assert d['ipc'] == 1.5
+    assert d['cache_miss_rate'] is None
+    assert d['branch_miss_rate'] is None
+
+def test_counters_on_held_child():
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(w)
+            os.read(r, 1)
+            os.execvp("true", ["true"])
+        finally:
+            os._exit(127)
+    os.close(r)
+    try:
+        c = perf_events.Counters(pid)
+    finally:
+        os.write(w, b"x")
+        os.close(w)
+        _, status = os.waitpid(pid, 0)
+    try:
+        if not c.opened:
+            pytest.skip(f"perf_event_open unavailable: {c.unavailable}")
+        counts, scaling = c.read()
+    finally:
+        c.close()
+    assert os.waitstatus_to_exitcode(status) == 0
+    # software events are always there once perf_event_open works
+    assert counts['task_clock'] and counts['task_clock'] > 0
+    assert all(0 <= v <= 1 for v in scaling.values())
+
+def test_interval_reader():
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(w)
+            os.read(r, 1)
+            os.execvp("sleep", ["sleep", "0.05"])
+        finally:
+            os._exit(127)
+    os.close(r)
+    c = perf_events.Counters(pid)
+    reader = perf_events.IntervalReader(c, 5, max_points=4)
+    reader.start()
+    os.write(w, b"x")
+    os.close(w)
+    os.waitpid(pid, 0)
+    reader.stop()
+    c.close()
+    if not reader.names:
+        pytest.skip(f"perf_event_open unavailable: {c.unavailable}")
+    s = reader.series()
+    # 50 ms at 5 ms, halved down to at most 4 points
+    assert 2 <= len(s['t_ms']) <= 4 and s['t_ms'] == sorted(s['t_ms'])
+    assert set(s['events']) == set(reader.names)
+    assert all(len(v) == len(s['t_ms']) for v in s['events'].values())
+
+class FakeCounters:
+    names = ['cycles']
+
+    def __init__(self):
+        self.n = 0
+
+    def read(self):
+        self.n += 100
+        return {'cycles': self.n}, {'cycles': 1.0}
+
+def test_interval_reader_reports_interval_after_decimation():
+    reader = perf_events.IntervalReader(FakeCounters(), 5, max_points=4)
+    for _ in range(4):
+        reader._read()
+    assert reader.series()['interval_ms'] == 5
+    reader._read()
+    s = reader.series()
+    # every other reading dropped: the points are 10 ms apart now
+    assert s['interval_ms'] == 10 and reader.initial_interval_ms == 5
+    assert s['events']['cycles'] == [200, 200, 100]
@@ -0,0 +1,91 @@
+import socket
+import threading
+import time
+import pytest
+import agent
+import protocol
+from util import JsonSerializer, FrameReader, send_sock, rec_sock
+
+ASM = "  401000:\tret\n" * 1000
+
+def fake_execute(job, report=None):
+    report('partial', {'asm': ASM, 'compilation': {'success': True}})
+    report('progress', {'phase': 'run', 'run': 1, 'runs': 1})
+    deadline = time.monotonic() + job.get('sleep', 0)
+    while time.monotonic() < deadline:
+        if agent._harness.cancelled.is_set():
+            return dict(agent.CANCELLED)
+        time.sleep(0.01)
+    return {'success': True, 'echo': job['n'], 'asm': ASM}
+
+@pytest.fixture
+def channel(monkeypatch):
+    monkeypatch.setattr(agent, "execute_job", fake_execute)
+    host, guest = socket.socketpair()
+    ser = JsonSerializer()
+    t = threading.Thread(target=agent.serve, args=(guest, ser, FrameReader()))
+    t.start()
+    chan = protocol.Channel(host, ser)
+    yield chan
+    host.shutdown(socket.SHUT_RDWR)
+    t.join(5)
+    host.close()
+    guest.close()
+
+def test_pipelined_jobs_come_back_by_id(channel):
+    progress = []
+    futs = [channel.submit(10 + n, {'n': n, 'sleep': 0.05}, progress.append) for n in range(3)]
+    assert sorted(channel.inflight) == [10, 11, 12]
+    results = [f.result(5) for f in futs]
+    assert [r['echo'] for r in results] == [0, 1, 2]
+    # the asm travels once, with the partial result, and is merged back
+    assert all(r['asm'] == ASM and r['compilation']['success'] for r in results)
+    assert {'partial': ['asm', 'compilation']} in progress
+    assert {'phase': 'run', 'run': 1, 'runs': 1} in progress
+    assert channel.inflight == []
+
+def test_ping_while_a_job_runs(channel):
+    fut = channel.submit(1, {'n': 1, 'sleep': 1})
+    assert channel.ping(timeout=0.5) < 500
+    assert not fut.done()
+    channel.cancel(1)
+    assert fut.result(5)['cancelled']
+
+def test_cancel_queued_job_never_runs(channel):
+    running = channel.submit(1, {'n': 1, 'sleep': 0.3})
+    queued = channel.submit(2, {'n': 2})
+    channel.cancel(2)
+    assert running.result(5)['echo'] == 1
+    res = queued.result(5)
+    assert res['cancelled'] and 'echo' not in res
+
+def test_lost_connection_fails_pending_jobs():
+    host, guest = socket.socketpair()
+    chan = protocol.Channel(host, JsonSerializer())
+    fut = chan.submit(1, {'n': 1})
+    rec_sock(guest)
+    guest.close()
+    with pytest.raises(RuntimeError):
+        fut.result(5)
+    assert chan.closed
+    with pytest.raises(RuntimeError):
+        chan.submit(2, {}).result(1)
+    host.close()
+
+def test_legacy_channel_one_job_at_a_time():
+    host, guest = socket.socketpair()
+    ser = JsonSerializer()
+    def old_agent():
+        for _ in range(2):
+            job = ser.deserialize(rec_sock(guest))
+            send_sock(guest, ser.serialize({'echo': job['n']}))
+    t = threading.Thread(target=old_agent)
+    t.start()
+    chan = protocol.open_channel(host, ser, 1)
+    futs = [chan.submit(n, {'n': n}) for n in range(2)]
+    assert [f.result(5)['echo'] for f in futs] == [0, 1]
+    assert not chan.cancel(0)
+    t.join()
+    chan.close()
+    host.close()
+    guest.close()
@@ -0,0 +1,65 @@
+import pytest
+import IQueue
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def make(monkeypatch, server, owner):
+    monkeypatch.setattr(IQueue.redis, "from_url",
+                        lambda url, **kw: fakeredis.FakeRedis(server=server, decode_responses=True))
+    return IQueue.RedisQueue("t", "redis://fake", owner=owner)
+
+def test_reaper_between_move_and_grant(monkeypatch):
+    server = fakeredis.FakeServer()
+    q = make(monkeypatch, server, "a")
+    reaper = make(monkeypatch, server, "b")
+    q.push(1)
+    grant = q._grant
+    def late_grant(**kw):
+        # other managers' reapers pass while the job sits in processing
+        assert reaper.reap() == [] and reaper.reap() == []
+        return grant(**kw)
+    q._grant = late_grant
+    assert q.pend(timeout=0) == 1
+    assert q.queued_size() == 0 and q.redis.hget(q.leases_key, 1) == "a"
+    assert reaper.reap() == []
+
+def test_orphan_reclaimed_after_grace(monkeypatch):
+    server = fakeredis.FakeServer()
+    q = make(monkeypatch, server, "a")
+    reaper = make(monkeypatch, server, "b")
+    q.push(1)
+    grant = q._grant
+    def dead_consumer(**kw):
+        monkeypatch.setattr(IQueue, "ORPHAN_GRACE_SEC", -1)
+        assert reaper.reap() == [1]
+        return grant(**kw)
+    q._grant = dead_consumer
+    # the reclaimed job is not granted as well, it runs once
+    assert q.pend(timeout=0) is None
+    assert q.redis.hget(q.leases_key, 1) is None and q.queued_size() == 1
+
+def make_stream(monkeypatch, server, owner):
+    monkeypatch.setattr(IQueue.redis, "from_url",
+                        lambda url, **kw: fakeredis.FakeRedis(server=server, decode_responses=True))
+    return IQueue.StreamQueue("s", "redis://fake", owner=owner, claim_interval=0)
+
+def test_stream_drops_claimed_entry_deleted_while_pending(monkeypatch):
+    server = fakeredis.FakeServer()
+    dead = make_stream(monkeypatch, server, "a")
+    q = make_stream(monkeypatch, server, "b")
+    dead.push(1)
+    assert dead.pend(timeout=0) == 1
+    entry_id = dead._entries[1]
+    dead.redis.xdel(dead.stream_key, entry_id)
+    # Redis 6.2 hands back an entry deleted under the group with fields None
+    monkeypatch.setattr(q.redis, "xautoclaim", lambda *a, **kw: ["0-0", [(entry_id, None)]])
+    assert q.pend(timeout=0, lease=0) is None
+    assert q.redis.xpending(q.stream_key, q.group)['pending'] == 0
+
+def test_stream_drops_entry_without_job_id(monkeypatch):
+    q = make_stream(monkeypatch, fakeredis.FakeServer(), "a")
+    q.redis.xadd(q.stream_key, {'other': 1})
+    assert q.pend(timeout=0) is None
+    assert q.redis.xlen(q.stream_key) == 0
+    q.push(2)
+    assert q.pend(timeout=0) == 2
@@ -0,0 +1,52 @@
+import os
+import pytest
+import models
+from models import Job, CachedResult
+import result_cache
+
+@pytest.fixture
+def db(tmp_path):
+    models.db.init(os.path.join(tmp_path, "benchr.db"))
+    models.init_db()
+    models.db.connect(reuse_if_open=True)
+    yield models.db
+    models.db.close()
+
+def make_job(key, status='queued'):
+    return Job.create(code="int main(){}", lang="c", compiler="gcc", opts="-O2",
+                      status=status, cache_key=key)
+
+def test_key_covers_inputs():
+    k = result_cache.result_key("x", "c", "gcc", "-O2", toolchain="1")
+    assert k == result_cache.result_key("x", "c", "gcc", "-O2", toolchain="1")
+    assert k != result_cache.result_key("x", "c", "gcc", "-O3", toolchain="1")
+    assert k != result_cache.result_key("x", "c", "gcc", "-O2", toolchain="2")
+    # fields are delimited, shifting text between them changes the key
+    assert result_cache.result_key("b", "c", "gcc", "-O2a") != \
+        result_cache.result_key("ab", "c", "gcc", "-O2")
+
+def test_claim_attaches_to_inflight(db):
+    first, second = make_job("k"), make_job("k")
+    assert result_cache.claim("k", first) is None
+    assert result_cache.claim("k", second).id == first.id
+    assert result_cache.lookup("k").id == first.id
+
+def test_settle(db):
+    job = make_job("k")
+    result_cache.claim("k", job)
+    job.status = 'failed'
+    job.save()
+    result_cache.settle(job)
+    assert result_cache.lookup("k") is None
+
+    # a fresh run that succeeds becomes the cached result
+    fresh = make_job("k", status='completed')
+    result_cache.settle(fresh)
+    assert result_cache.lookup("k").id == fresh.id
+    assert CachedResult.select().count() == 1
+
+def test_migration_adds_columns(db):
+    db.execute_sql("DROP INDEX job_cache_key")
+    db.execute_sql("ALTER TABLE jobs DROP COLUMN cache_key")
+    models.init_db()
+    assert "cache_key" in {c.name for c in db.get_columns("jobs")}
@@ -0,0 +1,27 @@
+import subprocess
+import sampler
+
+def test_samples_child_until_exit():
+    proc = subprocess.Popen(["sleep", "0.1"])
+    smp = sampler.Sampler(proc.pid, interval_ms=2)
+    smp.start()
+    proc.wait()
+    smp.stop()
+    t = smp.timeline()
+    assert t['samples'] >= 5
+    assert t['t_ms'] == sorted(t['t_ms'])
+    assert t['minor_faults'] == sorted(t['minor_faults'])
+    assert max(t['rss_kb']) > 0
+    marks = smp.system_marks(10)
+    assert 0 < len(marks) <= 10 and len(marks[0]['cpu']) == 8
+
+def test_full_buffer_halves_the_rate():
+    proc = subprocess.Popen(["sleep", "0.1"])
+    smp = sampler.Sampler(proc.pid, interval_ms=1, capacity=8)
+    smp.start()
+    proc.wait()
+    smp.stop()
+    assert 4 <= len(smp) <= 8
+    assert smp.interval * 1000 > smp.initial_interval_ms
+    t = smp.timeline(points=3)
+    assert len(t['t_ms']) == 3 and t['samples'] == len(smp)
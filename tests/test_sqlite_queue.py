@@ -0,0 +1,66 @@
+import os
+import time
+import threading
+from IQueue import SqliteQueue
+
+def make(tmp_path, owner="a", **kw):
+    return SqliteQueue("t", path=os.path.join(tmp_path, "queue.db"), owner=owner, **kw)
+
+def test_fifo_and_ack(tmp_path):
+    q = make(tmp_path)
+    for i in (1, 2, 3):
+        assert q.push(i)
+    assert q.size() == 3
+
+    assert q.pend(timeout=0) == 1
+    assert q.pend(timeout=0) == 2
+    assert q.processing_size() == 2 and q.queued_size() == 1
+    assert q.queue_wait(1) is not None
+
+    assert q.ack(2)
+    assert not q.ack(2)
+    assert q.size() == 2
+
+def test_only_owner_acks(tmp_path):
+    a = make(tmp_path, owner="a")
+    b = make(tmp_path, owner="b")
+    a.push(7)
+    assert a.pend(timeout=0) == 7
+    assert not b.ack(7)
+    assert a.ack(7)
+
+def test_reap_expired_lease(tmp_path):
+    a = make(tmp_path, owner="a", lease=0.05)
+    b = make(tmp_path, owner="b")
+    a.push(1)
+    a.push(2)
+    assert a.pend(timeout=0) == 1
+    time.sleep(0.1)
+
+    assert b.reap() == [1]
+    assert b.stats()['reclaimed'] == 1
+    # reclaimed jobs go ahead of fresh ones
+    assert b.pend(timeout=0) == 1
+    assert not a.ack(1)
+    assert b.ack(1)
+
+def test_pend_wakes_on_push(tmp_path):
+    q = make(tmp_path)
+    producer = make(tmp_path, owner="p")
+
+    def push_later():
+        time.sleep(0.2)
+        producer.push(42)
+
+    t = threading.Thread(target=push_later)
+    t.start()
+    t0 = time.monotonic()
+    assert q.pend(timeout=5) == 42
+    assert time.monotonic() - t0 < 1
+    t.join()
+
+def test_pend_timeout(tmp_path):
+    q = make(tmp_path)
+    t0 = time.monotonic()
+    assert q.pend(timeout=0.2) is None
+    assert time.monotonic() - t0 >= 0.2
@@ -0,0 +1,35 @@
+import pytest
+import stats
+
+def test_basic():
+    xs = [3.0, 1.0, 2.0, 4.0]
+    assert stats.mean(xs) == 2.5
+    assert stats.median(xs) == 2.5
+    assert stats.median([5, 1, 3]) == 3
+    assert stats.stddev([2, 4, 4, 4, 5, 5, 7, 9]) == pytest.approx(2.138, abs=1e-3)
+    assert stats.stddev([1.0]) == 0.0
+    assert stats.quantile([1, 2, 3, 4, 5], 0.25) == 2
+
+def test_bootstrap_ci_brackets_median_and_is_seeded():
+    xs = [10, 11, 9, 10, 12, 10, 11, 9, 10, 10]
+    lo, hi = stats.bootstrap_ci(xs)
+    assert lo <= stats.median(xs) <= hi
+    assert (lo, hi) == stats.bootstrap_ci(xs)
+    assert stats.bootstrap_ci([7]) == (7, 7)
+
+def test_outliers():
+    xs = [10, 10.5, 9.8, 10.2, 10.1, 30, 9.9]
+    assert stats.outliers(xs) == [5]
+    assert stats.outliers([1, 100, 1]) == []
+
+def test_summarize_skips_missing():
+    s = stats.summarize([None, 10, 11, None, 10, 50, 10, 11])
+    assert s['n'] == 6
+    assert s['min'] == 10 and s['max'] == 50
+    assert s['outliers'] == [5]    # index into the original list
+    assert stats.summarize([None, None]) is None
+
+def test_relative_ci_width():
+    assert stats.relative_ci_width({'median': 10, 'ci_low': 9, 'ci_high': 11}) == 0.2
+    assert stats.relative_ci_width({'median': 0, 'ci_low': 0, 'ci_high': 0}) is None
+    assert stats.relative_ci_width(None) is None
@@ -0,0 +1,101 @@
+import socket
+import struct
+import threading
+import pytest
+from util import send_sock, rec_sock, serializers, negotiate, answer_hello, JsonSerializer, \
+    FrameReader, ProgramCosts
+
+def test_roundtrip():
+    a, b = socket.socketpair()
+    with a, b:
+        send_sock(a, b"x" * 100000)
+        assert rec_sock(b) == b"x" * 100000
+
+def test_oversized_frame_is_refused():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(struct.pack(">I", 1 << 30))
+        with pytest.raises(RuntimeError):
+            rec_sock(b, max_size=1 << 20)
+
+RESULT = {'success': True, 'output': "hi\n", 'asm': "\tmov %rsp,%rbp\n",
+          'perf': {'cycles': 123, 'ipc': 1.5, 'cache_misses': None},
+          'vmstat': [{'free_mem': 1}], 'runs': {'samples': [{'wall_ms': 1.25}]}}
+
+def test_serializers_roundtrip():
+    sers = serializers()
+    assert {'json', 'json+zlib'} <= set(sers)
+    for name, ser in sers.items():
+        assert ser.deserialize(ser.serialize(RESULT)) == RESULT, name
+
+def negotiate_with(agent):
+    a, b = socket.socketpair()
+    with a, b:
+        t = threading.Thread(target=agent, args=(b,))
+        t.start()
+        agreed = negotiate(a, ["nope", "json+zlib", "json"], protocols=(3, 2, 1))
+        t.join()
+    return agreed
+
+def test_negotiate_picks_first_supported():
+    chosen = []
+    def agent(sock):
+        hello = JsonSerializer().deserialize(rec_sock(sock))
+        chosen.append(answer_hello(sock, hello, protocols=(1, 2)))
+    ser, version = negotiate_with(agent)
+    assert ser.name == chosen[0][0].name == "json+zlib"
+    assert version == chosen[0][1] == 2
+
+def test_negotiate_with_old_agent_stays_on_json():
+    def agent(sock):
+        # an agent without negotiation runs the hello as a job
+        rec_sock(sock)
+        send_sock(sock, JsonSerializer().serialize({'success': False, 'error': "no code"}))
+    ser, version = negotiate_with(agent)
+    assert (ser.name, version) == ("json", 1)
+
+class Trickle:
+    """Socket stand-in whose recv/recv_into return one byte at a time"""
+    def __init__(self, data):
+        self.data = memoryview(data)
+    def recv(self, n):
+        out, self.data = bytes(self.data[:1]), self.data[1:]
+        return out
+    def recv_into(self, view, n):
+        if not self.data:
+            return 0
+        view[0] = self.data[0]
+        self.data = self.data[1:]
+        return 1
+
+def test_short_reads():
+    frames = struct.pack(">I", 5) + b"hello" + struct.pack(">I", 3) + b"abc"
+    sock = Trickle(frames)
+    assert rec_sock(sock) == b"hello"
+    assert rec_sock(sock) == b"abc"
+    with pytest.raises(RuntimeError):
+        rec_sock(Trickle(struct.pack(">I", 5) + b"hel"))
+
+def test_frame_reader_reuses_its_buffer():
+    reader = FrameReader()
+    a, b = socket.socketpair()
+    with a, b:
+        def send():
+            for frame in (b"x" * 10, b"y" * 1000000, JsonSerializer().serialize({'k': 1})):
+                send_sock(a, frame)
+        t = threading.Thread(target=send)
+        t.start()
+        assert reader.read(b) == b"x" * 10
+        assert reader.read(b) == b"y" * 1000000
+        assert JsonSerializer().deserialize(reader.read(b)) == {'k': 1}
+        t.join()
+
+def test_program_costs_learn():
+    costs = ProgramCosts(lambda data: data['code'], alpha=0.5)
+    data = {'code': "x"}
+    assert costs.expected_ms(data) is None
+    assert costs.learn(data, {'success': True, 'runs': {'count': 10}, 'timing': {'run_ms': 100}})
+    assert costs.learn(data, {'success': False, 'runs': {'count': 3}}) is None
+    costs.learn(data, {'success': True, 'runs': {'count': 20}, 'timing': {'run_ms': 300}})
+    assert costs.expected_ms(data) == 200
+    assert costs.estimate("x")['runs'] == 15 and costs.estimate("x")['jobs'] == 2
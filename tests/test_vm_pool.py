@@ -0,0 +1,55 @@
+import threading
+import pytest
+import vm_pool
+from util import Container
+
+def _pool(monkeypatch, fail: int):
+    monkeypatch.setattr(vm_pool, "RESTART_BACKOFF_SEC", 0.01)
+    pool = vm_pool.VmPool(size=1)
+    ctr = Container(cid=3, cfg="", vm_cfg="", vsock="", port=0)
+    pool._ctrs = [ctr]
+    attempts = []
+    def start_ctr(c):
+        attempts.append(c.cid)
+        if len(attempts) <= fail:
+            raise RuntimeError("boot failed")
+        c.ready = True
+    monkeypatch.setattr(pool, "start_ctr", start_ctr)
+    return pool, ctr, attempts
+
+def test_restart_retries_until_up(monkeypatch):
+    pool, ctr, attempts = _pool(monkeypatch, fail=2)
+    pool.restart(ctr)
+    assert ctr.ready and len(attempts) == 3
+    assert pool.acquire(timeout=0) is ctr
+    assert pool.occupancy()['down'] == {}
+    # already up: a second caller does not boot it again
+    pool.restart(ctr)
+    assert len(attempts) == 3
+
+def test_restart_gives_up_when_stopped(monkeypatch):
+    pool, ctr, attempts = _pool(monkeypatch, fail=10 ** 6)
+    monkeypatch.setattr(vm_pool, "RESTART_BACKOFF_SEC", 60)
+    threading.Timer(0.2, pool.stop).start()
+    with pytest.raises(RuntimeError):
+        pool.restart(ctr)
+    assert not ctr.ready and pool.occupancy()['down'] == {3: 1}
+
+def test_held_slot_returns_with_the_job(monkeypatch):
+    pool, ctr, _ = _pool(monkeypatch, fail=0)
+    pool.depth, ctr.protocol = 2, 2
+    pool.restart(ctr)
+    assert pool.acquire(timeout=0) is ctr
+    pool.assign(ctr, 7)
+    assert pool.acquire(timeout=0) is ctr
+    assert pool.hold(ctr) and pool.acquire(timeout=0) is None
+    pool.release(ctr, 7)
+    assert pool.acquire(timeout=0) is ctr and pool.acquire(timeout=0) is ctr
+
+def test_recover_returns_at_once(monkeypatch):
+    pool, ctr, attempts = _pool(monkeypatch, fail=3)
+    pool.recover(ctr)
+    # a second call while the first is still retrying starts nothing
+    pool.recover(ctr)
+    assert pool.acquire(timeout=5) is ctr
+    assert ctr.ready and len(attempts) == 4
@@ -0,0 +1,42 @@
+import os
+import pytest
+import workspace
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace.tempfile, "gettempdir", lambda: str(tmp_path))
+    p = workspace.WorkspacePool(count=2, tmpfs=False)
+    p.start()
+    yield p
+    p.close()
+
+def test_workspaces_are_reused_empty(pool):
+    a = pool.acquire()
+    b = pool.acquire()
+    assert a.path != b.path and not a.mounted
+    with pytest.raises(RuntimeError):
+        pool.acquire(timeout=0.01)
+    os.makedirs(os.path.join(a.path, "sub", "dir"))
+    with open(os.path.join(a.path, "bin"), 'w') as f:
+        f.write("x")
+    os.symlink("/", os.path.join(a.path, "root"))
+    pool.release(a)
+    pool.release(b)
+    paths = {pool.acquire().path, pool.acquire().path}
+    assert paths == {a.path, b.path}
+    assert os.listdir(a.path) == []
+
+def test_unremovable_contents_are_replaced(pool, monkeypatch):
+    ws = pool.acquire()
+    with open(os.path.join(ws.path, "bin"), 'w') as f:
+        f.write("x")
+    unlink, calls = os.unlink, []
+    def failing_once(path, *args, **kwargs):
+        calls.append(path)
+        if len(calls) == 1:
+            raise PermissionError(path)
+        return unlink(path, *args, **kwargs)
+    monkeypatch.setattr(workspace.os, "unlink", failing_once)
+    pool.release(ws)
+    assert os.path.isdir(ws.path) and os.listdir(ws.path) == []
+    assert pool.acquire().path in (ws.path, os.path.join(pool.root, "ws1"))
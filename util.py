@@ -1,14 +1,22 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import os
 import time
 import struct
 #from dotenv import load_dotenv
 import shutil
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
 import subprocess
 import socket
 from abc import ABC, abstractmethod
 import json
+import zlib
+import asyncio
+import threading
+from collections import OrderedDict
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 @dataclass 
 class Container:
@@ -19,6 +27,22 @@ class Container:
     port: int
     sock: Optional[socket.socket] = None
     ready: bool = False
+    # per-VM working directory, firecracker runs with it as cwd
+    workdir: Optional[str] = None
+    api_sock: Optional[str] = None
+    proc: Optional[subprocess.Popen] = None
+    busy: bool = False
+    # jobs sent to the agent and not finished yet, in order (more than one
+    # when pipelining, see VmPool depth)
+    jobs: List[int] = field(default_factory=list)
+    slots: int = 0                        # VmPool's idle-queue entries for this guest
+    held: int = 0                         # of those, parked by VmPool.hold()
+    boot_mode: Optional[str] = None   # cold | restore
+    boot_ms: Optional[float] = None
+    ser: Optional['ISerializer'] = None   # negotiated with the agent, see negotiate()
+    protocol: int = 1
+    chan: Optional[object] = None         # protocol.Channel / LegacyChannel, set by VmPool
+    lane: str = "bench"                   # which queue the guest serves, see VmPool lanes
 
 @dataclass
 class FirecrackerCfg:
@@ -29,34 +53,167 @@ class FirecrackerCfg:
         # and clean up
         return f"{self.path}/run-firecracker.sh"
 
+    @property
+    def firecracker(self):
+        return f"{self.path}/firecracker"
+
 # PRE: socket connection is valid, data is serialized
 def send_sock(sock, data: bytes):
     """Send length-prefixed message"""
     sock.sendall(struct.pack(">I", len(data)))
     sock.sendall(data)
 
+# largest frame rec_sock accepts; results are bounded (output.py), so a
+# bigger length is a broken or hostile peer, not a result
+MAX_FRAME = 64 * 1024 * 1024
+
+def _recv_exact(sock, view: memoryview, broken: str = "Socket connection broken"):
+    """Fill view from sock; recv may return less than asked at any point"""
+    got, n = 0, len(view)
+    while got < n:
+        # no slice on the first recv, most frames arrive in one
+        k = sock.recv_into(view[got:] if got else view, n - got)
+        if not k:
+            raise RuntimeError(broken)
+        got += k
+
+def _frame_len(sock, max_size: int) -> int:
+    raw = sock.recv(4)
+    if len(raw) < 4:
+        # short read, legal on a stream socket
+        header = bytearray(4)
+        header[:len(raw)] = raw
+        if not raw:
+            raise RuntimeError("Failed to receive length header")
+        _recv_exact(sock, memoryview(header)[len(raw):], "Failed to receive length header")
+        raw = header
+    msg_len = struct.unpack(">I", raw)[0]
+    if msg_len > max_size:
+        raise RuntimeError(f"Frame of {msg_len} bytes exceeds the {max_size} byte limit")
+    return msg_len
+
 # PRE: socket connection is valid
 # POST: need to deserialize
-def rec_sock(sock) -> bytes:
-    """Receive length-prefixed message"""
-    # Read 4-byte length header
-    raw_len = sock.recv(4)
-    if not raw_len or len(raw_len) < 4:
+def rec_sock(sock, max_size: int = MAX_FRAME) -> bytearray:
+    """Receive length-prefixed message, read straight into one buffer"""
+    msg_len = _frame_len(sock, max_size)
+    buf = bytearray(msg_len)
+    _recv_exact(sock, memoryview(buf))
+    return buf
+
+class FrameReader:
+    """
+    rec_sock for a long-lived connection: frames are read into one buffer
+    that grows to the largest frame seen and is reused, and handed out as a
+    memoryview that stays valid until the next read()
+    """
+
+    def __init__(self, max_size: int = MAX_FRAME):
+        self._max_size = max_size
+        self._buf = bytearray(64 * 1024)
+
+    def read(self, sock) -> memoryview:  # throws
+        msg_len = _frame_len(sock, self._max_size)
+        if msg_len > len(self._buf):
+            self._buf = bytearray(msg_len)
+        view = memoryview(self._buf)[:msg_len]
+        _recv_exact(sock, view)
+        return view
+
+# asyncio variants, same framing
+async def async_send_sock(writer, data: bytes):
+    """Send length-prefixed message on an asyncio stream"""
+    writer.write(struct.pack(">I", len(data)))
+    writer.write(data)
+    await writer.drain()
+
+async def async_rec_sock(reader, max_size: int = MAX_FRAME) -> bytes:
+    """Receive length-prefixed message from an asyncio stream"""
+    try:
+        raw_len = await reader.readexactly(4)
+    except asyncio.IncompleteReadError:
         raise RuntimeError("Failed to receive length header")
-    
+
     msg_len = struct.unpack(">I", raw_len)[0]
-    
-    # Read the actual message
-    chunks = []
-    bytes_received = 0
-    while bytes_received < msg_len:
-        chunk = sock.recv(min(msg_len - bytes_received, 4096))
-        if not chunk:
-            raise RuntimeError("Socket connection broken")
-        chunks.append(chunk)
-        bytes_received += len(chunk)
-    
-    return b''.join(chunks)
+    if msg_len > max_size:
+        raise RuntimeError(f"Frame of {msg_len} bytes exceeds the {max_size} byte limit")
+    try:
+        return await reader.readexactly(msg_len)
+    except asyncio.IncompleteReadError:
+        raise RuntimeError("Socket connection broken")
+
+def latency_stats(samples) -> dict:
+    """count/mean/p50/p95/max in ms for a sequence of durations in seconds"""
+    samples = sorted(samples)
+    if not samples:
+        return {'count': 0}
+    def pct(p):
+        return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+    return {
+        'count': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'max_ms': samples[-1] * 1000
+    }
+
+class ProgramCosts:
+    """
+    Learned cost per program: EWMA of the runs a job needed and its run-phase
+    time, keyed by key(job data) (result_cache.program_key, the result key
+    without run settings). Bounded, least recently updated programs are
+    forgotten first.
+    """
+
+    def __init__(self, key: Callable[[dict], str], alpha: float = 0.3, maxsize: int = 10000):
+        self._key = key
+        self._alpha = alpha
+        self._maxsize = maxsize
+        self._costs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, key: str, runs: int, run_ms: float) -> dict:
+        with self._lock:
+            c = self._costs.pop(key, None)
+            if c is None:
+                c = {'runs': float(runs), 'run_ms': float(run_ms), 'jobs': 0}
+            else:
+                a = self._alpha
+                c['runs'] += a * (runs - c['runs'])
+                c['run_ms'] += a * (run_ms - c['run_ms'])
+            c['jobs'] += 1
+            self._costs[key] = c
+            while len(self._costs) > self._maxsize:
+                self._costs.popitem(last=False)
+            return dict(c)
+
+    def estimate(self, key: str) -> Optional[dict]:
+        """{'runs', 'run_ms', 'jobs'} or None for a program not seen yet"""
+        with self._lock:
+            c = self._costs.get(key)
+            return dict(c) if c else None
+
+    def learn(self, data: dict, result: dict, verbose: bool = False) -> Optional[dict]:
+        """Feed a repeated-run job's run count and run time into the model"""
+        runs = result.get('runs')
+        if not result.get('success') or not runs:
+            return None
+        key = self._key(data)
+        prev = self.estimate(key)
+        cost = self.update(key, runs['count'], result.get('timing', {}).get('run_ms', 0))
+        if verbose:
+            expected = f"{prev['runs']:.1f}" if prev else "?"
+            print(f"Program {key[:12]}: {runs['count']} runs (expected {expected}), "
+                  f"now ~{cost['runs']:.1f} runs / {cost['run_ms']:.0f} ms")
+        return cost
+
+    def expected_ms(self, data: dict) -> Optional[float]:
+        """Learned run-phase time of the job's program, None if unseen"""
+        c = self.estimate(self._key(data))
+        return c['run_ms'] if c else None
+
+    def __len__(self):
+        return len(self._costs)
 
 def run_cmd(cmd):
     try:
@@ -75,7 +232,68 @@ class ISerializer(ABC):
     def deserialize(self, data: bytes) -> dict:
         pass
 class JsonSerializer(ISerializer):
+    name = "json"
     def serialize(self, data):
         return json.dumps(data).encode('utf-8')
     def deserialize(self, data):
+        # json.loads takes bytes but not a memoryview (FrameReader)
+        if isinstance(data, memoryview):
+            data = str(data, 'utf-8')
         return json.loads(data)
+
+class MsgpackSerializer(ISerializer):
+    """Binary encoding, needs the optional msgpack package"""
+    name = "msgpack"
+    def serialize(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+    def deserialize(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+class ZlibSerializer(ISerializer):
+    """Another serializer's bytes, deflated; level 1 trades ratio for speed"""
+    def __init__(self, inner: Optional[ISerializer] = None, level: int = 1):
+        self._inner = inner or JsonSerializer()
+        self._level = level
+        self.name = f"{self._inner.name}+zlib"
+    def serialize(self, data):
+        return zlib.compress(self._inner.serialize(data), self._level)
+    def deserialize(self, data):
+        return self._inner.deserialize(zlib.decompress(data))
+
+def serializers() -> dict:
+    """Serializers this side can speak, by name"""
+    sers = [JsonSerializer(), ZlibSerializer()]
+    if msgpack is not None:
+        sers += [MsgpackSerializer(), ZlibSerializer(MsgpackSerializer())]
+    return {s.name: s for s in sers}
+
+# Serializer and protocol negotiation, right after the vsock handshake and
+# always in JSON:
+#   host -> agent   {"hello": 1, "serializers": ["msgpack", "json", ...],
+#                    "protocols": [2, 1]}
+#   agent -> host   {"serializer": "<first offered name it supports>",
+#                    "protocol": <first offered version it speaks>}
+# An agent that predates it treats the hello as a job and answers with an
+# error result, which leaves both ends on JSON and protocol 1 (see protocol.py).
+def negotiate(sock, offered: List[str],
+              protocols: Tuple[int, ...] = (1,)) -> Tuple[ISerializer, int]:  # throws
+    """Host side: offer serializers and protocol versions in order of preference
+
+    Returns:
+        (agreed serializer, agreed protocol version)
+    """
+    ser = JsonSerializer()
+    send_sock(sock, ser.serialize({'hello': 1, 'serializers': offered,
+                                   'protocols': list(protocols)}))
+    reply = ser.deserialize(rec_sock(sock))
+    version = reply.get('protocol', 1)
+    return serializers().get(reply.get('serializer'), ser), version if version in protocols else 1
+
+def answer_hello(sock, hello: dict,
+                 protocols: Tuple[int, ...] = (1,)) -> Tuple[ISerializer, int]:  # throws
+    """Agent side: pick the host's most preferred serializer and protocol we have, and say so"""
+    have = serializers()
+    name = next((n for n in hello.get('serializers', []) if n in have), "json")
+    version = next((v for v in hello.get('protocols', []) if v in protocols), 1)
+    send_sock(sock, JsonSerializer().serialize({'serializer': name, 'protocol': version}))
+    return have[name], version
@@ -0,0 +1,622 @@
+import os
+import json
+import time
+import queue
+import socket
+import subprocess
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+from util import Container, FirecrackerCfg, JsonSerializer, MAX_FRAME, negotiate
+from protocol import PROTOCOLS, open_channel
+from fc_api import FcApi
+import env
+
+DEBUG = True
+
+# a guest that fails to (re)start is retried after these delays, doubling
+RESTART_BACKOFF_SEC = 1
+RESTART_BACKOFF_MAX_SEC = 60
+
+# vm_pool.py
+
+# Each guest gets its own directory under workdir:
+#   vms/<cid>/config.json   firecracker config derived from the template
+#   vms/<cid>/fc.vsock      vsock UDS
+#   vms/<cid>/fc.api        firecracker API socket
+#   vms/<cid>/*.ext4        private copies of the writable drives
+#
+# Drives named in PERSISTENT_DRIVES (the guest compile cache) are seeded from
+# the template once and then kept across restarts, restores and image rebuilds.
+# A block device cannot be mounted read-write by two guests, so each guest
+# grows its own cache.
+# firecracker is started with the directory as cwd, so the relative paths in
+# config.json resolve per guest.
+#
+# Snapshot mode: one template guest is cold booted in snapdir/ until its agent
+# accepts a connection, then paused and snapshotted (vm.snap + vm.mem) next to
+# its drives. Pool guests are brought up by copying those drives into their own
+# directory and loading the snapshot there; the vsock and drive paths stored in
+# the snapshot are relative, so they resolve per guest the same way. Restored
+# guests keep the template's guest CID, which is fine since every guest has its
+# own vsock UDS on the host.
+#
+# Pipelining: the idle queue holds `depth` entries per guest whose agent
+# speaks protocol 2 (one for older agents), so up to `depth` jobs can be sent
+# to a guest before the first one finishes. ctr.slots counts a guest's
+# entries, queued or taken, so a restart tops it back up to depth. A
+# dispatcher that would rather not queue behind a guest's running job parks
+# the slot with hold(); it comes back with the guest's next finished job.
+#
+# Lanes: `lanes` reserves guests at the end of the pool for other queues
+# ({"compile": 1} keeps the last guest for compile-only jobs), each lane
+# with idle entries of its own, so those jobs never wait behind a benchmark.
+# Every other guest is in the BENCH lane.
+#
+# A guest that fails to boot, at start() or in restart(), is retried with
+# backoff (RESTART_BACKOFF_SEC doubling up to RESTART_BACKOFF_MAX_SEC) until
+# it comes up or the pool is stopped; meanwhile it is listed under 'down' in
+# occupancy() and every failure logs what capacity is left.
+BENCH = "bench"
+COMPILE = "compile"
+
+class VmPool:
+    """Warm pool of Firecracker guests, one agent connection per guest"""
+
+    PERSISTENT_DRIVES = ("cache",)
+
+    def __init__(self,
+                 size: int = 1,
+                 fc: Optional[FirecrackerCfg] = None,
+                 cfg: str = "config.json",
+                 vm_cfg: str = "vm_config.json",
+                 workdir: str = "vms",
+                 cid_start: int = 3,
+                 snapshot: bool = True,
+                 snapdir: str = "snapshot",
+                 boot_timeout: float = 60,
+                 serializers: Optional[List[str]] = None,
+                 depth: int = 1,
+                 max_frame: int = MAX_FRAME,
+                 lanes: Optional[Dict[str, int]] = None
+                 ):
+        self.size = size
+        self._fc = fc or FirecrackerCfg()
+        self._cfg = cfg
+        self._vm_cfg = vm_cfg
+        self._workdir = workdir
+        self._cid_start = cid_start
+        self._ctrs: List[Container] = []
+        self.lanes = {lane: n for lane, n in (lanes or {}).items() if n > 0}
+        self._idle = {lane: queue.Queue() for lane in [BENCH] + list(self.lanes)}
+        self._lock = threading.Lock()
+        self._snapshot = snapshot
+        self._snapdir = snapdir
+        self._boot_timeout = boot_timeout
+        # offered to each agent in this order after the handshake (ctr.ser);
+        # None skips the negotiation and both ends stay on JSON
+        self._serializers = serializers
+        self.depth = max(1, depth)
+        self._max_frame = max_frame
+        self._boots = {'cold': deque(maxlen=100), 'restore': deque(maxlen=100)}
+        # cid -> failed attempts of guests that are down
+        self._down: Dict[int, int] = {}
+        # one restart per guest at a time, see restart()
+        self._restarting: Dict[int, threading.Lock] = {}
+        # cids with a recover() thread running
+        self._recovering = set()
+        self._stopping = threading.Event()
+
+    def _make_dir(self, cid: int, vm_dir: Optional[str] = None) -> str:
+        """Create the guest directory and its firecracker config"""
+        vm_dir = vm_dir or os.path.join(self._workdir, str(cid))
+        os.makedirs(vm_dir, exist_ok=True)
+
+        with open(self._cfg, 'r') as f:
+            cfg = json.load(f)
+
+        base = os.path.dirname(os.path.abspath(self._cfg))
+        boot = cfg["boot-source"]
+        boot["kernel_image_path"] = os.path.join(base, boot["kernel_image_path"])
+
+        # source [size, mtime] each private drive was copied from, so a
+        # rebuilt image replaces the guest's copy
+        copied_path = os.path.join(vm_dir, "drives.json")
+        try:
+            with open(copied_path, 'r') as f:
+                copied = json.load(f)
+        except (OSError, ValueError):
+            copied = {}
+
+        for drive in cfg.get("drives", []):
+            src = os.path.join(base, drive["path_on_host"])
+            if drive.get("is_read_only"):
+                drive["path_on_host"] = src
+                continue
+            # writable drives cannot be shared between guests
+            name = os.path.basename(src)
+            dst = os.path.join(vm_dir, name)
+            st = os.stat(src)
+            if drive["drive_id"] in self.PERSISTENT_DRIVES:
+                stale = not os.path.exists(dst)
+            else:
+                stale = not os.path.exists(dst) or copied.get(name) != [st.st_size, st.st_mtime]
+            if stale:
+                subprocess.run(
+                    ["cp", "--reflink=auto", "--sparse=always", src, dst],
+                    check=True
+                )
+                copied[name] = [st.st_size, st.st_mtime]
+            drive["path_on_host"] = name
+
+        with open(copied_path, 'w') as f:
+            json.dump(copied, f)
+
+        cfg["vsock"] = {"guest_cid": cid, "uds_path": "fc.vsock"}
+
+        with open(os.path.join(vm_dir, "config.json"), 'w') as f:
+            json.dump(cfg, f, indent=4)
+
+        return vm_dir
+
+    def _make_ctr(self, cid: int) -> Container:
+        vm_dir = self._make_dir(cid)
+        return Container(
+            cid=cid,
+            cfg=os.path.join(vm_dir, "config.json"),
+            vm_cfg=self._vm_cfg,
+            vsock=os.path.join(vm_dir, "fc.vsock"),
+            port=env.PORT_START,
+            workdir=vm_dir,
+            api_sock=os.path.join(vm_dir, "fc.api")
+        )
+
+    def _launch(self, ctr: Container, args: List[str]) -> subprocess.Popen:
+        """Start a firecracker process in the guest dir, logging to a file"""
+        for name in ("fc.vsock", "fc.api"):
+            try:
+                os.unlink(os.path.join(ctr.workdir, name))
+            except FileNotFoundError:
+                pass
+
+        # log to the guest dir so a chatty guest console can't fill a pipe
+        # nobody reads
+        log = open(os.path.join(ctr.workdir, "firecracker.log"), 'wb')
+        proc = subprocess.Popen(
+            args,
+            cwd=ctr.workdir,
+            stdout=log,
+            stderr=subprocess.STDOUT
+        )
+        log.close()
+        ctr.proc = proc
+        return proc
+
+    def _connect(self, ctr: Container, timeout: float):  # throws
+        """Poll the vsock until the guest agent accepts the handshake"""
+        if DEBUG:
+            print(f"ctr vsock: {ctr.vsock}")
+            print(f"ctr cid: {ctr.cid}")
+            print(f"ctr port: {ctr.port}")
+
+        deadline = time.monotonic() + timeout
+        retry_delay = 0.01
+        last_err = None
+
+        while time.monotonic() < deadline:
+            # Check if process is still running
+            if ctr.proc and ctr.proc.poll() is not None:
+                raise RuntimeError(f"Firecracker exited: {self._log_tail(ctr)}")
+
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(max(0.1, deadline - time.monotonic()))
+                sock.connect(ctr.vsock)
+
+                # Send handshake; firecracker closes the connection if nothing
+                # listens on the port yet (agent still booting)
+                sock.sendall(f"CONNECT {ctr.port}\n".encode('ascii'))
+
+                # Wait for acknowledgement
+                ack = sock.recv(64).decode('ascii').strip()
+                if ack.startswith("OK"):
+                    ser, version = JsonSerializer(), 1
+                    if self._serializers:
+                        ser, version = negotiate(sock, self._serializers, PROTOCOLS)
+                    sock.settimeout(None)
+                    ctr.sock = sock
+                    ctr.ser, ctr.protocol = ser, version
+                    ctr.chan = open_channel(sock, ser, version, self._max_frame)
+                    ctr.ready = True
+                    return
+                last_err = f"got '{ack}'"
+            except (OSError, RuntimeError) as e:
+                last_err = e
+            sock.close()
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 0.25)
+
+        raise RuntimeError(f"Socket connection failed on vsock after {timeout}s: {last_err}")
+
+    def _boot_cold(self, ctr: Container):  # throws
+        cmd = [
+            os.path.abspath(self._fc.bin),
+            "config.json",
+            "fc.vsock",
+            "fc.api"
+        ]
+        self._launch(ctr, cmd)
+        self._connect(ctr, self._boot_timeout)
+
+    def _persistent_files(self) -> set:
+        """File names of the drives in PERSISTENT_DRIVES"""
+        with open(self._cfg, 'r') as f:
+            cfg = json.load(f)
+        return {os.path.basename(d["path_on_host"]) for d in cfg.get("drives", [])
+                if d["drive_id"] in self.PERSISTENT_DRIVES}
+
+    def _boot_restore(self, ctr: Container):  # throws
+        # the restored guest expects its drives exactly as they were when the
+        # snapshot was taken; persistent drives are not mounted at that point,
+        # so the guest's own copy is kept
+        keep = self._persistent_files()
+        for name in os.listdir(self._snapdir):
+            if name.endswith(".ext4") and name not in keep:
+                subprocess.run(
+                    ["cp", "--reflink=auto", "--sparse=always",
+                     os.path.join(self._snapdir, name),
+                     os.path.join(ctr.workdir, name)],
+                    check=True
+                )
+
+        self._launch(ctr, [os.path.abspath(self._fc.firecracker), "--api-sock", "fc.api"])
+
+        deadline = time.monotonic() + 5
+        while not os.path.exists(ctr.api_sock):
+            if ctr.proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"Firecracker API socket not up: {self._log_tail(ctr)}")
+            time.sleep(0.001)
+
+        snap = os.path.abspath(os.path.join(self._snapdir, "vm.snap"))
+        mem = os.path.abspath(os.path.join(self._snapdir, "vm.mem"))
+        FcApi(ctr.api_sock).load_snapshot(snap, mem, resume=True)
+        self._connect(ctr, 5)
+
+    def start_ctr(self, ctr: Container):  # throws
+        """Start Firecracker VM and establish vsock connection"""
+        t0 = time.perf_counter()
+        mode = 'cold'
+        if self.snapshot_ready():
+            try:
+                self._boot_restore(ctr)
+                mode = 'restore'
+            except Exception as e:
+                print(f"[VmPool] Restore failed for container {ctr.cid}, cold booting: {e}")
+                self.stop_ctr(ctr)
+                t0 = time.perf_counter()
+        if mode == 'cold':
+            self._boot_cold(ctr)
+
+        ctr.boot_mode = mode
+        ctr.boot_ms = (time.perf_counter() - t0) * 1000
+        self._boots[mode].append(ctr.boot_ms)
+        print(f"Container {ctr.cid} started and ready ({mode} boot, {ctr.boot_ms:.1f} ms)")
+
+    def _snapshot_inputs(self) -> dict:
+        """Files a snapshot depends on, with size and mtime"""
+        with open(self._cfg, 'r') as f:
+            cfg = json.load(f)
+        base = os.path.dirname(os.path.abspath(self._cfg))
+        paths = [self._cfg, os.path.join(base, cfg["boot-source"]["kernel_image_path"])]
+        paths += [os.path.join(base, d["path_on_host"]) for d in cfg.get("drives", [])]
+
+        inputs = {}
+        for p in paths:
+            st = os.stat(p)
+            inputs[os.path.abspath(p)] = [st.st_size, st.st_mtime]
+        return inputs
+
+    def snapshot_ready(self) -> bool:
+        """True if a snapshot exists and matches the current kernel/drives/config"""
+        if not self._snapshot:
+            return False
+        try:
+            with open(os.path.join(self._snapdir, "manifest.json"), 'r') as f:
+                manifest = json.load(f)
+            return manifest == self._snapshot_inputs()
+        except (OSError, ValueError):
+            return False
+
+    def make_snapshot(self):  # throws
+        """Cold boot a template guest until its agent listens, then snapshot it"""
+        print("[VmPool] Creating snapshot...")
+        try:
+            os.unlink(os.path.join(self._snapdir, "manifest.json"))
+        except FileNotFoundError:
+            pass
+
+        vm_dir = self._make_dir(self._cid_start, self._snapdir)
+        ctr = Container(
+            cid=self._cid_start,
+            cfg=os.path.join(vm_dir, "config.json"),
+            vm_cfg=self._vm_cfg,
+            vsock=os.path.join(vm_dir, "fc.vsock"),
+            port=env.PORT_START,
+            workdir=vm_dir,
+            api_sock=os.path.join(vm_dir, "fc.api")
+        )
+
+        try:
+            t0 = time.perf_counter()
+            self._boot_cold(ctr)
+            cold_ms = (time.perf_counter() - t0) * 1000
+            self._boots['cold'].append(cold_ms)
+
+            # hand the agent back to accept() before freezing it
+            self._disconnect(ctr)
+            time.sleep(0.2)
+
+            api = FcApi(ctr.api_sock)
+            api.pause()
+            api.create_snapshot(
+                os.path.abspath(os.path.join(vm_dir, "vm.snap")),
+                os.path.abspath(os.path.join(vm_dir, "vm.mem"))
+            )
+        finally:
+            self.stop_ctr(ctr)
+
+        with open(os.path.join(vm_dir, "manifest.json"), 'w') as f:
+            json.dump(self._snapshot_inputs(), f)
+        print(f"[VmPool] Snapshot ready in {vm_dir} (template cold boot {cold_ms:.1f} ms)")
+
+    def boot_stats(self) -> dict:
+        """Mean boot latency per mode over the recent boots"""
+        stats = {}
+        for mode, samples in self._boots.items():
+            stats[mode] = {
+                'count': len(samples),
+                'mean_ms': sum(samples) / len(samples) if samples else None
+            }
+        return stats
+
+    def _disconnect(self, ctr: Container):
+        """Fail the jobs in flight and close the agent connection"""
+        if ctr.chan:
+            ctr.chan.close()
+            ctr.chan = None
+        if ctr.sock:
+            try:
+                # wakes the channel's reader thread
+                ctr.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                ctr.sock.close()
+            except OSError:
+                pass
+            ctr.sock = None
+
+    def stop_ctr(self, ctr: Container):
+        """Close the agent connection and kill the guest"""
+        ctr.ready = False
+        self._disconnect(ctr)
+        if ctr.proc and ctr.proc.poll() is None:
+            ctr.proc.kill()
+            ctr.proc.wait()
+        ctr.proc = None
+
+    def restart(self, ctr: Container):  # throws
+        """
+        Replace a broken guest with a fresh one under the same CID, retrying
+        with backoff until it is up; raises only if the pool is stopped first
+        """
+        with self._lock:
+            guard = self._restarting.setdefault(ctr.cid, threading.Lock())
+        with guard:
+            if ctr.ready:
+                # restarted by whoever held the guard
+                return
+            self._restart(ctr)
+
+    def _restart(self, ctr: Container):  # throws
+        print(f"[VmPool] Restarting container {ctr.cid}")
+        delay = RESTART_BACKOFF_SEC
+        while True:
+            if self._stopping.is_set():
+                raise RuntimeError(f"pool stopped, container {ctr.cid} left down")
+            self.stop_ctr(ctr)
+            try:
+                self.start_ctr(ctr)
+                break
+            except Exception as e:
+                self.stop_ctr(ctr)
+                self._mark_down(ctr, e)
+            if self._stopping.wait(delay):
+                raise RuntimeError(f"pool stopped, container {ctr.cid} left down")
+            delay = min(delay * 2, RESTART_BACKOFF_MAX_SEC)
+        with self._lock:
+            attempts = self._down.pop(ctr.cid, 0)
+        self._fill(ctr)
+        if attempts:
+            print(f"[VmPool] Container {ctr.cid} back after {attempts} failed attempts, {self._capacity()}")
+
+    def _mark_down(self, ctr: Container, error: Exception):
+        with self._lock:
+            self._down[ctr.cid] = self._down.get(ctr.cid, 0) + 1
+            attempts = self._down[ctr.cid]
+        print(f"[VmPool] Container {ctr.cid} failed to start (attempt {attempts}): {error}; "
+              f"{self._capacity()}")
+        if not self.containers(ctr.lane):
+            print(f"[VmPool] No ready containers left in lane {ctr.lane}")
+
+    def _capacity(self) -> str:
+        lanes = ", ".join(f"{lane}: {len(self.containers(lane))}" for lane in self._idle)
+        return f"{len(self.containers())}/{self.size} ready ({lanes})"
+
+    def recover(self, ctr: Container):
+        """restart() the guest on a thread of its own and return at once"""
+        with self._lock:
+            if ctr.cid in self._recovering:
+                return
+            self._recovering.add(ctr.cid)
+        threading.Thread(target=self._recover, args=(ctr,), name=f"recover-{ctr.cid}",
+                         daemon=True).start()
+
+    def _recover(self, ctr: Container):
+        """Background restart() of a guest that did not come up or broke"""
+        try:
+            self.restart(ctr)
+        except Exception as e:
+            print(f"[VmPool] Gave up on container {ctr.cid}: {e}")
+        finally:
+            with self._lock:
+                self._recovering.discard(ctr.cid)
+
+    def _fill(self, ctr: Container):
+        """Top the guest's idle-queue entries up to its pipeline depth"""
+        depth = self.depth if ctr.protocol >= 2 else 1
+        with self._lock:
+            n = max(0, depth - ctr.slots)
+            ctr.slots += n
+        for _ in range(n):
+            self._idle[ctr.lane].put(ctr)
+
+    def _log_tail(self, ctr: Container, n: int = 2048) -> str:
+        try:
+            with open(os.path.join(ctr.workdir, "firecracker.log"), 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - n))
+                return f.read().decode('utf-8', errors='replace')
+        except OSError:
+            return ""
+
+    def start(self):
+        """Boot every guest in parallel, raise if none come up"""
+        if self._snapshot and not self.snapshot_ready():
+            try:
+                self.make_snapshot()
+            except Exception as e:
+                print(f"[VmPool] Snapshot failed, falling back to cold boot: {e}")
+
+        self._ctrs = [self._make_ctr(self._cid_start + i) for i in range(self.size)]
+        i = self.size
+        for lane, n in self.lanes.items():
+            for ctr in self._ctrs[max(0, i - n):i]:
+                ctr.lane = lane
+            i -= n
+
+        errors = {}
+        def boot(ctr):
+            try:
+                self.start_ctr(ctr)
+            except Exception as e:
+                errors[ctr.cid] = e
+
+        threads = [threading.Thread(target=boot, args=(c,)) for c in self._ctrs]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for ctr in self._ctrs:
+            if ctr.ready:
+                self._fill(ctr)
+            else:
+                self.stop_ctr(ctr)
+                self._mark_down(ctr, errors.get(ctr.cid))
+
+        ready = len(self.containers())
+        if ready == 0:
+            self._stopping.set()
+            raise RuntimeError("No containers started")
+        for ctr in self._ctrs:
+            if not ctr.ready:
+                self.recover(ctr)
+        lanes = ", ".join(f"{lane}: {q.qsize()}" for lane, q in self._idle.items())
+        print(f"[VmPool] {ready}/{self.size} containers ready (slots {lanes}), "
+              f"boot: {self.boot_stats()}")
+
+    def acquire(self, timeout: Optional[float] = None, lane: str = BENCH) -> Optional[Container]:
+        """
+        Take a free slot on a container of the lane; it may already be running a job
+
+        Returns:
+            Container or None if none became idle within timeout
+        """
+        try:
+            ctr = self._idle[lane].get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            ctr.busy = True
+        return ctr
+
+    def assign(self, ctr: Container, job_id: int):
+        """Record a job sent to the container on an acquired slot"""
+        with self._lock:
+            ctr.jobs.append(job_id)
+
+    def release(self, ctr: Container, job_id: Optional[int] = None) -> bool:
+        """
+        Give a slot back, with the job it ran; dropped if the container is not ready
+
+        Returns:
+            True if the container is broken and that was its last slot, the
+            caller should restart() it
+        """
+        with self._lock:
+            n = 1
+            if job_id in ctr.jobs:
+                ctr.jobs.remove(job_id)
+                n, ctr.held = n + ctr.held, 0
+            ctr.busy = bool(ctr.jobs)
+            if not ctr.ready:
+                ctr.slots -= n
+                return ctr.slots == 0
+        for _ in range(n):
+            self._idle[ctr.lane].put(ctr)
+        return False
+
+    def hold(self, ctr: Container) -> bool:
+        """
+        Park an acquired slot until a job running on the container is released
+
+        Returns:
+            False if none is running any more, the slot is released instead
+        """
+        with self._lock:
+            if ctr.jobs:
+                ctr.held += 1
+                return True
+        self.release(ctr)
+        return False
+
+    def containers(self, lane: Optional[str] = None, ready_only: bool = True) -> List[Container]:
+        """Ready containers (of one lane), for callers that schedule them themselves"""
+        return [c for c in self._ctrs if (c.ready or not ready_only) and lane in (None, c.lane)]
+
+    def inflight(self, lane: Optional[str] = None) -> List[int]:
+        """Jobs sent to the containers (of one lane) and not released yet"""
+        with self._lock:
+            return [j for c in self._ctrs if lane in (None, c.lane) for j in c.jobs]
+
+    def occupancy(self) -> dict:
+        """Snapshot of pool usage"""
+        with self._lock:
+            return {
+                'size': self.size,
+                'ready': sum(1 for c in self._ctrs if c.ready),
+                'busy': sum(1 for c in self._ctrs if c.busy),
+                'idle': sum(1 for c in self._ctrs if c.ready and not c.busy),
+                'jobs': {c.cid: list(c.jobs) for c in self._ctrs if c.jobs},
+                'lanes': {lane: sum(1 for c in self._ctrs if c.ready and c.lane == lane)
+                          for lane in self._idle},
+                'down': dict(self._down),
+                'boot': self.boot_stats()
+            }
+
+    def stop(self):
+        self._stopping.set()
+        for ctr in self._ctrs:
+            self.stop_ctr(ctr)
+        print("[VmPool] stopped")
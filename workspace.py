@@ -0,0 +1,131 @@
+import os
+import queue
+import threading
+import shutil
+import tempfile
+import subprocess
+from typing import List, Optional
+
+# workspace.py
+
+# Job working directories for the agent. Instead of mkdtemp()/rmtree() on
+# the ext4 root filesystem per job (journal writes, page cache and disk I/O
+# that bleed into the next measurement), WorkspacePool keeps a few
+# directories under ROOT, each its own tmpfs of WORKSPACE_SIZE_MB: a job
+# cannot fill the guest's disk or memory past that, and nothing it writes
+# ever reaches the block device. A released workspace is emptied right away
+# so the next acquire() hands it out as is; when emptying fails (files the
+# program made unremovable) the tmpfs is simply mounted afresh.
+#
+# Where tmpfs cannot be mounted (not root, outside the guest) the
+# workspaces are plain directories below the system temp dir, still reused,
+# without the size limit.
+
+ROOT = "/mnt/work"
+WORKSPACES = 2
+WORKSPACE_SIZE_MB = 256
+WORKSPACE_INODES = 16384
+
+
+class Workspace:
+    def __init__(self, path: str, mounted: bool):
+        self.path = path
+        self.mounted = mounted
+
+
+class WorkspacePool:
+    """Recycled job directories on tmpfs"""
+
+    def __init__(self, root: str = ROOT, count: int = WORKSPACES,
+                 size_mb: int = WORKSPACE_SIZE_MB, tmpfs: bool = True):
+        self.root = root
+        self.count = count
+        self.size_mb = size_mb
+        self.tmpfs = tmpfs
+        self._free = queue.Queue()
+        self._all: List[Workspace] = []
+        self._lock = threading.Lock()
+
+    def _mount(self, path: str) -> bool:
+        opts = f"size={self.size_mb}m,nr_inodes={WORKSPACE_INODES},mode=0700,nosuid,nodev"
+        res = subprocess.run(["mount", "-t", "tmpfs", "-o", opts, "tmpfs", path],
+                             capture_output=True, text=True)
+        if res.returncode != 0:
+            print(f"[Workspace] tmpfs mount failed on {path}: {res.stderr.strip()}")
+            return False
+        return True
+
+    def start(self):
+        """Create (and mount) the workspaces"""
+        with self._lock:
+            if not self._all:
+                self._start()
+
+    def _start(self):
+        if self.tmpfs:
+            try:
+                os.makedirs(self.root, exist_ok=True)
+            except OSError as e:
+                print(f"[Workspace] Cannot create {self.root}: {e}")
+                self.tmpfs = False
+        if not self.tmpfs:
+            self.root = os.path.join(tempfile.gettempdir(), "benchr-ws")
+        for i in range(self.count):
+            path = os.path.join(self.root, f"ws{i}")
+            os.makedirs(path, exist_ok=True)
+            mounted = False
+            if self.tmpfs:
+                if os.path.ismount(path):
+                    subprocess.run(["umount", "-l", path], capture_output=True)
+                mounted = self._mount(path)
+                # one failure says the rest would fail too
+                self.tmpfs = mounted
+            ws = Workspace(path, mounted)
+            self._clear(ws)
+            self._all.append(ws)
+            self._free.put(ws)
+        kind = f"tmpfs of {self.size_mb} MiB" if self.tmpfs else "plain directories"
+        print(f"[Workspace] {self.count} workspaces under {self.root} ({kind})")
+
+    def acquire(self, timeout: Optional[float] = None) -> Workspace:  # throws
+        """An empty workspace; blocks while all are in use"""
+        if not self._all:
+            self.start()
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise RuntimeError("no free workspace")
+
+    def release(self, ws: Workspace):
+        """Empty the workspace and return it to the pool"""
+        try:
+            self._clear(ws)
+        finally:
+            self._free.put(ws)
+
+    def _clear(self, ws: Workspace):
+        try:
+            with os.scandir(ws.path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.unlink(entry.path)
+            return
+        except OSError as e:
+            print(f"[Workspace] Could not empty {ws.path}: {e}")
+        if ws.mounted:
+            subprocess.run(["umount", "-l", ws.path], capture_output=True)
+            ws.mounted = self._mount(ws.path)
+            if ws.mounted:
+                return
+        # last resort: a new directory
+        shutil.rmtree(ws.path, ignore_errors=True)
+        os.makedirs(ws.path, exist_ok=True)
+
+    def close(self):
+        for ws in self._all:
+            if ws.mounted:
+                subprocess.run(["umount", "-l", ws.path], capture_output=True)
+                ws.mounted = False
+        self._all = []